@@ -0,0 +1,76 @@
+"""
+Atomic file replacement.
+
+atomic_open writes to a temporary file in the target's directory and moves
+it over the target with os.replace once the block finishes, so readers see
+either the old contents or the new ones, never a partial file. On error the
+temporary file is removed and the target is left alone.
+
+mkstemp creates files as 0600. The replacement instead gets the mode of the
+file it replaces, or 0644 less the umask for a new file. The umask is read
+once at import: os.umask can only be read by setting it, which would race
+with files being created by other threads.
+"""
+
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+DEFAULT_MODE = 0o644
+
+
+def _read_umask() -> int:
+    # Linux reports it without changing it
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+
+def file_mode(path: str) -> int:
+    """Permission bits for a file replacing path (path's own, if it exists)."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return DEFAULT_MODE & ~_UMASK
+
+
+@contextmanager
+def atomic_open(
+    path: str, mode: str = "w", prefix: str = ".tmp-", suffix: str = "", **kwargs
+) -> Iterator[IO]:
+    """
+    Opens a temporary file that replaces path when the block exits cleanly.
+
+    Args:
+        path: File to write
+        mode: "w" or "wb"
+        prefix: Temporary file name prefix
+        suffix: Temporary file name suffix
+        **kwargs: Passed to open() (encoding, newline, ...)
+
+    Yields:
+        The open temporary file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,228 @@
+"""
+Benchmark suite for the category-mapping and card-ranking hot paths.
+
+Runs fully offline against synthetic merchant streams and the rewards matrix
+scaled up to 1×, 10× and 100× the number of cards, and reports p50/p99
+latency and throughput per benchmark as JSON so runs can be diffed to catch
+regressions before deploy.
+
+Usage:
+    python bench_hotpaths.py [--scales 1,10,100] [--queries 2000] [--output bench.json]
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import ranking
+from map_to_category import (
+    BRAND_OVERRIDES,
+    TYPE_TO_CATEGORY,
+    build_search_terms,
+    get_fuzzy_matcher,
+    map_place_to_categories,
+)
+from rewards_matrix import RewardsMatrix
+from sparse_rates import SparseRates
+
+_SUFFIXES = ["", " Store", " Market", " #1042", " - Downtown", " Express", " & Co"]
+_GENERIC_WORDS = ["Corner", "Golden", "Blue", "Sunset", "Oak", "Main St", "Family", "Lucky"]
+_GENERIC_KINDS = ["Bistro", "Deli", "Pharmacy", "Hardware", "Books", "Cinema", "Fitness", "Motel"]
+_NOISE_TYPES = ["point_of_interest", "establishment"]
+
+
+def synthetic_merchants(n: int, seed: int = 0) -> List[Tuple[str, List[str]]]:
+    """
+    A reproducible stream of (place_name, google_types) pairs.
+
+    Roughly 40% known brands with decorations, 40% generic names with a
+    mappable type, and 20% unknown names with no useful type (the fuzzy
+    path). Names repeat the way real transaction histories do.
+    """
+    rnd = random.Random(seed)
+    brands = list(BRAND_OVERRIDES)
+    types = list(TYPE_TO_CATEGORY)
+    pool: List[Tuple[str, List[str]]] = []
+    for _ in range(max(1, n // 4)):
+        roll = rnd.random()
+        if roll < 0.4:
+            name = rnd.choice(brands).title() + rnd.choice(_SUFFIXES)
+            place_types = [rnd.choice(types)] + _NOISE_TYPES
+        elif roll < 0.8:
+            name = f"{rnd.choice(_GENERIC_WORDS)} {rnd.choice(_GENERIC_KINDS)}"
+            place_types = [rnd.choice(types)] + _NOISE_TYPES
+        else:
+            name = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(rnd.randint(4, 18)))
+            place_types = list(_NOISE_TYPES)
+        pool.append((name.strip() or "x", place_types))
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def scaled_matrix(base: RewardsMatrix, factor: int) -> RewardsMatrix:
+    """The base matrix with every card repeated `factor` times under new names."""
+    if factor == 1:
+        return base
+    sparse = base.sparse
+    counts = np.diff(sparse.indptr)
+    indptr = np.zeros(sparse.shape[0] * factor + 1, dtype=np.int64)
+    np.cumsum(np.tile(counts, factor), out=indptr[1:])
+    tiled = SparseRates(
+        (sparse.shape[0] * factor, sparse.shape[1]),
+        indptr,
+        np.tile(np.asarray(sparse.indices), factor),
+        np.tile(np.asarray(sparse.data), factor),
+    )
+    names = [
+        name if k == 0 else f"{name} #{k}"
+        for k in range(factor)
+        for name in base.card_names
+    ]
+    return RewardsMatrix(names, base.columns, tiled)
+
+
+def measure(fn: Callable[[Any], Any], inputs: Sequence[Any], warmup: int = 10) -> Dict[str, float]:
+    """
+    Calls fn once per input and summarizes per-call latency.
+
+    Returns:
+        Dict with calls, p50_us, p99_us, mean_us and ops_per_sec
+    """
+    for item in inputs[:warmup]:
+        fn(item)
+    timings = np.empty(len(inputs), dtype=np.float64)
+    clock = time.perf_counter_ns
+    start_all = clock()
+    for k, item in enumerate(inputs):
+        start = clock()
+        fn(item)
+        timings[k] = clock() - start
+    total_s = (clock() - start_all) / 1e9
+    timings /= 1e3
+    return {
+        "calls": len(inputs),
+        "p50_us": round(float(np.percentile(timings, 50)), 2),
+        "p99_us": round(float(np.percentile(timings, 99)), 2),
+        "mean_us": round(float(timings.mean()), 2),
+        "ops_per_sec": round(len(inputs) / total_s, 1) if total_s else float("inf"),
+    }
+
+
+def run(
+    matrix_path: str = "card_rewards_matrix.csv",
+    scales: Sequence[int] = (1, 10, 100),
+    queries: int = 2000,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Runs every benchmark and returns the report.
+
+    Args:
+        matrix_path: Rewards matrix CSV or snapshot to scale from
+        scales: Card-count multipliers for the ranking benchmarks
+        queries: Calls per benchmark
+        seed: Seed for the synthetic merchant stream
+    """
+    merchants = synthetic_merchants(queries, seed)
+    mapped = [map_place_to_categories(name, types) for name, types in merchants]
+    category_queries = [
+        (brand or default or "Other purchases", [c for c in (brand, default) if c])
+        for brand, default in mapped
+    ]
+
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "queries": queries,
+        "seed": seed,
+        "benchmarks": {},
+    }
+    results = report["benchmarks"]
+
+    get_fuzzy_matcher().cache_clear()
+    results["map_place_to_categories"] = measure(
+        lambda m: map_place_to_categories(*m), merchants
+    )
+
+    base = RewardsMatrix.from_file(matrix_path)
+    for factor in scales:
+        matrix = scaled_matrix(base, factor)
+        label = f"{factor}x"
+        report.setdefault("matrices", {})[label] = {
+            "cards": matrix.shape[0],
+            "columns": matrix.shape[1],
+            "nonzero": matrix.sparse.nnz,
+        }
+        whitelist = list(ranking.USER_CARDS)
+
+        results[f"build_search_terms[{label}]"] = measure(
+            lambda q: build_search_terms(q[0], matrix.columns), category_queries
+        )
+        results[f"get_best_cards_for_category.whitelist[{label}]"] = measure(
+            lambda q: ranking.get_best_cards_for_category(
+                q[0], categories=q[1] or None, card_whitelist=whitelist, matrix=matrix
+            ),
+            category_queries,
+        )
+        results[f"get_best_cards_for_category.catalog[{label}]"] = measure(
+            lambda q: ranking.get_best_cards_for_category(
+                q[0], top_n=20, categories=q[1] or None, card_whitelist=[], matrix=matrix
+            ),
+            category_queries[: max(50, queries // max(1, factor))],
+        )
+
+        batch = [(brand, default) for brand, default in mapped]
+        start = time.perf_counter()
+        ranking.get_best_cards_batch(batch, card_whitelist=whitelist, matrix=matrix)
+        elapsed = time.perf_counter() - start
+        results[f"get_best_cards_batch.whitelist[{label}]"] = {
+            "calls": 1,
+            "queries": len(batch),
+            "seconds": round(elapsed, 4),
+            "queries_per_sec": round(len(batch) / elapsed, 1) if elapsed else float("inf"),
+        }
+
+    # Offer text on the base matrix: one (card row, search terms) pair per query
+    rnd = random.Random(seed)
+    dense = base.rates
+    offer_inputs = []
+    for category, used in category_queries:
+        row = rnd.randrange(base.shape[0])
+        terms: List[str] = []
+        for cat in used or [category]:
+            terms.extend(build_search_terms(cat, base.columns))
+        card_row = {col: dense[row, j] for j, col in enumerate(base.columns)}
+        offer_inputs.append((card_row, terms))
+    results["_generate_offer_text"] = measure(
+        lambda q: ranking._generate_offer_text(q[0], q[1], base.columns), offer_inputs
+    )
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark mapping and ranking hot paths.")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated card multipliers")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    report = run(args.matrix, scales, args.queries, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark Places lookups against a local fake endpoint.
+
+Compares the original one-off requests.get per address (serial, fresh
+connection each time) with PlacesClient on a pooled session, serially and
+with concurrent bulk lookups. Runs fully offline and prints JSON.
+
+Usage:
+    python bench_places.py --queries 200 --latency 0.02 --concurrency 16
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from fake_places import FakePlacesServer
+from places_client import PlacesClient
+
+
+def _timed(fn: Callable[[], Any], n: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 4),
+        "lookups_per_sec": round(n / elapsed, 1) if elapsed else float("inf"),
+    }
+
+
+def run(
+    queries: int = 200,
+    latency: float = 0.02,
+    concurrency: int = 16,
+    error_rate: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Runs the benchmark and returns the results as a dict.
+
+    Args:
+        queries: Number of distinct addresses to resolve per strategy
+        latency: Simulated server latency in seconds
+        concurrency: Max in-flight requests for the concurrent strategy
+        error_rate: Fraction of fake responses that are OVER_QUERY_LIMIT
+    """
+    texts = [f"{i} Market St, San Francisco, CA" for i in range(queries)]
+    results: Dict[str, Any] = {
+        "queries": queries,
+        "latency": latency,
+        "concurrency": concurrency,
+        "error_rate": error_rate,
+    }
+
+    with FakePlacesServer(latency=latency, error_rate=error_rate, seed=0) as server:
+
+        def oneoff_serial():
+            for text in texts:
+                resp = requests.get(
+                    server.url,
+                    params={"input": text, "inputtype": "textquery", "key": "bench"},
+                    timeout=10,
+                )
+                resp.raise_for_status()
+
+        if error_rate == 0:
+            results["oneoff_serial"] = _timed(oneoff_serial, queries)
+
+        serial = PlacesClient("bench", base_url=server.url, max_concurrency=1, backoff=0.01)
+        results["session_serial"] = _timed(lambda: serial.find_places(texts), queries)
+        results["session_serial"]["retries"] = serial.retries
+        serial.close()
+
+        pooled = PlacesClient(
+            "bench", base_url=server.url, max_concurrency=concurrency, backoff=0.01
+        )
+        results["pooled_concurrent"] = _timed(lambda: pooled.find_places(texts), queries)
+        results["pooled_concurrent"]["retries"] = pooled.retries
+        pooled.close()
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Places lookups offline.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.queries, args.latency, args.concurrency, args.error_rate), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+"""
+Compiled multi-pattern substring matcher for brand overrides.
+
+Builds an Aho-Corasick automaton over all brand keys so that a merchant name
+is scanned once, in time proportional to the name's length plus the number of
+brands it actually contains, no matter how many brands are registered.
+
+Priority: when several brands occur in the same name, the one registered
+first wins. This matches the historical behaviour of walking the override
+dict in insertion order and returning the first brand contained in the name.
+"""
+
+from collections import deque
+from typing import Generic, Iterable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class BrandMatcher(Generic[V]):
+    """
+    Finds the highest-priority pattern contained in a text.
+
+    Args:
+        patterns: (pattern, value) pairs in priority order (first wins).
+            Empty patterns are ignored; for repeated patterns the first
+            occurrence's priority and value are kept.
+    """
+
+    def __init__(self, patterns: Iterable[tuple[str, V]]):
+        # Trie nodes: goto transitions, failure link, best (priority) output
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._best: list[int] = [-1]
+        self._values: list[V] = []
+        self._patterns: list[str] = []
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(-1)
+                node = nxt
+            if self._best[node] == -1:
+                self._best[node] = len(self._values)
+                self._values.append(value)
+                self._patterns.append(pattern)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self) -> None:
+        queue: deque[int] = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # Fold the best output of the suffix chain into this node
+                inherited = self._best[self._fail[child]]
+                own = self._best[child]
+                if inherited != -1 and (own == -1 or inherited < own):
+                    self._best[child] = inherited
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def match(self, text: str) -> Optional[V]:
+        """Value of the highest-priority pattern contained in text, or None."""
+        best = self.match_index(text)
+        return None if best == -1 else self._values[best]
+
+    def match_pattern(self, text: str) -> Optional[str]:
+        """The highest-priority pattern contained in text, or None."""
+        best = self.match_index(text)
+        return None if best == -1 else self._patterns[best]
+
+    def match_index(self, text: str) -> int:
+        """Priority index of the best pattern contained in text, or -1."""
+        goto = self._goto
+        fail = self._fail
+        best_out = self._best
+        node = 0
+        best = -1
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            found = best_out[node]
+            if found != -1 and (best == -1 or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
@@ -0,0 +1,513 @@
+"""
+Bulk re-scoring of historical transactions.
+
+Reads a transactions CSV (merchant name, Google types, amount and optionally
+the card that was actually used), maps each merchant to reward categories,
+finds the best card from the wallet for it, and writes one scored row per
+transaction plus aggregate "rewards left on the table" totals.
+
+The input is streamed in chunks and fanned out over a process pool. Workers
+memory-map one binary snapshot of the rewards matrix (see matrix_snapshot.py;
+a temporary one is compiled when a CSV matrix is given), so the matrix is
+shared through the page cache instead of being parsed per worker. Results are
+written incrementally in input order with a bounded number of chunks in
+flight, so memory stays flat however long the input is.
+
+Usage:
+    python bulk_score.py transactions.csv -o scored.csv [--workers 4] [--summary totals.json]
+    python bulk_score.py transactions.csv -o scored.parquet --format parquet
+
+Types may be given as "a;b", "a|b" or a JSON list. Amounts are in dollars
+and rewards are amount × rate / 100.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+OUTPUT_FIELDS = [
+    "merchant",
+    "types",
+    "amount",
+    "card_used",
+    "brand_category",
+    "default_category",
+    "best_card",
+    "best_rate",
+    "best_rewards",
+    "used_rate",
+    "used_rewards",
+    "left_on_table",
+]
+
+# One input transaction: (merchant, types, amount, card_used)
+Transaction = Tuple[str, List[str], float, Optional[str]]
+
+# Unparsed input cells: (merchant, types, amount, card_used)
+RawRow = Tuple[str, str, str, str]
+
+
+def parse_types(value: str) -> List[str]:
+    """Parses a Google types cell: "a;b", "a|b", "a,b" or a JSON list."""
+    return _parse_types(value)[0]
+
+
+def _parse_types(value: str) -> Tuple[List[str], bool]:
+    """parse_types plus whether the cell was well-formed."""
+    value = (value or "").strip()
+    if not value:
+        return [], True
+    if value.startswith("["):
+        try:
+            return [str(t) for t in json.loads(value)], True
+        except ValueError:
+            # Malformed JSON: salvage what the separator split gives
+            return _split_types(value.strip("[]"), strip="\"' "), False
+    return _split_types(value), True
+
+
+def _split_types(value: str, strip: Optional[str] = None) -> List[str]:
+    for sep in (";", "|", ","):
+        if sep in value:
+            return [t.strip().strip(strip) for t in value.split(sep) if t.strip().strip(strip)]
+    value = value.strip().strip(strip)
+    return [value] if value else []
+
+
+def parse_transaction(raw: RawRow) -> Transaction:
+    """Parses one row of input cells."""
+    return _parse_row(raw)[0]
+
+
+def _parse_row(raw: RawRow) -> Tuple[Transaction, bool]:
+    """parse_transaction plus whether every cell parsed cleanly."""
+    name, types, amount, card = raw
+    ok = True
+    try:
+        value = float((amount or "0").replace(",", "").replace("$", ""))
+    except ValueError:
+        value = 0.0
+        ok = False
+    parsed_types, types_ok = _parse_types(types)
+    return (name, parsed_types, value, card.strip() or None), ok and types_ok
+
+
+def read_raw_rows(
+    path: str,
+    name_column: str = "merchant",
+    types_column: str = "types",
+    amount_column: str = "amount",
+    card_column: Optional[str] = None,
+) -> Iterator[RawRow]:
+    """
+    Streams the relevant cells of a transactions CSV without parsing them,
+    so the reading process does as little per-row work as possible.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [c for c in (name_column, amount_column) if c not in header]
+        if missing:
+            raise ValueError(f"{path} is missing column(s): {', '.join(missing)}")
+        wanted = [
+            header.index(c) if c and c in header else None
+            for c in (name_column, types_column, amount_column, card_column)
+        ]
+        for row in reader:
+            yield tuple(
+                row[i] if i is not None and i < len(row) else "" for i in wanted
+            )
+
+
+def read_transactions(
+    path: str,
+    name_column: str = "merchant",
+    types_column: str = "types",
+    amount_column: str = "amount",
+    card_column: Optional[str] = None,
+) -> Iterator[Transaction]:
+    """Streams parsed transactions from a CSV file."""
+    for raw in read_raw_rows(path, name_column, types_column, amount_column, card_column):
+        yield parse_transaction(raw)
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# -----------------------------------------------------------------------------
+# Worker side
+# -----------------------------------------------------------------------------
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(
+    matrix_path: str,
+    wallet: List[str],
+    baseline_card: Optional[str],
+    resolution_db: Optional[str] = None,
+) -> None:
+    """Loads the (memory-mapped) matrix and resolution cache once per process."""
+    from resolution_cache import ResolutionCache
+    from rewards_matrix import load_matrix
+
+    _worker["matrix"] = load_matrix(matrix_path)
+    _worker["wallet"] = wallet
+    _worker["baseline_card"] = baseline_card
+    _worker["used_rates"] = {}
+    _worker["resolver"] = ResolutionCache(resolution_db)
+
+
+def _card_rate(matrix, card: str, brand: Optional[str], default: str) -> float:
+    """The rate get_best_cards_for_category would give one card for a query."""
+    cache = _worker["used_rates"]
+    index = matrix.category_index
+    used = [c for c in (brand, default) if c]
+    matched = index.columns_for_categories(used) if used else index.columns_for_category(
+        "Other purchases"
+    )
+    key = (card.lower(), matched)
+    rate = cache.get(key)
+    if rate is None:
+        row = matrix.row_for_lower(card.lower())
+        columns = sorted(matched) or list(index.fallback_columns)
+        if row is None or not columns:
+            rate = 0.0
+        else:
+            rate = float(matrix.sparse.max_over_columns([row], columns)[0])
+        if len(cache) < 100_000:
+            cache[key] = rate
+    return rate
+
+
+def score_chunk(raw_rows: Sequence[RawRow]) -> Tuple[List[list], Dict[str, Any]]:
+    """
+    Parses and scores one chunk of transactions.
+
+    Returns:
+        (output rows in OUTPUT_FIELDS order, partial totals)
+    """
+    from ranking import get_best_cards_batch
+
+    parsed = [_parse_row(raw) for raw in raw_rows]
+    chunk = [transaction for transaction, _ in parsed]
+    matrix = _worker["matrix"]
+    baseline_card = _worker["baseline_card"]
+    resolver = _worker["resolver"]
+    queries = [resolver.map_place_to_categories(name, types) for name, types, _, _ in chunk]
+    # Share new resolutions with other workers (and later runs) promptly
+    resolver.flush()
+    best = get_best_cards_batch(
+        queries, top_n=1, card_whitelist=_worker["wallet"], matrix=matrix
+    )
+
+    rows = []
+    totals = _empty_totals()
+    # Rows with an unparseable amount or types cell (scored as best we can)
+    totals["bad_rows"] = sum(1 for _, ok in parsed if not ok)
+    for (name, types, amount, card_used), (brand, default), ranked in zip(chunk, queries, best):
+        best_card, best_rate = (ranked[0][0], ranked[0][1]) if ranked else ("", 0.0)
+        best_rewards = amount * best_rate / 100
+        compare_card = card_used or baseline_card
+        if compare_card:
+            used_rate = _card_rate(matrix, compare_card, brand, default)
+            used_rewards = amount * used_rate / 100
+            left = max(0.0, best_rewards - used_rewards)
+        else:
+            used_rate = used_rewards = left = None
+        rows.append([
+            name, ";".join(types), amount, card_used or "", brand or "", default,
+            best_card, best_rate, round(best_rewards, 4),
+            "" if used_rate is None else used_rate,
+            "" if used_rewards is None else round(used_rewards, 4),
+            "" if left is None else round(left, 4),
+        ])
+
+        totals["transactions"] += 1
+        totals["amount"] += amount
+        totals["best_rewards"] += best_rewards
+        if used_rewards is not None:
+            totals["compared_transactions"] += 1
+            totals["actual_rewards"] += used_rewards
+            totals["left_on_table"] += left
+            category = brand or default
+            totals["left_by_category"][category] = totals["left_by_category"].get(category, 0.0) + left
+        if best_card:
+            totals["best_card_counts"][best_card] = totals["best_card_counts"].get(best_card, 0) + 1
+    return rows, totals
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {
+        "transactions": 0,
+        "bad_rows": 0,
+        "compared_transactions": 0,
+        "amount": 0.0,
+        "best_rewards": 0.0,
+        "actual_rewards": 0.0,
+        "left_on_table": 0.0,
+        "left_by_category": {},
+        "best_card_counts": {},
+    }
+
+
+def _merge_totals(into: Dict[str, Any], part: Dict[str, Any]) -> None:
+    for key, value in part.items():
+        if isinstance(value, dict):
+            target = into[key]
+            for k, v in value.items():
+                target[k] = target.get(k, 0) + v
+        else:
+            into[key] += value
+
+
+# -----------------------------------------------------------------------------
+# Output writers
+# -----------------------------------------------------------------------------
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, rows: List[list]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow).") from exc
+        self._pa = pa
+        self._schema = pa.schema([
+            ("merchant", pa.string()),
+            ("types", pa.string()),
+            ("amount", pa.float64()),
+            ("card_used", pa.string()),
+            ("brand_category", pa.string()),
+            ("default_category", pa.string()),
+            ("best_card", pa.string()),
+            ("best_rate", pa.float64()),
+            ("best_rewards", pa.float64()),
+            ("used_rate", pa.float64()),
+            ("used_rewards", pa.float64()),
+            ("left_on_table", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: List[list]) -> None:
+        columns = list(zip(*rows)) if rows else [[] for _ in OUTPUT_FIELDS]
+        arrays = []
+        for field, values in zip(self._schema, columns):
+            if self._pa.types.is_floating(field.type):
+                values = [None if v == "" else v for v in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        # One row group per chunk keeps the writer's memory bounded
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _open_writer(path: str, fmt: str):
+    return _ParquetWriter(path) if fmt == "parquet" else _CsvWriter(path)
+
+
+# -----------------------------------------------------------------------------
+# Driver
+# -----------------------------------------------------------------------------
+
+def _shared_matrix_path(matrix_path: str, tmp_dir: str) -> str:
+    """A snapshot path for workers to mmap, compiling one from a CSV if needed."""
+    from matrix_snapshot import build_snapshot, is_snapshot
+
+    if is_snapshot(matrix_path):
+        return matrix_path
+    # Workers score with get_best_cards_batch, which doesn't use ranking tables
+    return build_snapshot(
+        matrix_path, os.path.join(tmp_dir, "matrix.cgrm"), ranking_tables=False
+    )
+
+
+def score_file(
+    input_path: str,
+    output_path: str,
+    matrix_path: str = "card_rewards_matrix.csv",
+    wallet: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 20000,
+    fmt: str = "csv",
+    baseline_card: Optional[str] = None,
+    name_column: str = "merchant",
+    types_column: str = "types",
+    amount_column: str = "amount",
+    card_column: Optional[str] = None,
+    resolution_db: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Scores a transactions CSV and writes the results.
+
+    Args:
+        input_path: Transactions CSV
+        output_path: Scored CSV or Parquet file
+        matrix_path: Rewards matrix CSV or snapshot
+        wallet: Cards to choose from (uses USER_CARDS if None)
+        workers: Worker processes (defaults to the CPU count; 0 or 1 scores in-process)
+        chunk_size: Transactions per work unit
+        fmt: "csv" or "parquet"
+        baseline_card: Card assumed to have been used when the input has no card column
+        name_column, types_column, amount_column, card_column: Input column names
+        resolution_db: Optional SQLite merchant resolution cache (see resolution_cache.py)
+
+    Returns:
+        Aggregate totals, including left_on_table
+    """
+    if wallet is None:
+        from ranking import USER_CARDS
+
+        wallet = list(USER_CARDS)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    transactions = read_raw_rows(
+        input_path, name_column, types_column, amount_column, card_column
+    )
+    totals = _empty_totals()
+    writer = _open_writer(output_path, fmt)
+    try:
+        with tempfile.TemporaryDirectory(prefix="bulk-score-") as tmp_dir:
+            shared_path = _shared_matrix_path(matrix_path, tmp_dir)
+            init_args = (shared_path, wallet, baseline_card, resolution_db)
+            if workers <= 1:
+                _init_worker(*init_args)
+                for chunk in chunked(transactions, chunk_size):
+                    rows, part = score_chunk(chunk)
+                    writer.write(rows)
+                    _merge_totals(totals, part)
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=workers, initializer=_init_worker, initargs=init_args
+                ) as pool:
+                    for rows, part in _ordered_results(
+                        pool, chunked(transactions, chunk_size), max_in_flight=2 * workers
+                    ):
+                        writer.write(rows)
+                        _merge_totals(totals, part)
+    finally:
+        writer.close()
+
+    return _finish_totals(totals)
+
+
+def _ordered_results(pool, chunks: Iterator[List[RawRow]], max_in_flight: int):
+    """Yields score_chunk results in input order with bounded chunks in flight."""
+    pending: Dict[Future, int] = {}
+    done_results: Dict[int, Any] = {}
+    next_index = 0
+    submitted = 0
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) + len(done_results) < max_in_flight:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[pool.submit(score_chunk, chunk)] = submitted
+            submitted += 1
+        if not pending and not done_results:
+            return
+        if next_index not in done_results:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done_results[pending.pop(future)] = future.result()
+        while next_index in done_results:
+            yield done_results.pop(next_index)
+            next_index += 1
+
+
+def _finish_totals(totals: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ("amount", "best_rewards", "actual_rewards", "left_on_table"):
+        totals[key] = round(totals[key], 2)
+    totals["left_by_category"] = dict(
+        sorted(
+            ((k, round(v, 2)) for k, v in totals["left_by_category"].items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+    )
+    totals["best_card_counts"] = dict(
+        sorted(totals["best_card_counts"].items(), key=lambda item: item[1], reverse=True)
+    )
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-score historical transactions.")
+    parser.add_argument("input", help="transactions CSV")
+    parser.add_argument("-o", "--output", required=True, help="scored CSV or Parquet file")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="defaults from the output suffix")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv")
+    parser.add_argument("--wallet", help="comma-separated card names (defaults to USER_CARDS)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--baseline-card", help="card assumed used when there is no card column")
+    parser.add_argument("--name-column", default="merchant")
+    parser.add_argument("--types-column", default="types")
+    parser.add_argument("--amount-column", default="amount")
+    parser.add_argument("--card-column", help="column naming the card actually used")
+    parser.add_argument("--summary", help="write totals JSON here as well as to stdout")
+    parser.add_argument(
+        "--resolution-cache",
+        default=os.environ.get("RESOLUTION_CACHE_DB"),
+        help="SQLite merchant resolution cache shared across runs (default: $RESOLUTION_CACHE_DB)",
+    )
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    wallet = [c.strip() for c in args.wallet.split(",")] if args.wallet else None
+    totals = score_file(
+        args.input,
+        args.output,
+        matrix_path=args.matrix,
+        wallet=wallet,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        fmt=fmt,
+        baseline_card=args.baseline_card,
+        name_column=args.name_column,
+        types_column=args.types_column,
+        amount_column=args.amount_column,
+        card_column=args.card_column,
+        resolution_db=args.resolution_cache,
+    )
+    text = json.dumps(totals, indent=2, ensure_ascii=False)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
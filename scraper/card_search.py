@@ -0,0 +1,267 @@
+"""
+"Best card to add" search over the whole catalog.
+
+For a wallet and an annual spend profile, scores every card in the rewards
+matrix by how much it would add on top of the wallet, using the same
+category → columns → max rate model as get_best_cards_for_category:
+
+    gain(card) = Σ_category spend × max(0, rate(card) - best wallet rate) / 100
+
+The per-category rates of all cards are computed once from the sparse
+matrix, so the whole catalog is one vectorized pass. Pairs are scored as
+Σ spend × max(improvement(a), improvement(b)), with branch-and-bound
+pruning: a pair can never gain more than gain(a) + gain(b), so candidates
+are visited in descending single gain and the search stops as soon as that
+bound can't beat the current top-K.
+
+Usage:
+    python card_search.py spend.json [--wallet "Card A,Card B"] [--top-k 5] [--pairs]
+
+where spend.json maps category names to annual dollars.
+"""
+
+import argparse
+import heapq
+import json
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rewards_matrix import RewardsMatrix, load_matrix
+
+
+class CategoryGain(NamedTuple):
+    """Why a suggestion helps in one category."""
+
+    category: str
+    spend: float
+    current_rate: float
+    new_rate: float
+    card: str
+    column: Optional[str]
+
+    @property
+    def gain(self) -> float:
+        return self.spend * (self.new_rate - self.current_rate) / 100
+
+
+class CardSuggestion(NamedTuple):
+    """A card (or pair) to add and the extra annual rewards it brings."""
+
+    cards: Tuple[str, ...]
+    gain: float
+    explanations: List[CategoryGain]
+
+    def to_dict(self) -> Dict:
+        return {
+            "cards": list(self.cards),
+            "gain": round(self.gain, 2),
+            "explanations": [
+                {
+                    "category": e.category,
+                    "spend": e.spend,
+                    "current_rate": e.current_rate,
+                    "new_rate": e.new_rate,
+                    "card": e.card,
+                    "column": e.column,
+                    "gain": round(e.gain, 2),
+                }
+                for e in self.explanations
+            ],
+        }
+
+
+class _Profile(NamedTuple):
+    categories: List[str]
+    spend: np.ndarray  # per category
+    columns: List[List[int]]  # candidate columns per category
+    rates: np.ndarray  # catalog cards × categories
+    wallet_rates: np.ndarray  # per category
+
+
+def _profile(
+    matrix: RewardsMatrix, spend: Dict[str, float], wallet_rows: Sequence[int]
+) -> _Profile:
+    """Per-category rates of every card and of the current wallet."""
+    index = matrix.category_index
+    categories = [c for c, amount in spend.items() if amount > 0]
+    n_cards = matrix.shape[0]
+    all_rows = np.arange(n_cards)
+    rates = np.zeros((n_cards, len(categories)))
+    columns: List[List[int]] = []
+    for c, category in enumerate(categories):
+        cols = sorted(index.columns_for_category(category)) or list(index.fallback_columns)
+        columns.append(cols)
+        if cols:
+            rates[:, c] = matrix.sparse.max_over_columns(all_rows, cols)
+    wallet_rates = (
+        rates[list(wallet_rows)].max(axis=0) if len(wallet_rows) else np.zeros(len(categories))
+    )
+    return _Profile(
+        categories,
+        np.array([float(spend[c]) for c in categories]),
+        columns,
+        rates,
+        wallet_rates,
+    )
+
+
+def _best_column(matrix: RewardsMatrix, row: int, columns: List[int]) -> Optional[str]:
+    """Name of the column giving a card its rate for a category."""
+    cols, vals = matrix.sparse.row(row)
+    allowed = set(columns)
+    best = None
+    best_rate = 0.0
+    for j, rate in zip(cols.tolist(), vals.tolist()):
+        if j in allowed and rate > best_rate:
+            best, best_rate = j, rate
+    return matrix.columns[best] if best is not None else None
+
+
+def _explain(
+    matrix: RewardsMatrix, profile: _Profile, rows: Sequence[int]
+) -> List[CategoryGain]:
+    explanations = []
+    for c, category in enumerate(profile.categories):
+        current = float(profile.wallet_rates[c])
+        card_rates = profile.rates[list(rows), c]
+        k = int(np.argmax(card_rates))
+        if card_rates[k] <= current:
+            continue
+        row = rows[k]
+        explanations.append(CategoryGain(
+            category,
+            float(profile.spend[c]),
+            current,
+            float(card_rates[k]),
+            matrix.card_names[row],
+            _best_column(matrix, row, profile.columns[c]),
+        ))
+    explanations.sort(key=lambda e: e.gain, reverse=True)
+    return explanations
+
+
+def suggest_cards(
+    spend: Dict[str, float],
+    wallet: Optional[Sequence[str]] = None,
+    top_k: int = 5,
+    pairs: bool = False,
+    matrix: Optional[RewardsMatrix] = None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    max_pair_candidates: int = 200,
+) -> List[CardSuggestion]:
+    """
+    Ranks catalog cards (or pairs) by the rewards they would add to a wallet.
+
+    Args:
+        spend: Annual dollars per category
+        wallet: Cards already held (uses USER_CARDS if None)
+        top_k: Number of suggestions to return
+        pairs: Rank pairs of cards instead of single cards
+        matrix: Optional preloaded RewardsMatrix to use instead of matrix_csv_path
+        matrix_csv_path: Path to rewards matrix CSV (ignored when matrix is given)
+        max_pair_candidates: Only the best this-many single cards are paired
+
+    Returns:
+        Suggestions with positive gain, highest gain first
+    """
+    if matrix is None:
+        matrix = load_matrix(matrix_csv_path)
+    else:
+        matrix.refresh()
+    matrix = matrix.contents
+    if wallet is None:
+        from ranking import USER_CARDS
+
+        wallet = USER_CARDS
+
+    wallet_lower = {name.lower() for name in wallet}
+    wallet_rows = [
+        i for i, name in enumerate(matrix.card_names_lower) if name in wallet_lower
+    ]
+    profile = _profile(matrix, spend, wallet_rows)
+    if not profile.categories or top_k <= 0:
+        return []
+
+    # Improvement over the wallet per card and category, in rate points
+    improvement = np.maximum(profile.rates - profile.wallet_rates, 0.0)
+    # Same card name may appear once per row; skip rows of held cards
+    held = np.zeros(matrix.shape[0], dtype=bool)
+    held[wallet_rows] = True
+    weights = profile.spend / 100
+    single = improvement @ weights
+    single[held] = 0.0
+
+    # Candidates with any gain, best first (ties keep matrix order)
+    order = np.argsort(-single, kind="stable")
+    candidates = order[single[order] > 0]
+
+    if not pairs:
+        return [
+            CardSuggestion(
+                (matrix.card_names[row],),
+                float(single[row]),
+                _explain(matrix, profile, [int(row)]),
+            )
+            for row in candidates[:top_k]
+        ]
+
+    candidates = candidates[:max_pair_candidates]
+    gains = single[candidates]
+    improvement = improvement[candidates]
+
+    # Branch and bound over pairs (i < j in descending single gain)
+    best: List[Tuple[float, int, int]] = []  # min-heap of (gain, -i, -j)
+    for i in range(len(candidates) - 1):
+        threshold = best[0][0] if len(best) >= top_k else 0.0
+        if gains[i] + gains[i + 1] <= threshold:
+            break
+        # Partners j > i whose bound gains[i] + gains[j] can still qualify
+        limit = i + 1 + int(np.searchsorted(-gains[i + 1:], -(threshold - gains[i]), side="left"))
+        if limit <= i + 1:
+            continue
+        partners = np.arange(i + 1, limit)
+        pair_gains = np.maximum(improvement[i], improvement[partners]) @ weights
+        for j, gain in zip(partners.tolist(), pair_gains.tolist()):
+            item = (gain, -i, -j)
+            if len(best) < top_k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+
+    results = []
+    for gain, neg_i, neg_j in sorted(best, reverse=True):
+        if gain <= 0:
+            continue
+        rows = [int(candidates[-neg_i]), int(candidates[-neg_j])]
+        results.append(CardSuggestion(
+            tuple(matrix.card_names[row] for row in rows),
+            float(gain),
+            _explain(matrix, profile, rows),
+        ))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Find the card(s) that would add the most rewards.")
+    parser.add_argument("spend", help="JSON file mapping category to annual dollars")
+    parser.add_argument("--wallet", help="comma-separated card names (defaults to USER_CARDS)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--pairs", action="store_true", help="rank pairs of cards")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv")
+    args = parser.parse_args(argv)
+
+    with open(args.spend, encoding="utf-8") as f:
+        spend = json.load(f)
+    wallet = [c.strip() for c in args.wallet.split(",")] if args.wallet else None
+    suggestions = suggest_cards(
+        spend, wallet, args.top_k, args.pairs, matrix=load_matrix(args.matrix)
+    )
+    out = [s.to_dict() for s in suggestions]
+    sys.stdout.write(json.dumps(out, indent=2, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,315 @@
+"""
+Local stand-in for the Google Places findplacefromtext and nearbysearch
+endpoints.
+
+Serves recorded fixtures (or synthesized candidates) over HTTP so the Places
+client, benchmarks and load tests can run fully offline. Latency and
+rate-limit errors can be injected to exercise pooling and retries.
+
+Usage:
+    python fake_places.py --port 8765 --latency 0.02 [--fixtures places.json]
+                          [--nearby-fixtures fixtures/nearby_union_square.json]
+
+Then point a client at http://127.0.0.1:8765/maps/api/place/findplacefromtext/json
+(or .../nearbysearch/json?location=LAT,LNG&radius=M).
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from geohash import distance_m
+from places_cache import normalize_query
+
+FIND_PLACE_PATH = "/maps/api/place/findplacefromtext/json"
+NEARBY_SEARCH_PATH = "/maps/api/place/nearbysearch/json"
+
+# Google returns at most 20 nearby results per page and 3 pages per search
+NEARBY_PAGE_SIZE = 20
+NEARBY_MAX_RESULTS = 60
+
+# Place types handed out by synthesize_nearby
+_SYNTH_TYPES = [
+    ("Corner Cafe", ["cafe", "food", "establishment"]),
+    ("Fuel Stop", ["gas_station", "store", "establishment"]),
+    ("Fresh Market", ["supermarket", "grocery_or_supermarket", "store", "establishment"]),
+    ("Bistro", ["restaurant", "food", "establishment"]),
+    ("Pharmacy", ["pharmacy", "store", "establishment"]),
+    ("General Store", ["store", "point_of_interest", "establishment"]),
+]
+
+
+def load_fixtures(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Loads recorded responses: a JSON object mapping query text to either a
+    candidates list or a full response body with a "candidates" key.
+    """
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    fixtures = {}
+    for query, value in raw.items():
+        if isinstance(value, dict):
+            value = value.get("candidates", [])
+        fixtures[normalize_query(query)] = value
+    return fixtures
+
+
+def load_nearby_fixtures(path: str) -> List[Dict[str, Any]]:
+    """
+    Loads recorded nearby places: a JSON list of Places results (place_id,
+    name, types, geometry.location) or a response body with a "results" key.
+    """
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    if isinstance(raw, dict):
+        raw = raw.get("results", [])
+    return list(raw)
+
+
+def synthesize_nearby(lat: float, lng: float, radius: float) -> List[Dict[str, Any]]:
+    """
+    Deterministic fake places around a point for searches without fixtures.
+
+    Places sit on a fixed ~100 m grid, so overlapping searches see the same
+    place ids.
+    """
+    step = 0.001
+    reach = int(radius / 111_000 / step) + 1
+    places = []
+    for i in range(-reach, reach + 1):
+        for j in range(-reach, reach + 1):
+            plat = (round(lat / step) + i) * step
+            plng = (round(lng / step) + j) * step
+            if distance_m(lat, lng, plat, plng) > radius:
+                continue
+            key = f"{plat:.3f},{plng:.3f}"
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+            name, types = _SYNTH_TYPES[int(digest[:4], 16) % len(_SYNTH_TYPES)]
+            places.append({
+                "place_id": f"fake-{digest[:16]}",
+                "name": f"{name} {digest[4:7].upper()}",
+                "vicinity": f"{int(digest[7:11], 16) % 9000 + 100} Fake St, Testville",
+                "types": list(types),
+                "geometry": {"location": {"lat": round(plat, 7), "lng": round(plng, 7)}},
+            })
+    return places
+
+
+def synthesize_candidate(query: str) -> Dict[str, Any]:
+    """A deterministic fake place for queries without a fixture."""
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()
+    return {
+        "place_id": f"fake-{digest[:16]}",
+        "name": query.strip().title(),
+        "formatted_address": f"{int(digest[:4], 16) % 9000 + 100} Fake St, Testville, CA",
+        "types": ["store", "point_of_interest", "establishment"],
+    }
+
+
+class FakePlacesServer:
+    """
+    Threaded HTTP server answering findplacefromtext and nearbysearch requests.
+
+    Args:
+        fixtures: Optional query → candidates map (see load_fixtures)
+        latency: Seconds to sleep before each response
+        error_rate: Probability of answering OVER_QUERY_LIMIT (HTTP 200, as Google
+            does) instead of a result
+        synthesize: Make up a candidate for queries without a fixture
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        seed: Seed for error injection
+        nearby: Optional recorded places for nearbysearch (see load_nearby_fixtures)
+    """
+
+    def __init__(
+        self,
+        fixtures: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        synthesize: bool = True,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: Optional[int] = None,
+        nearby: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.fixtures = {normalize_query(k): v for k, v in (fixtures or {}).items()}
+        self.nearby = list(nearby) if nearby is not None else None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.synthesize = synthesize
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._pages: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; avoid Nagle stalls
+            # on keep-alive connections
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        """findplacefromtext endpoint URL."""
+        return self.base_url + FIND_PLACE_PATH
+
+    @property
+    def nearby_url(self) -> str:
+        """nearbysearch endpoint URL."""
+        return self.base_url + NEARBY_SEARCH_PATH
+
+    def start(self) -> "FakePlacesServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "FakePlacesServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -------------------------------------------------------------------------
+    # Request handling
+    # -------------------------------------------------------------------------
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            self.request_count += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = urlparse(request.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if fail:
+            self._send(request, 200, {"status": "OVER_QUERY_LIMIT", "candidates": []})
+        elif parsed.path == FIND_PLACE_PATH:
+            self._send(request, 200, self.find_place(params))
+        elif parsed.path == NEARBY_SEARCH_PATH:
+            self._send(request, 200, self.nearby_search(params))
+        else:
+            self._send(request, 404, {"status": "NOT_FOUND"})
+
+    def find_place(self, params: Dict[str, str]) -> Dict[str, Any]:
+        query = params.get("input", "")
+        candidates = self.fixtures.get(normalize_query(query))
+        if candidates is None:
+            candidates = [synthesize_candidate(query)] if self.synthesize and query else []
+        return {
+            "candidates": candidates,
+            "status": "OK" if candidates else "ZERO_RESULTS",
+        }
+
+    def nearby_search(self, params: Dict[str, str]) -> Dict[str, Any]:
+        token = params.get("pagetoken")
+        if token:
+            with self._lock:
+                remaining = self._pages.pop(token, None)
+            if remaining is None:
+                return {"results": [], "status": "INVALID_REQUEST"}
+        else:
+            try:
+                lat, lng = (float(v) for v in params.get("location", "").split(","))
+                radius = float(params.get("radius", ""))
+            except ValueError:
+                return {"results": [], "status": "INVALID_REQUEST"}
+            places = self.nearby
+            if places is None:
+                places = synthesize_nearby(lat, lng, radius) if self.synthesize else []
+            place_type = params.get("type")
+            hits = []
+            for place in places:
+                if place_type and place_type not in place.get("types", []):
+                    continue
+                location = place.get("geometry", {}).get("location", {})
+                d = distance_m(lat, lng, location.get("lat", 0.0), location.get("lng", 0.0))
+                if d <= radius:
+                    hits.append((d, place))
+            # Nearest first, like rankby=prominence does for small radii
+            hits.sort(key=lambda hit: hit[0])
+            remaining = [place for _, place in hits[:NEARBY_MAX_RESULTS]]
+
+        page, remaining = remaining[:NEARBY_PAGE_SIZE], remaining[NEARBY_PAGE_SIZE:]
+        body: Dict[str, Any] = {
+            "results": page,
+            "status": "OK" if page else "ZERO_RESULTS",
+        }
+        if remaining:
+            token = hashlib.sha1(
+                f"{id(remaining)}:{time.monotonic_ns()}".encode("utf-8")
+            ).hexdigest()
+            with self._lock:
+                self._pages[token] = remaining
+            body["next_page_token"] = token
+        return body
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a fake Google Places endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with OVER_QUERY_LIMIT")
+    parser.add_argument("--fixtures", help="JSON file of recorded responses")
+    parser.add_argument("--nearby-fixtures", help="JSON file of recorded nearby places")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else None
+    nearby = load_nearby_fixtures(args.nearby_fixtures) if args.nearby_fixtures else None
+    server = FakePlacesServer(
+        fixtures, args.latency, args.error_rate, host=args.host, port=args.port,
+        nearby=nearby,
+    )
+    print(f"Fake Places listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+"""
+Fuzzy category matchers used when no brand or place type matches.
+
+Matchers are built once over a fixed list of choices (normally CATEGORIES)
+and memoize resolved names in a bounded LRU cache, so a repeat unknown
+merchant costs a dict hit.
+
+- TrigramMatcher (default): an inverted character-trigram index shortlists
+  the few categories sharing the most trigrams with the name, and only those
+  are scored with difflib's SequenceMatcher ratio. The cutoff is therefore on
+  the same 0..1 scale as difflib.get_close_matches(cutoff=0.6).
+- DifflibMatcher: the original get_close_matches over every choice.
+"""
+
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher, get_close_matches
+from functools import lru_cache
+from typing import Iterable
+
+DEFAULT_CUTOFF = 0.6
+DEFAULT_CACHE_SIZE = 8192
+
+
+class FuzzyMatcher(ABC):
+    """
+    Base class: resolves a name to the closest choice, or None.
+
+    Subclasses implement _match(); match() adds the LRU cache.
+    """
+
+    def __init__(
+        self,
+        choices: Iterable[str],
+        cutoff: float = DEFAULT_CUTOFF,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        self.choices = list(choices)
+        self.cutoff = cutoff
+        self._cached_match = lru_cache(maxsize=cache_size)(self._match)
+
+    def match(self, name: str) -> str | None:
+        """Closest choice for name, or None if nothing reaches the cutoff."""
+        return self._cached_match(name or "")
+
+    def cache_info(self):
+        return self._cached_match.cache_info()
+
+    def cache_clear(self) -> None:
+        self._cached_match.cache_clear()
+
+    @abstractmethod
+    def _match(self, name: str) -> str | None:
+        """Uncached lookup."""
+
+
+class DifflibMatcher(FuzzyMatcher):
+    """Exhaustive difflib.get_close_matches over all choices."""
+
+    def _match(self, name: str) -> str | None:
+        matches = get_close_matches(name, self.choices, n=1, cutoff=self.cutoff)
+        return matches[0] if matches else None
+
+
+def _trigrams(text: str) -> Counter:
+    padded = "  " + text.lower() + " "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramMatcher(FuzzyMatcher):
+    """
+    Trigram-shortlisted SequenceMatcher scoring.
+
+    Args:
+        choices: Strings to match against
+        cutoff: Minimum SequenceMatcher ratio (same scale as difflib)
+        cache_size: Number of resolved names to remember
+        shortlist: How many top trigram candidates to score exactly
+    """
+
+    def __init__(
+        self,
+        choices: Iterable[str],
+        cutoff: float = DEFAULT_CUTOFF,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        shortlist: int = 3,
+    ):
+        super().__init__(choices, cutoff, cache_size)
+        self.shortlist = shortlist
+        self._sizes: list[int] = []
+        self._postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for i, choice in enumerate(self.choices):
+            grams = _trigrams(choice)
+            self._sizes.append(sum(grams.values()))
+            for gram, count in grams.items():
+                self._postings[gram].append((i, count))
+
+    def _candidates(self, name: str) -> list[int]:
+        grams = _trigrams(name)
+        total = sum(grams.values())
+        shared: dict[int, int] = defaultdict(int)
+        for gram, count in grams.items():
+            for i, choice_count in self._postings.get(gram, ()):
+                shared[i] += min(count, choice_count)
+        # Rank by trigram Dice coefficient
+        ranked = sorted(
+            shared,
+            key=lambda i: 2.0 * shared[i] / (total + self._sizes[i]),
+            reverse=True,
+        )
+        return ranked[: self.shortlist]
+
+    def _match(self, name: str) -> str | None:
+        matcher = SequenceMatcher()
+        matcher.set_seq2(name)
+        best: tuple[float, str] | None = None
+        for i in self._candidates(name):
+            choice = self.choices[i]
+            matcher.set_seq1(choice)
+            if matcher.real_quick_ratio() < self.cutoff or matcher.quick_ratio() < self.cutoff:
+                continue
+            score = (matcher.ratio(), choice)
+            if score[0] >= self.cutoff and (best is None or score > best):
+                best = score
+        return best[1] if best else None
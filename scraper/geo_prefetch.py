@@ -0,0 +1,525 @@
+"""
+Nearby-merchant prefetch and precomputed recommendation tiles.
+
+"Which card here?" normally costs a Places lookup, category mapping and
+ranking per question. Prefetching does that work ahead of time for an area:
+
+1. Cover the circle with geohash cells (COVER_PRECISION) and run one Places
+   Nearby Search per cell not fetched within the TTL, concurrently. A cell
+   whose search comes back full (60 results) is searched again as its 32
+   children, so dense blocks aren't truncated.
+2. Resolve every new place with the ResolutionCache.
+3. Rank all places in one get_best_cards_batch call for the wallet.
+4. Store the results in geohash buckets (TILE_PRECISION, ~150 m).
+
+A lookup then reads the few tiles around a point and returns the nearest
+places with their best cards, without touching the network. Tiles are keyed
+by wallet and stamped with the matrix content hash and rules fingerprint;
+when either changes, the tile is re-ranked from the stored places (no
+Places calls) on first use.
+
+Everything lives in one SQLite file (WAL mode) when db_path is given, so a
+prefetch run and a serving process can share it.
+
+Usage:
+    python geo_prefetch.py prefetch --lat 37.788 --lng -122.4075 --radius 800 \\
+        --db tiles.sqlite [--places-url http://127.0.0.1:8765/maps/api/place/findplacefromtext/json]
+    python geo_prefetch.py lookup --lat 37.788 --lng -122.4075 --db tiles.sqlite
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import geohash
+import map_to_category
+from instrumentation import incr, stage
+from places_client import NEARBY_MAX_RESULTS
+from ranking import get_best_cards_batch
+from resolution_cache import ResolutionCache
+from rewards_matrix import RewardsMatrix, load_matrix
+
+# Cells searched with one Nearby Search (~1.2 x 0.6 km)
+COVER_PRECISION = 6
+# Recommendation buckets (~150 x 150 m)
+TILE_PRECISION = 7
+# Seconds a searched cell counts as covered
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_TOP_N = 5
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS places ("
+    "place_id TEXT PRIMARY KEY, tile TEXT NOT NULL, name TEXT NOT NULL, "
+    "lat REAL NOT NULL, lng REAL NOT NULL, types TEXT NOT NULL, "
+    "fetched_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS places_tile ON places (tile)",
+    "CREATE TABLE IF NOT EXISTS coverage (cell TEXT PRIMARY KEY, fetched_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tiles ("
+    "wallet TEXT NOT NULL, tile TEXT NOT NULL, version TEXT NOT NULL, "
+    "entries TEXT NOT NULL, PRIMARY KEY (wallet, tile))",
+)
+
+
+class TileEntry(NamedTuple):
+    """A place in a tile with its precomputed recommendation."""
+
+    place_id: str
+    name: str
+    lat: float
+    lng: float
+    category: str
+    # Rule behind the category: brand, type, fuzzy or default
+    rule: str
+    cards: List[Tuple[str, float, str]]
+
+
+class NearbyPlace(NamedTuple):
+    """A lookup hit."""
+
+    distance_m: float
+    entry: TileEntry
+
+
+class LookupResult(NamedTuple):
+    """Places around a point, nearest first."""
+
+    # False if part of the circle was never prefetched (or its TTL expired)
+    covered: bool
+    places: List[NearbyPlace]
+
+
+class PrefetchStats(NamedTuple):
+    """What a prefetch did."""
+
+    cells: int
+    searches: int
+    places: int
+    new_places: int
+    tiles: int
+    seconds: float
+
+
+def wallet_key(wallet: Optional[List[str]]) -> str:
+    """Tile key for a card whitelist (None = USER_CARDS, [] = whole catalog)."""
+    if wallet is None:
+        return "user"
+    return hashlib.sha1("\x1f".join(wallet).encode("utf-8")).hexdigest()[:16]
+
+
+class RecommendationTiles:
+    """
+    Geohash-bucketed store of nearby places and their best cards.
+
+    Args:
+        matrix: RewardsMatrix to rank with
+        db_path: Optional SQLite file (in memory only if None)
+        resolver: ResolutionCache for merchant → category mapping
+        ttl: Seconds a prefetched cell counts as covered
+        top_n: Cards kept per place
+    """
+
+    def __init__(
+        self,
+        matrix: RewardsMatrix,
+        db_path: Optional[str] = None,
+        resolver: Optional[ResolutionCache] = None,
+        ttl: float = DEFAULT_TTL,
+        top_n: int = DEFAULT_TOP_N,
+    ):
+        self.matrix = matrix
+        self.db_path = db_path
+        self.resolver = resolver if resolver is not None else ResolutionCache()
+        self.ttl = ttl
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False, timeout=30)
+        if db_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self._coverage: Dict[str, float] = dict(
+            self._db.execute("SELECT cell, fetched_at FROM coverage")
+        )
+        # (wallet key, tile) → (version, entries)
+        self._tiles: Dict[Tuple[str, str], Tuple[str, List[TileEntry]]] = {}
+        self.rebuilds = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "RecommendationTiles":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def version(self) -> str:
+        """Stamp of everything a tile's contents depend on."""
+        self.matrix.refresh()
+        return f"{self.matrix.content_hash}:{map_to_category.rules_fingerprint()}:{self.top_n}"
+
+    # -------------------------------------------------------------------------
+    # Prefetch
+    # -------------------------------------------------------------------------
+
+    def prefetch(
+        self,
+        lat: float,
+        lng: float,
+        radius: float,
+        client,
+        wallet: Optional[List[str]] = None,
+        force: bool = False,
+    ) -> PrefetchStats:
+        """
+        Fetches, maps and ranks the places within radius metres of a point.
+
+        Args:
+            lat: Latitude of the centre
+            lng: Longitude of the centre
+            radius: Radius in metres
+            client: PlacesClient used for Nearby Search
+            wallet: Card whitelist to rank for (None = USER_CARDS)
+            force: Search cells again even if they are still covered
+
+        Returns:
+            PrefetchStats
+        """
+        start = time.perf_counter()
+        now = time.time()
+        cells = geohash.cells_covering(lat, lng, radius, COVER_PRECISION)
+        todo = [
+            cell for cell in cells
+            if force or now - self._coverage.get(cell, -math.inf) > self.ttl
+        ]
+
+        found: Dict[str, Dict[str, Any]] = {}
+        searches = 0
+        with stage("geo.nearby"), ThreadPoolExecutor(
+            max_workers=max(1, getattr(client, "max_concurrency", 8)),
+            thread_name_prefix="geo-prefetch",
+        ) as pool:
+            pending = todo
+            while pending:
+                searches += len(pending)
+                results = list(pool.map(lambda cell: (cell, _search_cell(client, cell)), pending))
+                pending = []
+                for cell, places in results:
+                    for place in places:
+                        found.setdefault(place["place_id"], place)
+                    # A full page set means the cell may hold more than one
+                    # search returns; cover it with its children instead
+                    if len(places) >= NEARBY_MAX_RESULTS and len(cell) < TILE_PRECISION:
+                        pending.extend(geohash.children(cell))
+
+        new_places = self._store_places(found.values(), todo, now)
+        incr("geo.places_fetched", len(found))
+
+        # Rank every tile of the circle that holds a place and isn't current,
+        # in one batch
+        in_circle = set(geohash.cells_covering(lat, lng, radius, TILE_PRECISION))
+        with self._lock:
+            tiles = [
+                tile for (tile,) in self._db.execute(
+                    "SELECT DISTINCT tile FROM places WHERE lat BETWEEN ? AND ? "
+                    "AND lng BETWEEN ? AND ?",
+                    geohash.circle_bbox(lat, lng, radius),
+                )
+                if tile in in_circle
+            ]
+        self._tile_entries(tiles, wallet)
+        return PrefetchStats(
+            len(cells), searches, len(found), new_places, len(tiles),
+            round(time.perf_counter() - start, 3),
+        )
+
+    def _store_places(
+        self, places: Iterable[Dict[str, Any]], cells: List[str], fetched_at: float
+    ) -> int:
+        rows = []
+        for place in places:
+            location = (place.get("geometry") or {}).get("location") or {}
+            if "lat" not in location or "lng" not in location:
+                continue
+            plat, plng = float(location["lat"]), float(location["lng"])
+            rows.append((
+                place["place_id"], geohash.encode(plat, plng, TILE_PRECISION),
+                place.get("name") or "", plat, plng,
+                json.dumps(place.get("types") or []), fetched_at,
+            ))
+        with self._lock:
+            known = 0
+            for start in range(0, len(rows), 500):
+                ids = [row[0] for row in rows[start:start + 500]]
+                known += self._db.execute(
+                    f"SELECT COUNT(*) FROM places WHERE place_id IN ({','.join('?' * len(ids))})",
+                    ids,
+                ).fetchone()[0]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?)",
+                [(cell, fetched_at) for cell in cells],
+            )
+            self._db.commit()
+            for cell in cells:
+                self._coverage[cell] = fetched_at
+            # Places changed under these tiles; rebuild them on next use
+            touched = {row[1] for row in rows}
+            for key in [key for key in self._tiles if key[1] in touched]:
+                del self._tiles[key]
+            self._db.executemany(
+                "DELETE FROM tiles WHERE tile = ?", [(tile,) for tile in touched]
+            )
+            self._db.commit()
+        return len(rows) - known
+
+    # -------------------------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------------------------
+
+    def lookup(
+        self,
+        lat: float,
+        lng: float,
+        radius: float = 150,
+        wallet: Optional[List[str]] = None,
+        limit: int = 10,
+    ) -> LookupResult:
+        """
+        Prefetched places within radius metres of a point, nearest first.
+
+        Args:
+            lat: Latitude of the point
+            lng: Longitude of the point
+            radius: Search radius in metres
+            wallet: Card whitelist (None = USER_CARDS)
+            limit: Maximum number of places returned
+
+        Returns:
+            LookupResult; covered is False if part of the circle was never
+            prefetched, in which case the caller should fall back to a live
+            lookup
+        """
+        now = time.time()
+        covered = all(
+            now - self._coverage.get(cell, -math.inf) <= self.ttl
+            for cell in geohash.cells_covering(lat, lng, radius, COVER_PRECISION)
+        )
+        tiles = geohash.cells_covering(lat, lng, radius, TILE_PRECISION)
+        entries = self._tile_entries(tiles, wallet)
+
+        hits = []
+        for tile in tiles:
+            for entry in entries[tile]:
+                d = geohash.distance_m(lat, lng, entry.lat, entry.lng)
+                if d <= radius:
+                    hits.append(NearbyPlace(round(d, 1), entry))
+        hits.sort(key=lambda hit: hit.distance_m)
+        incr("geo.lookup_hit" if hits else "geo.lookup_empty")
+        return LookupResult(covered, hits[:limit])
+
+    def _tile_entries(
+        self, tiles: List[str], wallet: Optional[List[str]]
+    ) -> Dict[str, List[TileEntry]]:
+        key = wallet_key(wallet)
+        version = self.version
+        entries: Dict[str, List[TileEntry]] = {}
+        missing = []
+        for tile in tiles:
+            cached = self._tiles.get((key, tile))
+            if cached is not None and cached[0] == version:
+                entries[tile] = cached[1]
+            else:
+                missing.append(tile)
+        if missing:
+            with self._lock:
+                stored = {
+                    tile: raw for tile, raw in self._db.execute(
+                        f"SELECT tile, entries FROM tiles WHERE wallet = ? AND version = ? "
+                        f"AND tile IN ({','.join('?' * len(missing))})",
+                        [key, version, *missing],
+                    )
+                }
+            for tile, raw in stored.items():
+                entries[tile] = [_entry_from_json(item) for item in json.loads(raw)]
+                self._tiles[(key, tile)] = (version, entries[tile])
+            stale = [tile for tile in missing if tile not in stored]
+            if stale:
+                entries.update(self._build_tiles(stale, wallet))
+        return entries
+
+    # -------------------------------------------------------------------------
+    # Tile building
+    # -------------------------------------------------------------------------
+
+    def _build_tiles(
+        self, tiles: List[str], wallet: Optional[List[str]]
+    ) -> Dict[str, List[TileEntry]]:
+        """Maps and ranks the stored places of some tiles in one batch."""
+        key = wallet_key(wallet)
+        version = self.version
+        built: Dict[str, List[TileEntry]] = {tile: [] for tile in tiles}
+        with self._lock:
+            rows = list(self._db.execute(
+                f"SELECT tile, place_id, name, lat, lng, types FROM places "
+                f"WHERE tile IN ({','.join('?' * len(tiles))}) ORDER BY tile, place_id",
+                tiles,
+            ))
+        if not rows:
+            for tile in tiles:
+                self._tiles[(key, tile)] = (version, [])
+            return built
+
+        with stage("geo.map"):
+            resolutions = [
+                self.resolver.resolve(name, json.loads(types))
+                for _, _, name, _, _, types in rows
+            ]
+        with stage("geo.rank"):
+            # Same query map.py makes for a place
+            ranked = get_best_cards_batch(
+                [(r.brand_category, r.default_category) for r in resolutions],
+                top_n=self.top_n, card_whitelist=wallet, matrix=self.matrix,
+            )
+        for (tile, place_id, name, plat, plng, _), resolution, cards in zip(
+            rows, resolutions, ranked
+        ):
+            built[tile].append(TileEntry(
+                place_id, name, plat, plng, resolution.category, resolution.rule,
+                [tuple(card) for card in cards],
+            ))
+
+        with self._lock:
+            # Empty tiles are only remembered in memory
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                [
+                    (key, tile, version, json.dumps([list(e) for e in entries]))
+                    for tile, entries in built.items() if entries
+                ],
+            )
+            self._db.commit()
+            for tile, entries in built.items():
+                self._tiles[(key, tile)] = (version, entries)
+        rebuilt = sum(1 for entries in built.values() if entries)
+        self.rebuilds += rebuilt
+        incr("geo.tile_build", rebuilt)
+        return built
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            places = self._db.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+            tiles = self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        return {
+            "places": places,
+            "tiles": tiles,
+            "covered_cells": len(self._coverage),
+            "rebuilds": self.rebuilds,
+        }
+
+
+def _search_cell(client, cell: str) -> List[Dict[str, Any]]:
+    """Nearby Search whose circle encloses a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash.bbox(cell)
+    clat, clng = (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+    radius = geohash.distance_m(clat, clng, lat_hi, lng_hi)
+    return client.nearby_search(clat, clng, math.ceil(radius))
+
+
+def _entry_from_json(item: List[Any]) -> TileEntry:
+    place_id, name, plat, plng, category, rule, cards = item
+    return TileEntry(place_id, name, plat, plng, category, rule, [tuple(c) for c in cards])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Prefetch nearby merchants into recommendation tiles and look them up."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p: argparse.ArgumentParser, default_radius: float) -> None:
+        p.add_argument("--lat", type=float, required=True)
+        p.add_argument("--lng", type=float, required=True)
+        p.add_argument("--radius", type=float, default=default_radius, help="metres")
+        p.add_argument("--db", default="recommendation_tiles.sqlite")
+        p.add_argument("--matrix", default="card_rewards_matrix.csv", help="CSV or snapshot")
+        p.add_argument("--wallet", help="comma-separated card names (defaults to USER_CARDS)")
+        p.add_argument("--top-n", type=int, default=DEFAULT_TOP_N)
+
+    prefetch = sub.add_parser("prefetch", help="fetch, map and rank an area")
+    common(prefetch, 800)
+    prefetch.add_argument("--places-url", help="findplacefromtext endpoint (e.g. fake_places.py)")
+    prefetch.add_argument("--concurrency", type=int, default=8)
+    prefetch.add_argument("--force", action="store_true", help="ignore the coverage TTL")
+
+    lookup = sub.add_parser("lookup", help="best cards near a point from the tiles")
+    common(lookup, 150)
+    lookup.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from resolution_cache import resolution_cache_from_env
+
+    wallet = [c.strip() for c in args.wallet.split(",")] if args.wallet else None
+    tiles = RecommendationTiles(
+        load_matrix(args.matrix), args.db, resolver=resolution_cache_from_env(),
+        top_n=args.top_n,
+    )
+    try:
+        if args.command == "prefetch":
+            from dotenv import load_dotenv
+
+            from places_cache import cache_from_env
+            from places_client import FIND_PLACE_URL, PlacesClient
+
+            load_dotenv()
+            api_key = os.environ.get("GOOGLE_PLACES_API_KEY") or (
+                "local" if args.places_url else None
+            )
+            if not api_key:
+                print("GOOGLE_PLACES_API_KEY is not set (or pass --places-url).")
+                return 1
+            client = PlacesClient(
+                api_key, cache=cache_from_env(),
+                base_url=args.places_url or FIND_PLACE_URL,
+                max_concurrency=args.concurrency,
+            )
+            try:
+                stats = tiles.prefetch(
+                    args.lat, args.lng, args.radius, client, wallet, force=args.force
+                )
+            finally:
+                client.close()
+            print(json.dumps(stats._asdict(), indent=2))
+            return 0
+
+        result = tiles.lookup(args.lat, args.lng, args.radius, wallet, args.limit)
+        if not result.covered:
+            print("(area not fully prefetched; results may be incomplete)")
+        for hit in result.places:
+            entry = hit.entry
+            best = entry.cards[0] if entry.cards else None
+            line = f"{hit.distance_m:6.0f} m  {entry.name} [{entry.category}]"
+            if best:
+                line += f" → {best[0]}: {best[1]}"
+            print(line)
+        return 0
+    finally:
+        tiles.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+"""
+Geohash encoding and circle coverage.
+
+A geohash names a lat/lng rectangle with a base-32 string; each extra
+character splits the cell into 32 children, so a cell's children share its
+prefix. Precision 6 cells are about 1.2 x 0.6 km, precision 7 about
+150 x 150 m.
+"""
+
+import math
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+EARTH_RADIUS_M = 6_371_000
+METERS_PER_DEGREE = 111_320
+
+
+def encode(lat: float, lng: float, precision: int = 7) -> str:
+    """
+    Geohash of a point.
+
+    Args:
+        lat: Latitude in degrees
+        lng: Longitude in degrees
+        precision: Number of characters
+
+    Returns:
+        Geohash string
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = value * 2 + 1
+                lng_lo = mid
+            else:
+                value *= 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value * 2 + 1
+                lat_lo = mid
+            else:
+                value *= 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Bounds of a geohash cell.
+
+    Returns:
+        (lat_min, lat_max, lng_min, lng_max)
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def center(geohash: str) -> Tuple[float, float]:
+    """Centre (lat, lng) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = bbox(geohash)
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(lat, lng) extent in degrees of cells at a precision."""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def children(geohash: str) -> List[str]:
+    """The 32 cells one character finer."""
+    return [geohash + char for char in _BASE32]
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance in metres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def circle_bbox(lat: float, lng: float, radius: float) -> Tuple[float, float, float, float]:
+    """
+    Bounding box of a circle.
+
+    Returns:
+        (lat_min, lat_max, lng_min, lng_max)
+    """
+    dlat = radius / METERS_PER_DEGREE
+    dlng = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def cells_covering(lat: float, lng: float, radius: float, precision: int) -> List[str]:
+    """
+    Geohash cells at a precision that intersect a circle.
+
+    Args:
+        lat: Latitude of the centre
+        lng: Longitude of the centre
+        radius: Radius in metres
+        precision: Geohash precision of the cells
+
+    Returns:
+        Sorted geohashes
+    """
+    cell_lat, cell_lng = cell_size(precision)
+    lat_min, lat_max, lng_min, lng_max = circle_bbox(lat, lng, radius)
+    cells = set()
+    i = math.floor((lat_min + 90) / cell_lat)
+    while i * cell_lat - 90 <= lat_max:
+        lo_lat = i * cell_lat - 90
+        j = math.floor((lng_min + 180) / cell_lng)
+        while j * cell_lng - 180 <= lng_max:
+            lo_lng = j * cell_lng - 180
+            # Closest point of the cell to the centre
+            near_lat = min(max(lat, lo_lat), lo_lat + cell_lat)
+            near_lng = min(max(lng, lo_lng), lo_lng + cell_lng)
+            if distance_m(lat, lng, near_lat, near_lng) <= radius:
+                cells.add(encode(lo_lat + cell_lat / 2, lo_lng + cell_lng / 2, precision))
+            j += 1
+        i += 1
+    return sorted(cells)
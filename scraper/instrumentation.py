@@ -0,0 +1,320 @@
+"""
+Opt-in timing and counters for the recommendation hot path.
+
+Library code marks stages and events with the module-level helpers:
+
+    with instrumentation.stage("ranking.score"):
+        ...
+    instrumentation.incr("mapping.fuzzy_fallback")
+
+Until a Recorder is enabled these are a global lookup and a return, so the
+instrumented code pays essentially nothing. When enabled, stage durations are
+aggregated into histograms and counters into totals, and every observation is
+also passed to any registered hooks (e.g. a StatsD sender):
+
+    recorder = instrumentation.enable()
+    recorder.add_hook(instrumentation.statsd_hook(instrumentation.udp_sender("127.0.0.1", 8125)))
+    ...
+    recorder.write_prometheus("/var/lib/node_exporter/cardgenius.prom")
+
+Stage names: places.lookup, places.http, matrix.load, mapping.categories,
+ranking.column_match, ranking.score, ranking.offer_text.
+Counters: places.cache_hit, places.cache_stale, places.cache_miss,
+places.http_request, places.retry, mapping.brand_match, mapping.type_match,
+mapping.fuzzy_fallback, mapping.default_fallback, ranking.fallback_columns.
+"""
+
+import bisect
+import re
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from atomic_write import atomic_open
+
+# Histogram upper bounds in seconds (Prometheus "le" buckets)
+DEFAULT_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0,
+)
+
+COUNTER = "counter"
+TIMER = "timer"
+
+# hook(kind, name, value): value is seconds for TIMER, an increment for COUNTER
+Hook = Callable[[str, str, float], None]
+
+
+class _Timer:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self, n_buckets: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (n_buckets + 1)
+
+
+class _Stage:
+    __slots__ = ("_recorder", "_name", "_start")
+
+    def __init__(self, recorder: "Recorder", name: str):
+        self._recorder = recorder
+        self._name = name
+
+    def __enter__(self) -> "_Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._recorder.observe(self._name, time.perf_counter() - self._start)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Recorder:
+    """
+    Thread-safe collector of stage timings and event counters.
+
+    Args:
+        buckets: Ascending histogram bounds in seconds
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters: Dict[str, float] = {}
+        self.timers: Dict[str, _Timer] = {}
+        self._hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Hook) -> None:
+        """Calls hook(kind, name, value) for every observation."""
+        self._hooks.append(hook)
+
+    def stage(self, name: str) -> _Stage:
+        """Context manager timing one execution of a stage."""
+        return _Stage(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = _Timer(len(self.buckets))
+            timer.count += 1
+            timer.total += seconds
+            if seconds > timer.max:
+                timer.max = seconds
+            timer.buckets[bisect.bisect_left(self.buckets, seconds)] += 1
+        for hook in self._hooks:
+            hook(TIMER, name, seconds)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self._hooks:
+            hook(COUNTER, name, value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Plain-dict copy of the current counters and timer summaries."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {
+                    name: {
+                        "count": t.count,
+                        "total_seconds": t.total,
+                        "max_seconds": t.max,
+                    }
+                    for name, t in self.timers.items()
+                },
+            }
+
+    # -------------------------------------------------------------------------
+    # Export
+    # -------------------------------------------------------------------------
+
+    def to_prometheus(self, prefix: str = "cardgenius") -> str:
+        """
+        Renders the Prometheus text exposition format.
+
+        Stages become one histogram, {prefix}_stage_seconds{stage="..."}; each
+        counter becomes {prefix}_{name}_total.
+        """
+        lines: List[str] = []
+        with self._lock:
+            if self.timers:
+                metric = f"{prefix}_stage_seconds"
+                lines.append(f"# HELP {metric} Time spent per recommendation stage.")
+                lines.append(f"# TYPE {metric} histogram")
+                for name in sorted(self.timers):
+                    timer = self.timers[name]
+                    label = _escape_label(name)
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, timer.buckets):
+                        cumulative += count
+                        lines.append(
+                            f'{metric}_bucket{{stage="{label}",le="{bound!r}"}} {cumulative}'
+                        )
+                    lines.append(f'{metric}_bucket{{stage="{label}",le="+Inf"}} {timer.count}')
+                    lines.append(f'{metric}_sum{{stage="{label}"}} {timer.total!r}')
+                    lines.append(f'{metric}_count{{stage="{label}"}} {timer.count}')
+            for name in sorted(self.counters):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {_number(self.counters[name])}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "cardgenius") -> None:
+        """
+        Writes to_prometheus() to a file atomically, as the node_exporter
+        textfile collector expects.
+        """
+        text = self.to_prometheus(prefix)
+        with atomic_open(path, "w", prefix=".metrics-", suffix=".prom", encoding="utf-8") as f:
+            f.write(text)
+
+    def to_statsd(self, prefix: str = "cardgenius") -> List[str]:
+        """
+        Aggregated StatsD lines: counters as |c, and per stage the call count
+        (|c) and total time in milliseconds (|ms).
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                lines.append(f"{prefix}.{name}:{_number(self.counters[name])}|c")
+            for name in sorted(self.timers):
+                timer = self.timers[name]
+                lines.append(f"{prefix}.{name}.count:{timer.count}|c")
+                lines.append(f"{prefix}.{name}:{timer.total * 1000:.3f}|ms")
+        return lines
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+# -----------------------------------------------------------------------------
+# StatsD hooks
+# -----------------------------------------------------------------------------
+
+def statsd_hook(send: Callable[[str], None], prefix: str = "cardgenius") -> Hook:
+    """
+    Hook that emits every observation as a StatsD line, e.g.
+    "cardgenius.ranking.score:0.118|ms" or "cardgenius.places.cache_hit:1|c".
+
+    Args:
+        send: Called with each line (see udp_sender, or sys.stderr.write)
+        prefix: Metric name prefix
+    """
+
+    def hook(kind: str, name: str, value: float) -> None:
+        if kind == TIMER:
+            send(f"{prefix}.{name}:{value * 1000:.3f}|ms")
+        else:
+            send(f"{prefix}.{name}:{_number(value)}|c")
+
+    return hook
+
+
+def udp_sender(host: str = "127.0.0.1", port: int = 8125) -> Callable[[str], None]:
+    """Fire-and-forget UDP sender for statsd_hook."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = (host, port)
+
+    def send(line: str) -> None:
+        try:
+            sock.sendto(line.encode("utf-8"), address)
+        except OSError:
+            pass
+
+    return send
+
+
+def stream_sender(stream=None) -> Callable[[str], None]:
+    """Sender for statsd_hook that writes one line per observation to a stream."""
+    stream = stream if stream is not None else sys.stderr
+
+    def send(line: str) -> None:
+        stream.write(line + "\n")
+
+    return send
+
+
+# -----------------------------------------------------------------------------
+# Global switch used by the instrumented code
+# -----------------------------------------------------------------------------
+
+_recorder: Optional[Recorder] = None
+
+
+def stage(name: str):
+    """Times a stage on the active recorder; a shared no-op when disabled."""
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_STAGE
+    return recorder.stage(name)
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Bumps a counter on the active recorder; does nothing when disabled."""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.incr(name, value)
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def get_recorder() -> Optional[Recorder]:
+    return _recorder
+
+
+def enable(recorder: Optional[Recorder] = None) -> Recorder:
+    """Installs (and returns) the process-wide recorder."""
+    global _recorder
+    _recorder = recorder if recorder is not None else Recorder()
+    return _recorder
+
+
+def disable() -> None:
+    global _recorder
+    _recorder = None
+
+
+@contextmanager
+def recording(recorder: Optional[Recorder] = None) -> Iterator[Recorder]:
+    """Enables a recorder for the duration of a with block."""
+    global _recorder
+    previous = _recorder
+    active = enable(recorder)
+    try:
+        yield active
+    finally:
+        _recorder = previous
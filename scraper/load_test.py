@@ -0,0 +1,181 @@
+"""
+Load test for the recommendation service (server.py).
+
+Starts a FakePlacesServer as the Places backend and a RecommendationServer
+in-process (or targets an already running server with --url), then keeps
+--concurrency clients sending batched requests for --duration seconds and
+prints JSON with requests/s, items/s and latency percentiles.
+
+Usage:
+    python load_test.py [--endpoint recommend|rank|map] [--batch 16]
+                        [--concurrency 8] [--duration 10] [--latency 0.02]
+                        [--places-cache]
+    python load_test.py --url http://127.0.0.1:8080 --endpoint rank
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+
+import map_to_category
+
+ENDPOINTS = ("recommend", "rank", "map")
+
+
+def _batches(endpoint: str, batch: int, distinct: int, seed: int) -> List[Dict[str, Any]]:
+    """Request bodies to cycle through (brand-name-like merchants and categories)."""
+    rnd = random.Random(seed)
+    brands = sorted(map_to_category.BRAND_OVERRIDES)
+    types = sorted(map_to_category.TYPE_TO_CATEGORY)
+    categories = sorted(map_to_category.known_categories())
+    merchants = [f"{rnd.choice(brands).title()} #{i}" for i in range(distinct)]
+
+    bodies = []
+    for _ in range(max(1, distinct // batch)):
+        if endpoint == "recommend":
+            bodies.append({
+                "addresses": [f"{rnd.choice(merchants)}, San Francisco, CA" for _ in range(batch)],
+                "top_n": 5,
+            })
+        elif endpoint == "rank":
+            bodies.append({
+                "queries": [{"category": rnd.choice(categories)} for _ in range(batch)],
+                "top_n": 5,
+            })
+        else:
+            bodies.append({
+                "places": [
+                    {"name": rnd.choice(merchants), "types": [rnd.choice(types)]}
+                    for _ in range(batch)
+                ]
+            })
+    return bodies
+
+
+def run_load(
+    url: str,
+    endpoint: str = "recommend",
+    batch: int = 16,
+    concurrency: int = 8,
+    duration: float = 10.0,
+    distinct: int = 500,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Drives a running service and returns throughput and latency stats.
+
+    Args:
+        url: Service base URL
+        endpoint: recommend, rank or map
+        batch: Items per request
+        concurrency: Client threads, each with its own keep-alive connection
+        duration: Seconds to run
+        distinct: Distinct merchants/addresses to draw from
+        seed: Seed for the generated requests
+    """
+    bodies = _batches(endpoint, batch, distinct, seed)
+    target = f"{url}/{endpoint}"
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker: int) -> None:
+        nonlocal errors
+        session = requests.Session()
+        local: List[float] = []
+        failed = 0
+        i = worker
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = session.post(target, json=bodies[i % len(bodies)], timeout=30)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+            i += concurrency
+        session.close()
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(w,)) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "endpoint": endpoint,
+        "batch": batch,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "items_per_sec": round(len(latencies) * batch / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the recommendation service.")
+    parser.add_argument("--url", help="running service (default: start one in-process)")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="recommend")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--distinct", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="fake Places latency (s)")
+    parser.add_argument(
+        "--places-cache", action="store_true", help="cache Places lookups in memory"
+    )
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    def load(url: str) -> Dict[str, Any]:
+        return run_load(
+            url, args.endpoint, args.batch, args.concurrency, args.duration,
+            args.distinct, args.seed,
+        )
+
+    if args.url:
+        results = load(args.url.rstrip("/"))
+    else:
+        from fake_places import FakePlacesServer
+        from places_cache import PlacesCache
+        from places_client import PlacesClient
+        from server import RecommendationServer, RecommendationService
+
+        with FakePlacesServer(latency=args.latency, seed=args.seed) as places:
+            cache = PlacesCache() if args.places_cache else None
+            client = PlacesClient(
+                "load-test", cache=cache, base_url=places.url, max_concurrency=16
+            )
+            service = RecommendationService(args.matrix, places_client=client)
+            try:
+                with RecommendationServer(service) as server:
+                    results = load(server.base_url)
+                    results["server"] = service.health()
+                    results["places_backend_requests"] = places.request_count
+            finally:
+                service.close()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,23 @@
+import csv
+import hashlib
+import json
 import re
-from difflib import get_close_matches
+from types import MappingProxyType
+
+from brand_matcher import BrandMatcher
+from fuzzy_matcher import FuzzyMatcher, TrigramMatcher
+from instrumentation import incr
 
 # -------------------------------------------------------------------
 # 1. Category master list (from your dataset)
 #    (Trimmed slightly here for clarity — you can paste the full version)
+#
+#    The tables below are read-only at runtime (CATEGORIES is a tuple, the
+#    dicts are exposed as mapping proxies); change them in this file, or
+#    through register_brand_overrides / register_type_categories, so
+#    rules_fingerprint and the compiled matchers stay in sync.
 # -------------------------------------------------------------------
-CATEGORIES = [
+CATEGORIES = (
     "AAA", "AT&T", "Alaska Air", "Amazon", "Amtrak", "Athleta", "Banana Republic",
     "Barnes & Noble", "Bass Pro", "Beauty", "Bed Bath & Beyond", "Belk", "Bloomingdale",
     "Book Store", "British Air", "Bus", "Car Rental", "Choice", "Costco Gas", "Cruise",
@@ -18,7 +30,7 @@ CATEGORIES = [
     "Starbucks", "Streaming services", "Supermarkets (U.S.)", "TJ Maxx", "Target",
     "Telecommunication", "Transit", "Travel", "Walgreens", "Wayfair", "Whole Foods",
     "Wholesale Club", "Wireless telephone services (direct, U.S. providers)"
-]
+)
 
 # -------------------------------------------------------------------
 # Shared fallback/search helpers (used by ranking)
@@ -29,7 +41,7 @@ DEFAULT_FALLBACK_TERMS = ["Everywhere", "Other purchases"]
 # -------------------------------------------------------------------
 # 2. Brand → Category direct overrides
 # -------------------------------------------------------------------
-BRAND_OVERRIDES = {
+_BRAND_OVERRIDES = {
     "target": "Target",
     "walmart": "Department Stores",
     "costco": "Wholesale Club",
@@ -80,6 +92,7 @@ BRAND_OVERRIDES = {
     "walgreens": "Walgreens",
     "wayfair": "Wayfair",
 }
+BRAND_OVERRIDES = MappingProxyType(_BRAND_OVERRIDES)
 
 # Robust normalization for brand matching
 _NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
@@ -91,10 +104,59 @@ def _normalize_text(s: str) -> str:
 
 _NORMALIZED_BRAND_OVERRIDES = { _normalize_text(k): v for k, v in BRAND_OVERRIDES.items() }
 
+# Compiled matchers over the override tables (see brand_matcher.py).
+# Priority is table order: the first brand in BRAND_OVERRIDES that occurs in
+# the name wins, exactly like walking the dicts in insertion order.
+_NORMALIZED_BRAND_MATCHER = BrandMatcher(_NORMALIZED_BRAND_OVERRIDES.items())
+_RAW_BRAND_MATCHER = BrandMatcher(BRAND_OVERRIDES.items())
+
+def _rebuild_brand_matchers() -> None:
+    global _NORMALIZED_BRAND_OVERRIDES, _NORMALIZED_BRAND_MATCHER, _RAW_BRAND_MATCHER, _RULES_FINGERPRINT
+    _RULES_FINGERPRINT = None
+    _NORMALIZED_BRAND_OVERRIDES = { _normalize_text(k): v for k, v in BRAND_OVERRIDES.items() }
+    _NORMALIZED_BRAND_MATCHER = BrandMatcher(_NORMALIZED_BRAND_OVERRIDES.items())
+    _RAW_BRAND_MATCHER = BrandMatcher(BRAND_OVERRIDES.items())
+
+def register_brand_overrides(overrides: dict[str, str]) -> None:
+    """
+    Adds brand → category overrides and recompiles the brand matchers.
+    New brands get lower priority than existing ones; re-registering an
+    existing brand only changes its category.
+    """
+    for brand, category in overrides.items():
+        _BRAND_OVERRIDES[brand.lower()] = category
+    _rebuild_brand_matchers()
+
+def load_brand_overrides(path: str) -> int:
+    """
+    Loads extra brand overrides from a two-column CSV (brand,category).
+    A header row is skipped if its first cell is "brand". Returns the number
+    of overrides read.
+    """
+    overrides: dict[str, str] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            if not overrides and row[0].strip().lower() == "brand":
+                continue
+            overrides[row[0].strip()] = row[1].strip()
+    register_brand_overrides(overrides)
+    return len(overrides)
+
+def _match_brand(place_name: str) -> str | None:
+    """Brand category for a place name via the compiled override matchers."""
+    # First try normalized containment to absorb punctuation/spacing variants
+    cat = _NORMALIZED_BRAND_MATCHER.match(_normalize_text(place_name or ""))
+    if cat is not None:
+        return cat
+    # Fallback to legacy lowercase substring (covers simple cases)
+    return _RAW_BRAND_MATCHER.match((place_name or "").lower())
+
 # -------------------------------------------------------------------
 # 3. Google place type → Category mappings
 # -------------------------------------------------------------------
-TYPE_TO_CATEGORY = {
+_TYPE_TO_CATEGORY = {
     # Food / dining
     "restaurant": "Restaurants",
     "cafe": "Dining",
@@ -133,6 +195,27 @@ TYPE_TO_CATEGORY = {
     "night_club": "Entertainment",
     "spa": "Beauty",
 }
+TYPE_TO_CATEGORY = MappingProxyType(_TYPE_TO_CATEGORY)
+
+def register_type_categories(mappings: dict[str, str]) -> None:
+    """Adds or changes Google place type → category mappings."""
+    global _RULES_FINGERPRINT
+    _TYPE_TO_CATEGORY.update(mappings)
+    _RULES_FINGERPRINT = None
+
+# -------------------------------------------------------------------
+# Fuzzy fallback (pluggable; see fuzzy_matcher.py)
+# -------------------------------------------------------------------
+_FUZZY_MATCHER: FuzzyMatcher = TrigramMatcher(CATEGORIES)
+
+def set_fuzzy_matcher(matcher: FuzzyMatcher) -> None:
+    """Replaces the matcher used when no brand or type matches."""
+    global _FUZZY_MATCHER, _RULES_FINGERPRINT
+    _FUZZY_MATCHER = matcher
+    _RULES_FINGERPRINT = None
+
+def get_fuzzy_matcher() -> FuzzyMatcher:
+    return _FUZZY_MATCHER
 
 # -------------------------------------------------------------------
 # 4. Core mapping function
@@ -145,30 +228,26 @@ def map_place_to_category(place_name: str, types: list[str]) -> str:
     if not place_name and not types:
         return "Other purchases"
 
-    name_lower = (place_name or "").lower()
-    name_norm = _normalize_text(place_name or "")
-
     # 1. Check brand overrides (e.g., Target, Whole Foods)
-    # First try normalized containment to absorb punctuation/spacing variants
-    for brand_norm, cat in _NORMALIZED_BRAND_OVERRIDES.items():
-        if brand_norm and brand_norm in name_norm:
-            return cat
-    # Fallback to legacy lowercase substring (covers simple cases)
-    for brand_raw, cat in BRAND_OVERRIDES.items():
-        if brand_raw in name_lower:
-            return cat
+    brand_category = _match_brand(place_name)
+    if brand_category is not None:
+        incr("mapping.brand_match")
+        return brand_category
 
     # 2. Check explicit type mappings
     for t in types or []:
-        if t in TYPE_TO_CATEGORY:
-            return TYPE_TO_CATEGORY[t]
+        if t in _TYPE_TO_CATEGORY:
+            incr("mapping.type_match")
+            return _TYPE_TO_CATEGORY[t]
 
     # 3. Fuzzy match name to category list (fallback)
-    matches = get_close_matches(place_name, CATEGORIES, n=1, cutoff=0.6)
-    if matches:
-        return matches[0]
+    match = _FUZZY_MATCHER.match(place_name)
+    if match:
+        incr("mapping.fuzzy_fallback")
+        return match
 
     # 4. Default fallback
+    incr("mapping.default_fallback")
     return "Other purchases"
 
 # -------------------------------------------------------------------
@@ -180,33 +259,64 @@ def map_place_to_categories(place_name: str, types: list[str]) -> tuple[str | No
     - brand_category_or_None: category matched via BRAND_OVERRIDES (robust normalization)
     - default_category: category from types/fuzzy/default path (ignores brand overrides)
     """
-    name_lower = (place_name or "").lower()
-    name_norm = _normalize_text(place_name or "")
+    brand_category, default_category, _ = resolve_place_categories(place_name, types)
+    return (brand_category, default_category)
 
+def resolve_place_categories(place_name: str, types: list[str]) -> tuple[str | None, str, str]:
+    """
+    Like map_place_to_categories, plus which rule produced the default
+    category: "type", "fuzzy" or "default".
+    """
     # Brand category (robust normalization)
-    brand_category = None
-    for brand_norm, cat in _NORMALIZED_BRAND_OVERRIDES.items():
-        if brand_norm and brand_norm in name_norm:
-            brand_category = cat
-            break
-    if brand_category is None:
-        for brand_raw, cat in BRAND_OVERRIDES.items():
-            if brand_raw in name_lower:
-                brand_category = cat
-                break
+    brand_category = _match_brand(place_name)
+    if brand_category is not None:
+        incr("mapping.brand_match")
 
     # Default path (ignore brand overrides; use types then fuzzy then fallback)
     if types:
         for t in types:
-            if t in TYPE_TO_CATEGORY:
-                return (brand_category, TYPE_TO_CATEGORY[t])
-    matches = get_close_matches(place_name or "", CATEGORIES, n=1, cutoff=0.6)
-    if matches:
-        default_category = matches[0]
-    else:
-        default_category = "Other purchases"
+            if t in _TYPE_TO_CATEGORY:
+                incr("mapping.type_match")
+                return (brand_category, _TYPE_TO_CATEGORY[t], "type")
+    match = _FUZZY_MATCHER.match(place_name)
+    if match:
+        incr("mapping.fuzzy_fallback")
+        return (brand_category, match, "fuzzy")
+    incr("mapping.default_fallback")
+    return (brand_category, "Other purchases", "default")
 
-    return (brand_category, default_category)
+# -------------------------------------------------------------------
+# Fingerprint of the mapping rules (for persistent caches)
+# -------------------------------------------------------------------
+_RULES_FINGERPRINT: str | None = None
+
+def rules_fingerprint() -> str:
+    """
+    Content hash of everything map_place_to_categories depends on:
+    BRAND_OVERRIDES (in priority order), TYPE_TO_CATEGORY, CATEGORIES and
+    the fuzzy matcher's configuration. The tables can only change through
+    register_brand_overrides, register_type_categories and
+    set_fuzzy_matcher, which clear the cached hash.
+    """
+    global _RULES_FINGERPRINT
+    if _RULES_FINGERPRINT is None:
+        matcher = _FUZZY_MATCHER
+        payload = json.dumps(
+            [
+                list(_BRAND_OVERRIDES.items()),
+                sorted(_TYPE_TO_CATEGORY.items()),
+                CATEGORIES,
+                [
+                    type(matcher).__name__,
+                    matcher.cutoff,
+                    getattr(matcher, "shortlist", None),
+                    matcher.choices,
+                ],
+            ],
+            ensure_ascii=False,
+        )
+        _RULES_FINGERPRINT = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return _RULES_FINGERPRINT
 
 # -------------------------------------------------------------------
 # Build search terms for ranking given a category and available columns
@@ -243,6 +353,29 @@ def build_search_terms(category: str, df_columns: list[str]) -> list[str]:
         out.append(t)
     return out
 # -------------------------------------------------------------------
+# Every category the mappers can produce (used to pre-index columns)
+# -------------------------------------------------------------------
+def known_categories() -> list[str]:
+    """
+    All categories that map_place_to_category(ies) can return, plus the
+    generic fallback terms, deduplicated in a stable order.
+    """
+    out: list[str] = []
+    seen = set()
+    for cat in (
+        *CATEGORIES,
+        *TYPE_TO_CATEGORY.values(),
+        *BRAND_OVERRIDES.values(),
+        *DEFAULT_FALLBACK_TERMS,
+        *FALLBACK_KEYWORDS,
+    ):
+        if cat in seen:
+            continue
+        seen.add(cat)
+        out.append(cat)
+    return out
+
+# -------------------------------------------------------------------
 # 5. Example test runs
 # -------------------------------------------------------------------
 if __name__ == "__main__":
@@ -259,3 +392,6 @@ if __name__ == "__main__":
     ]
 
 
+    for name, types in examples:
+        brand_cat, default_cat = map_place_to_categories(name, types)
+        print(f"{name!r:28} {types} -> brand={brand_cat!r}, default={default_cat!r}")
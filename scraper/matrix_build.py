@@ -0,0 +1,611 @@
+"""
+Parallel, resumable rebuild of the rewards matrix from card pages.
+
+Stages:
+
+    fetch         (--urls) download missing pages into a cache directory,
+                  concurrently; pages already cached are reused
+    parse         extract the card name and its reward rows from each page,
+                  fanned out over a process pool
+    canonicalize  clean up category names and merge spelling variants
+    write         write the matrix CSV atomically (and optionally a snapshot)
+
+Pages are saved card pages (or local fixtures) in this shape:
+
+    <h1>Card Name</h1>
+    <table><tr><td>Dining</td><td>4x</td></tr> ...</table>
+    <ul><li>5% — Target</li> ...</ul>
+
+The card name is the first <h1> (else the <title>). A reward is a table row
+with a category cell and a rate cell ("4", "4%", "4x", "4 points"), or a list
+item like "5% — Target" / "3x on Dining". Rates are stored as stated; rows
+stating 0 (fees and the like) are skipped.
+
+Every parsed page is appended to a checkpoint file next to the output as
+soon as its worker finishes, keyed by path, size and mtime, so an
+interrupted run picks up where it stopped and edited pages are parsed again.
+The checkpoint is removed once the matrix has been written.
+
+Category names are canonicalized (Unicode NFC, curly quotes and odd spaces
+normalized, whitespace collapsed, footnote markers dropped, optional
+--aliases applied), and names that then differ only in case are merged into
+their most common spelling. A card listing the same category twice keeps the
+higher rate; a card found on two pages keeps the first page. Columns are
+written in sorted order and cards in page order, like the existing matrix.
+
+Usage:
+    python matrix_build.py pages/ -o card_rewards_matrix.csv [--workers 8] [--snapshot]
+    python matrix_build.py --urls card_urls.txt --cache page_cache/ -o card_rewards_matrix.csv
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from atomic_write import atomic_open
+
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+CHECKPOINT_VERSION = 1
+PAGE_PATTERNS = ("*.html", "*.htm")
+
+_RATE = r"(\d+(?:\.\d+)?)\s*(?:%|x|×|points?|pts?|miles?)?"
+_RATE_CELL_RE = re.compile(rf"^{_RATE}(?:\s*(?:back|cash\s*back))?$", re.IGNORECASE)
+_OFFER_RE = re.compile(
+    r"^(\d+(?:\.\d+)?)\s*(?:%|x|×|points?|pts?|miles?)\s*(?:back|cash\s*back)?\s*"
+    r"(?:—|–|-|:|\bon\b|\bat\b|\bfor\b)\s*(.+)$",
+    re.IGNORECASE,
+)
+_SPACES_RE = re.compile(r"\s+")
+_QUOTES = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ",
+})
+_FOOTNOTE_RE = re.compile(r"[\s*†‡¹²³⁴⁵⁶⁷⁸⁹⁰:]+$")
+
+
+class CardPage(NamedTuple):
+    """What one page says about one card."""
+
+    card_name: str
+    rewards: List[Tuple[str, float]]
+
+
+class PageResult(NamedTuple):
+    """A parsed page as recorded in the checkpoint."""
+
+    path: str
+    stamp: str
+    card_name: Optional[str]
+    rewards: List[Tuple[str, float]]
+    error: Optional[str] = None
+
+
+# -----------------------------------------------------------------------------
+# Canonicalization
+# -----------------------------------------------------------------------------
+
+def canonical_card_name(text: str) -> str:
+    """Card name with whitespace normalized (marks like ® are kept)."""
+    return _SPACES_RE.sub(" ", unicodedata.normalize("NFC", text).translate(_QUOTES)).strip()
+
+
+def canonical_column(text: str) -> str:
+    """Category name with quotes, whitespace and trailing footnote markers cleaned up."""
+    name = canonical_card_name(text)
+    return _FOOTNOTE_RE.sub("", name)
+
+
+def canonicalize_columns(
+    pages: Iterable[CardPage], aliases: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Maps every raw category name seen to its output column.
+
+    Names are cleaned with canonical_column and looked up in aliases; names
+    that still differ only in case become the most common spelling (ties go
+    to the first seen).
+
+    Args:
+        pages: Parsed pages, in page order
+        aliases: Optional cleaned name → column name overrides
+
+    Returns:
+        Raw category name → column name
+    """
+    aliases = {canonical_column(k): v for k, v in (aliases or {}).items()}
+    cleaned: Dict[str, str] = {}
+    spellings: Dict[str, Counter] = {}
+    for page in pages:
+        for raw, _ in page.rewards:
+            if raw in cleaned:
+                name = cleaned[raw]
+            else:
+                name = canonical_column(raw)
+                name = aliases.get(name, name)
+                cleaned[raw] = name
+            spellings.setdefault(name.casefold(), Counter())[name] += 1
+
+    # Counter preserves insertion order, so most_common breaks ties by first seen
+    chosen = {folded: counts.most_common(1)[0][0] for folded, counts in spellings.items()}
+    return {raw: chosen[name.casefold()] for raw, name in cleaned.items()}
+
+
+# -----------------------------------------------------------------------------
+# Parsing
+# -----------------------------------------------------------------------------
+
+class _CardPageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.h1: Optional[str] = None
+        self.title: Optional[str] = None
+        self.rewards: List[Tuple[str, float]] = []
+        self._capture: Optional[str] = None
+        self._text: List[str] = []
+        self._cells: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._item: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("h1", "title") and self._capture is None:
+            self._capture = tag
+            self._text = []
+        elif tag == "tr":
+            self._cells = []
+        elif tag in ("td", "th") and self._cells is not None:
+            self._cell = []
+        elif tag == "li":
+            self._item = []
+        elif tag == "br":
+            self.handle_data(" ")
+
+    def handle_endtag(self, tag):
+        if tag == self._capture:
+            text = "".join(self._text).strip()
+            if tag == "h1" and self.h1 is None and text:
+                self.h1 = text
+            elif tag == "title" and self.title is None and text:
+                self.title = text
+            self._capture = None
+        elif tag in ("td", "th") and self._cell is not None:
+            self._cells.append(_clean_text("".join(self._cell)))
+            self._cell = None
+        elif tag == "tr" and self._cells is not None:
+            self._add_row(self._cells)
+            self._cells = None
+        elif tag == "li" and self._item is not None:
+            match = _OFFER_RE.match(_clean_text("".join(self._item)))
+            if match and float(match.group(1)) > 0:
+                self.rewards.append((match.group(2), float(match.group(1))))
+            self._item = None
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._text.append(data)
+        if self._cell is not None:
+            self._cell.append(data)
+        if self._item is not None:
+            self._item.append(data)
+
+    def _add_row(self, cells: List[str]) -> None:
+        rate = None
+        category = None
+        for cell in cells:
+            match = _RATE_CELL_RE.match(cell) if rate is None else None
+            if match:
+                rate = float(match.group(1))
+            elif cell and category is None:
+                category = cell
+        # Zero rows are fees ("Foreign transaction fee / 0%"), not rewards
+        if rate and category is not None:
+            self.rewards.append((category, rate))
+
+
+def _clean_text(text: str) -> str:
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def parse_card_page(html: str) -> Optional[CardPage]:
+    """
+    Extracts the card name and reward rows from a card page.
+
+    Args:
+        html: Page source
+
+    Returns:
+        CardPage, or None if the page names no card
+    """
+    parser = _CardPageParser()
+    parser.feed(html)
+    parser.close()
+    name = parser.h1 or parser.title
+    if not name:
+        return None
+    return CardPage(canonical_card_name(name), parser.rewards)
+
+
+def page_stamp(path: str) -> str:
+    """Checkpoint key for a page's current contents (size and mtime)."""
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def parse_page_files(paths: List[str]) -> List[PageResult]:
+    """Parses a chunk of page files (the process pool's unit of work)."""
+    results = []
+    for path in paths:
+        try:
+            stamp = page_stamp(path)
+            with open(path, encoding="utf-8", errors="replace") as f:
+                page = parse_card_page(f.read())
+        except (OSError, ValueError) as exc:
+            results.append(PageResult(path, "", None, [], f"{type(exc).__name__}: {exc}"))
+            continue
+        if page is None:
+            results.append(PageResult(path, stamp, None, [], "no card name"))
+        else:
+            results.append(PageResult(path, stamp, page.card_name, page.rewards))
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Checkpoint
+# -----------------------------------------------------------------------------
+
+class Checkpoint:
+    """
+    Append-only JSONL record of parsed pages.
+
+    Args:
+        path: Checkpoint file (created if missing)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, PageResult] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted write
+                        continue
+                    if record.get("v") != CHECKPOINT_VERSION:
+                        continue
+                    result = PageResult(
+                        record["path"], record["stamp"], record["card"],
+                        [(c, r) for c, r in record["rewards"]], record.get("error"),
+                    )
+                    self.done[result.path] = result
+        self._file = open(path, "a", encoding="utf-8")
+
+    def get(self, path: str) -> Optional[PageResult]:
+        """The recorded result for a page, if the page hasn't changed since."""
+        result = self.done.get(path)
+        if result is None:
+            return None
+        try:
+            return result if result.stamp == page_stamp(path) else None
+        except OSError:
+            return None
+
+    def add(self, results: List[PageResult]) -> None:
+        for result in results:
+            self.done[result.path] = result
+            self._file.write(json.dumps({
+                "v": CHECKPOINT_VERSION,
+                "path": result.path,
+                "stamp": result.stamp,
+                "card": result.card_name,
+                "rewards": result.rewards,
+                "error": result.error,
+            }, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def remove(self) -> None:
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# -----------------------------------------------------------------------------
+# Fetching
+# -----------------------------------------------------------------------------
+
+def cache_path(cache_dir: str, url: str) -> str:
+    """Where a URL's page is kept in the cache directory."""
+    return os.path.join(cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest()[:20] + ".html")
+
+
+def fetch_pages(
+    urls: List[str], cache_dir: str, concurrency: int = 8, timeout: float = 30
+) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Downloads the pages missing from the cache directory.
+
+    Pages are written atomically, so an interrupted fetch never leaves a
+    partial page behind.
+
+    Args:
+        urls: Card page URLs, in output order
+        cache_dir: Page cache directory
+        concurrency: Downloads in flight
+        timeout: Per-request timeout in seconds
+
+    Returns:
+        (cached page paths in URL order, {"fetched", "cached", "failed"} counts)
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = [cache_path(cache_dir, url) for url in urls]
+    missing = [(url, path) for url, path in zip(urls, paths) if not os.path.exists(path)]
+    counts = {"fetched": 0, "cached": len(urls) - len(missing), "failed": 0}
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency + 2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    def fetch(item: Tuple[str, str]) -> bool:
+        url, path = item
+        try:
+            resp = session.get(url, timeout=timeout)
+            resp.raise_for_status()
+        except requests.RequestException as exc:
+            print(f"fetch failed: {url}: {exc}", file=sys.stderr)
+            return False
+        with atomic_open(path, "wb", prefix=".page-") as f:
+            f.write(resp.content)
+        return True
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="fetch") as pool:
+            for ok in pool.map(fetch, missing):
+                counts["fetched" if ok else "failed"] += 1
+    finally:
+        session.close()
+    return [path for path in paths if os.path.exists(path)], counts
+
+
+# -----------------------------------------------------------------------------
+# Pipeline
+# -----------------------------------------------------------------------------
+
+def list_pages(directory: str) -> List[str]:
+    """Page files in a directory, sorted by name (which sets the card order)."""
+    paths = set()
+    for pattern in PAGE_PATTERNS:
+        paths.update(glob.glob(os.path.join(directory, pattern)))
+    return sorted(paths)
+
+
+def _stage_stats(items: int, seconds: float, **extra: Any) -> Dict[str, Any]:
+    stats = {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "per_sec": round(items / seconds, 1) if seconds > 0 else None,
+    }
+    stats.update(extra)
+    return stats
+
+
+def _parse_all(
+    paths: List[str], checkpoint: Checkpoint, workers: int, chunk_size: int
+) -> Tuple[Dict[str, PageResult], int]:
+    """Parses the pages not in the checkpoint; returns results and the resumed count."""
+    results: Dict[str, PageResult] = {}
+    todo = []
+    for path in paths:
+        recorded = checkpoint.get(path)
+        if recorded is not None:
+            results[path] = recorded
+        else:
+            todo.append(path)
+    resumed = len(results)
+    chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+
+    if workers <= 1:
+        for chunk in chunks:
+            done = parse_page_files(chunk)
+            checkpoint.add(done)
+            results.update((r.path, r) for r in done)
+        return results, resumed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: set = set()
+        queue = iter(chunks)
+        while True:
+            # Keep a bounded number of chunks in flight; checkpoint each one
+            # as soon as it finishes, in whatever order that happens
+            for chunk in queue:
+                pending.add(pool.submit(parse_page_files, chunk))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.discard(future)
+                done = future.result()
+                checkpoint.add(done)
+                results.update((r.path, r) for r in done)
+    return results, resumed
+
+
+def build_matrix(
+    paths: List[str],
+    output_path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 16,
+    aliases: Optional[Dict[str, str]] = None,
+    checkpoint_path: Optional[str] = None,
+    keep_checkpoint: bool = False,
+    snapshot: bool = False,
+) -> Dict[str, Any]:
+    """
+    Builds the rewards matrix CSV from card pages.
+
+    Args:
+        paths: Page files, in output card order
+        output_path: Matrix CSV to write
+        workers: Parser processes (defaults to the CPU count; 0 or 1 parses in-process)
+        chunk_size: Pages per work unit
+        aliases: Optional category name → column name overrides
+        checkpoint_path: Checkpoint file (defaults to the output path plus
+            CHECKPOINT_SUFFIX)
+        keep_checkpoint: Keep the checkpoint after a successful write
+        snapshot: Also compile a binary snapshot next to the CSV
+
+    Returns:
+        Per-stage stats plus card/column counts and pages that failed to parse
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if checkpoint_path is None:
+        checkpoint_path = output_path + CHECKPOINT_SUFFIX
+    stats: Dict[str, Any] = {"stages": {}}
+
+    start = time.perf_counter()
+    checkpoint = Checkpoint(checkpoint_path)
+    try:
+        results, resumed = _parse_all(paths, checkpoint, workers, max(1, chunk_size))
+    except BaseException:
+        checkpoint.close()
+        raise
+    failed = [
+        {"path": path, "error": results[path].error}
+        for path in paths if results[path].error is not None
+    ]
+    stats["stages"]["parse"] = _stage_stats(
+        len(paths) - resumed, time.perf_counter() - start,
+        resumed=resumed, failed=len(failed), workers=workers,
+    )
+
+    start = time.perf_counter()
+    pages: List[CardPage] = []
+    seen_cards = set()
+    duplicate_cards = 0
+    for path in paths:
+        result = results[path]
+        if result.card_name is None:
+            continue
+        if result.card_name in seen_cards:
+            duplicate_cards += 1
+            continue
+        seen_cards.add(result.card_name)
+        pages.append(CardPage(result.card_name, result.rewards))
+    column_of = canonicalize_columns(pages, aliases)
+    columns = sorted(set(column_of.values()))
+    rows: List[Dict[str, float]] = []
+    for page in pages:
+        rates: Dict[str, float] = {}
+        for raw, rate in page.rewards:
+            column = column_of[raw]
+            rates[column] = max(rate, rates.get(column, rate))
+        rows.append(rates)
+    stats["stages"]["canonicalize"] = _stage_stats(
+        len(column_of), time.perf_counter() - start,
+        columns=len(columns), duplicate_cards=duplicate_cards,
+    )
+
+    start = time.perf_counter()
+    write_matrix_csv(output_path, [page.card_name for page in pages], columns, rows)
+    if snapshot:
+        from matrix_snapshot import build_snapshot
+
+        stats["snapshot"] = build_snapshot(output_path)
+    stats["stages"]["write"] = _stage_stats(len(pages), time.perf_counter() - start)
+
+    if keep_checkpoint:
+        checkpoint.close()
+    else:
+        checkpoint.remove()
+    stats["output"] = output_path
+    stats["cards"] = len(pages)
+    stats["columns"] = len(columns)
+    stats["failed"] = failed
+    return stats
+
+
+def write_matrix_csv(
+    path: str, card_names: List[str], columns: List[str], rows: List[Dict[str, float]]
+) -> None:
+    """Writes the matrix CSV atomically ("Card Name" first, 0.0 for missing rates)."""
+    with atomic_open(path, "w", prefix=".matrix-", suffix=".csv", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["Card Name", *columns])
+        for name, rates in zip(card_names, rows):
+            writer.writerow([name, *(float(rates.get(col, 0.0)) for col in columns)])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the rewards matrix from card pages.")
+    parser.add_argument("pages", nargs="?", help="directory of saved card pages")
+    parser.add_argument("-o", "--output", default="card_rewards_matrix.csv")
+    parser.add_argument("--urls", help="file of card page URLs (one per line) to fetch into --cache")
+    parser.add_argument("--cache", default="page_cache", help="page cache directory for --urls")
+    parser.add_argument("--fetch-concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="pages per work unit")
+    parser.add_argument("--aliases", help="JSON object of category name → column name")
+    parser.add_argument("--checkpoint", help=f"checkpoint file (default: OUTPUT{CHECKPOINT_SUFFIX})")
+    parser.add_argument("--keep-checkpoint", action="store_true")
+    parser.add_argument("--snapshot", action="store_true", help="also build a .cgrm snapshot")
+    parser.add_argument("--stats", help="write the stats JSON here as well")
+    args = parser.parse_args(argv)
+
+    if bool(args.pages) == bool(args.urls):
+        parser.error("give either a pages directory or --urls")
+
+    fetch_stats = None
+    if args.urls:
+        with open(args.urls, encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        start = time.perf_counter()
+        paths, counts = fetch_pages(urls, args.cache, args.fetch_concurrency)
+        fetch_stats = _stage_stats(counts["fetched"], time.perf_counter() - start, **counts)
+    else:
+        paths = list_pages(args.pages)
+    if not paths:
+        print("No pages to parse.", file=sys.stderr)
+        return 1
+
+    aliases = None
+    if args.aliases:
+        with open(args.aliases, encoding="utf-8") as f:
+            aliases = json.load(f)
+
+    stats = build_matrix(
+        paths, args.output, args.workers, args.chunk_size, aliases,
+        args.checkpoint, args.keep_checkpoint, args.snapshot,
+    )
+    if fetch_stats is not None:
+        stats["stages"] = {"fetch": fetch_stats, **stats["stages"]}
+    text = json.dumps(stats, indent=2, ensure_ascii=False)
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
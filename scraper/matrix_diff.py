@@ -0,0 +1,374 @@
+"""
+Card- and column-level diffs between two rewards matrix versions.
+
+diff_matrices compares two loaded matrices and returns a MatrixDiff:
+added/removed cards (with the added cards' rates), added/removed columns,
+and the individual cells whose rate changed. apply_diff patches a loaded
+RewardsMatrix in place, so a long-running process can take a rate update
+without a cold reload: the sparse arrays are rebuilt (snapshot-backed
+arrays are read-only and are never written to), the category index is kept
+when the columns didn't change, and any watchers of the matrix (such as
+ranking.RankingCache) are told exactly what changed so they can drop only
+the affected entries.
+
+Card and column order matter (ranking ties keep matrix order, and offer
+text ties keep column order), so a diff also records where added entries
+go, or the full order when existing entries were reordered. Applying
+diff_matrices(a, b) to a yields a matrix with the same content_hash as b.
+
+Usage:
+    python matrix_diff.py diff old.csv new.csv [-o patch.json]
+    python matrix_diff.py apply base.csv patch.json -o patched.cgrm
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from rewards_matrix import MatrixContents, RewardsMatrix, content_hash, load_matrix
+from sparse_rates import SparseRates
+
+# card → column → (old rate, new rate); 0 means "no offer"
+CellChanges = Dict[str, Dict[str, Tuple[float, float]]]
+
+
+class MatrixDiff(NamedTuple):
+    """Differences that turn one matrix version into another."""
+
+    base_hash: str
+    result_hash: str
+    cards_added: Dict[str, Dict[str, float]]  # name → non-zero rates
+    cards_removed: List[str]
+    columns_added: List[str]
+    columns_removed: List[str]
+    cells: CellChanges
+    # Final order: positions of added entries, or the full order if reordered
+    card_positions: Dict[str, int]
+    column_positions: Dict[str, int]
+    card_order: Optional[List[str]] = None
+    column_order: Optional[List[str]] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.base_hash == self.result_hash
+
+    @property
+    def cards_changed(self) -> List[str]:
+        """Existing cards with at least one changed rate."""
+        return list(self.cells)
+
+    @property
+    def columns_changed(self) -> List[str]:
+        """Columns touched by any cell change."""
+        seen: Dict[str, None] = {}
+        for changes in self.cells.values():
+            for col in changes:
+                seen.setdefault(col, None)
+        return list(seen)
+
+    @property
+    def reshaped(self) -> bool:
+        """True if columns were added, removed or reordered."""
+        return bool(self.columns_added or self.columns_removed or self.column_order)
+
+    def changelog(self) -> List[str]:
+        """Human-readable lines describing the diff."""
+        lines = []
+        for col in self.columns_added:
+            lines.append(f"+ column {col!r}")
+        for col in self.columns_removed:
+            lines.append(f"- column {col!r}")
+        for name, rates in self.cards_added.items():
+            lines.append(f"+ card {name!r} ({len(rates)} rates)")
+        for name in self.cards_removed:
+            lines.append(f"- card {name!r}")
+        for name, changes in self.cells.items():
+            parts = [f"{col}: {_fmt(old)} → {_fmt(new)}" for col, (old, new) in changes.items()]
+            lines.append(f"~ card {name!r}: " + "; ".join(parts))
+        if self.card_order is not None:
+            lines.append("~ card order changed")
+        if self.column_order is not None:
+            lines.append("~ column order changed")
+        return lines
+
+    def to_dict(self) -> Dict:
+        return {
+            "base_hash": self.base_hash,
+            "result_hash": self.result_hash,
+            "cards_added": self.cards_added,
+            "cards_removed": self.cards_removed,
+            "columns_added": self.columns_added,
+            "columns_removed": self.columns_removed,
+            "cells": [
+                [name, col, old, new]
+                for name, changes in self.cells.items()
+                for col, (old, new) in changes.items()
+            ],
+            "card_positions": self.card_positions,
+            "column_positions": self.column_positions,
+            "card_order": self.card_order,
+            "column_order": self.column_order,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MatrixDiff":
+        cells: CellChanges = {}
+        for name, col, old, new in data["cells"]:
+            cells.setdefault(name, {})[col] = (float(old), float(new))
+        return cls(
+            data["base_hash"],
+            data["result_hash"],
+            {name: dict(rates) for name, rates in data["cards_added"].items()},
+            list(data["cards_removed"]),
+            list(data["columns_added"]),
+            list(data["columns_removed"]),
+            cells,
+            dict(data["card_positions"]),
+            dict(data["column_positions"]),
+            data.get("card_order"),
+            data.get("column_order"),
+        )
+
+
+class PatchResult(NamedTuple):
+    """What apply_diff did."""
+
+    version: int
+    cells_changed: int
+    cards_added: int
+    cards_removed: int
+    columns_added: int
+    columns_removed: int
+    # Cached rankings dropped by watchers of the matrix
+    invalidated: int
+    changelog: List[str]
+
+
+def _fmt(rate: float) -> str:
+    return str(int(rate)) if rate == int(rate) else repr(rate)
+
+
+def _card_rows(matrix: MatrixContents) -> Dict[str, Dict[str, float]]:
+    """name → {column: rate} for every card's non-zero rates."""
+    if len(matrix._card_index) != len(matrix.card_names):
+        raise ValueError("Matrix has duplicate card names; diffs are keyed by name.")
+    rows = {}
+    columns = matrix.columns
+    for i, name in enumerate(matrix.card_names):
+        cols, vals = matrix.sparse.row(i)
+        rows[name] = {columns[j]: rate for j, rate in zip(cols.tolist(), vals.tolist())}
+    return rows
+
+
+def _order_changes(
+    old: List[str], new: List[str], removed: set, added: set
+) -> Tuple[Dict[str, int], Optional[List[str]]]:
+    """Positions of added entries, or the full order if retained ones moved."""
+    retained_old = [x for x in old if x not in removed]
+    retained_new = [x for x in new if x not in added]
+    if retained_old != retained_new:
+        return {}, list(new)
+    return {x: i for i, x in enumerate(new) if x in added}, None
+
+
+def diff_matrices(old: RewardsMatrix, new: RewardsMatrix) -> MatrixDiff:
+    """
+    Computes the changes from old to new.
+
+    Args:
+        old: Matrix currently loaded
+        new: Updated matrix
+
+    Returns:
+        MatrixDiff that apply_diff can replay on old (or an identical copy)
+    """
+    old, new = old.contents, new.contents
+    old_rows = _card_rows(old)
+    new_rows = _card_rows(new)
+    old_cols = set(old.columns)
+    new_cols = set(new.columns)
+    columns_added = [c for c in new.columns if c not in old_cols]
+    columns_removed = [c for c in old.columns if c not in new_cols]
+    cards_added = {n: new_rows[n] for n in new.card_names if n not in old_rows}
+    cards_removed = [n for n in old.card_names if n not in new_rows]
+
+    cells: CellChanges = {}
+    for name in old.card_names:
+        after = new_rows.get(name)
+        if after is None:
+            continue
+        before = {c: r for c, r in old_rows[name].items() if c in new_cols}
+        changes = {}
+        for col in new.columns:
+            b, a = before.get(col, 0.0), after.get(col, 0.0)
+            if b != a:
+                changes[col] = (b, a)
+        if changes:
+            cells[name] = changes
+
+    card_positions, card_order = _order_changes(
+        old.card_names, new.card_names, set(cards_removed), set(cards_added)
+    )
+    column_positions, column_order = _order_changes(
+        old.columns, new.columns, set(columns_removed), set(columns_added)
+    )
+    return MatrixDiff(
+        old.content_hash,
+        new.content_hash,
+        cards_added,
+        cards_removed,
+        columns_added,
+        columns_removed,
+        cells,
+        card_positions,
+        column_positions,
+        card_order,
+        column_order,
+    )
+
+
+def _apply_order(
+    current: List[str], removed: set, positions: Dict[str, int], order: Optional[List[str]]
+) -> List[str]:
+    if order is not None:
+        return list(order)
+    result = [x for x in current if x not in removed]
+    for name, position in sorted(positions.items(), key=lambda item: item[1]):
+        result.insert(position, name)
+    return result
+
+
+def apply_diff(matrix: RewardsMatrix, diff: MatrixDiff, check: bool = True) -> PatchResult:
+    """
+    Patches a loaded matrix in place.
+
+    Args:
+        matrix: Matrix to update (must match diff.base_hash when check is set)
+        diff: Changes from diff_matrices or MatrixDiff.from_dict
+        check: Verify the matrix's content hash before and after patching
+
+    Returns:
+        PatchResult with counts and the change log
+
+    Raises:
+        ValueError: If the matrix isn't the diff's base version, or the
+            patched result doesn't hash to diff.result_hash
+    """
+    with matrix._lock:
+        base = matrix.contents
+        if check and base.content_hash != diff.base_hash:
+            raise ValueError(
+                f"Matrix content {base.content_hash} is not the diff's base {diff.base_hash}."
+            )
+        rows = _card_rows(base)
+        removed_cols = set(diff.columns_removed)
+        for name in diff.cards_removed:
+            rows.pop(name, None)
+        if removed_cols:
+            for rates in rows.values():
+                for col in removed_cols.intersection(rates):
+                    del rates[col]
+        for name, changes in diff.cells.items():
+            rates = rows[name]
+            for col, (_, new) in changes.items():
+                if new:
+                    rates[col] = new
+                else:
+                    rates.pop(col, None)
+        for name, rates in diff.cards_added.items():
+            rows[name] = dict(rates)
+
+        card_names = _apply_order(
+            base.card_names, set(diff.cards_removed), diff.card_positions, diff.card_order
+        )
+        columns = _apply_order(
+            base.columns, removed_cols, diff.column_positions, diff.column_order
+        )
+        column_index = {col: j for j, col in enumerate(columns)}
+
+        # Rebuild the CSR arrays (fresh, writable arrays; never the mmap)
+        counts = np.zeros(len(card_names) + 1, dtype=np.int64)
+        indices: List[int] = []
+        data: List[float] = []
+        for i, name in enumerate(card_names):
+            entries = sorted(
+                (column_index[col], rate) for col, rate in rows[name].items() if rate != 0
+            )
+            counts[i + 1] = len(entries)
+            indices.extend(j for j, _ in entries)
+            data.extend(rate for _, rate in entries)
+        sparse = SparseRates(
+            (len(card_names), len(columns)),
+            np.cumsum(counts),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(data, dtype=np.float64),
+        )
+
+        # Verify before swapping, so a rejected patch leaves the matrix untouched
+        patched_hash = content_hash(card_names, columns, sparse)
+        if check and patched_hash != diff.result_hash:
+            raise ValueError(
+                f"Patched matrix hashes to {patched_hash}, expected {diff.result_hash}."
+            )
+
+        matrix._set_data(
+            card_names, columns, sparse, content_hash=patched_hash,
+            category_index=base._category_index if not diff.reshaped else None,
+        )
+        old_version, new_version = base.version, matrix.version
+
+    invalidated = 0
+    for watcher in list(matrix._watchers):
+        invalidated += watcher.matrix_patched(diff, old_version, new_version)
+
+    return PatchResult(
+        new_version,
+        sum(len(changes) for changes in diff.cells.values()),
+        len(diff.cards_added),
+        len(diff.cards_removed),
+        len(diff.columns_added),
+        len(diff.columns_removed),
+        invalidated,
+        diff.changelog(),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Diff and patch rewards matrices.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    diff_cmd = sub.add_parser("diff", help="compute the changes between two matrices")
+    diff_cmd.add_argument("old")
+    diff_cmd.add_argument("new")
+    diff_cmd.add_argument("-o", "--output", help="write the patch as JSON")
+    apply_cmd = sub.add_parser("apply", help="apply a JSON patch and write a snapshot")
+    apply_cmd.add_argument("base")
+    apply_cmd.add_argument("patch")
+    apply_cmd.add_argument("-o", "--output", required=True, help="snapshot to write")
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        diff = diff_matrices(RewardsMatrix.from_file(args.old), RewardsMatrix.from_file(args.new))
+        for line in diff.changelog():
+            print(line)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(diff.to_dict(), f, ensure_ascii=False, indent=1)
+        return 0
+
+    from matrix_snapshot import write_snapshot
+
+    matrix = load_matrix(args.base)
+    with open(args.patch, encoding="utf-8") as f:
+        diff = MatrixDiff.from_dict(json.load(f))
+    result = apply_diff(matrix, diff)
+    write_snapshot(matrix, args.output)
+    sys.stdout.write("\n".join(result.changelog) + "\n")
+    print(f"Wrote {args.output} (content hash {matrix.content_hash})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
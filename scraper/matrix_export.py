@@ -0,0 +1,463 @@
+"""
+Export the rewards matrix into the normalized card_reward_matrix table.
+
+supabase/migrations/0003_recommendations_matrix_settings.sql stores the
+matrix as one row per (card_name, category_name) with a NUMERIC multiplier.
+This module turns a RewardsMatrix (CSV or snapshot, parsed with the same
+parse_rate rules the ranking code uses) into that shape, streaming only the
+non-zero cells:
+
+- format "copy": a psql script that COPYs the cells into a temporary
+  staging table and upserts from it in one statement (fastest for a full
+  load; with prune, rows no longer in the matrix are deleted too)
+- format "upsert": batched multi-row INSERT ... ON CONFLICT statements, for
+  clients that can't run COPY
+- load_sqlite / load_postgres: apply directly to a database (SQLite works
+  as a local stand-in with the same table shape and upsert semantics)
+
+Diff mode (base matrix given) emits only what changed between two matrix
+versions: upserts for new or changed cells, and deletes for cells that
+became zero, removed cards and removed columns.
+
+Card names must be unique in the table, so a card name repeated in the
+matrix is exported once (its first row, like RewardsMatrix.row_for).
+
+Usage:
+    python matrix_export.py card_rewards_matrix.csv -o matrix.sql
+    python matrix_export.py new.csv --base old.csv --format upsert -o changes.sql
+    python matrix_export.py card_rewards_matrix.csv --sqlite local.db [--prune]
+    python matrix_export.py card_rewards_matrix.csv --postgres "$DATABASE_URL"
+"""
+
+import argparse
+import sqlite3
+import sys
+from typing import IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from matrix_diff import diff_matrices
+from rewards_matrix import RewardsMatrix
+
+TABLE = "public.card_reward_matrix"
+COLUMNS = ("card_name", "category_name", "multiplier")
+DEFAULT_BATCH_SIZE = 1000
+
+# (card_name, category_name, multiplier)
+Cell = Tuple[str, str, float]
+
+
+class Delete(NamedTuple):
+    """Rows to delete: one cell, every row of a card, or every row of a category."""
+
+    card_name: Optional[str]
+    category_name: Optional[str]
+
+
+class ExportCounts(NamedTuple):
+    upserted: int
+    deleted: int
+
+
+def format_multiplier(rate: float) -> str:
+    """NUMERIC literal for a rate (whole numbers without a decimal point)."""
+    return str(int(rate)) if rate == int(rate) else repr(rate)
+
+
+def iter_cells(matrix: RewardsMatrix) -> Iterator[Cell]:
+    """Non-zero cells in matrix order (first row only for repeated card names)."""
+    columns = matrix.columns
+    for i, name in enumerate(matrix.card_names):
+        if matrix.row_for(name) != i:
+            continue
+        cols, vals = matrix.sparse.row(i)
+        for j, rate in zip(cols.tolist(), vals.tolist()):
+            if rate != 0:
+                yield (name, columns[j], rate)
+
+
+def diff_cells(old: RewardsMatrix, new: RewardsMatrix) -> Tuple[List[Cell], List[Delete]]:
+    """
+    Changes that turn old's exported rows into new's.
+
+    Returns:
+        (cells to upsert, rows to delete)
+    """
+    diff = diff_matrices(old, new)
+    deletes = [Delete(None, col) for col in diff.columns_removed]
+    deletes += [Delete(name, None) for name in diff.cards_removed]
+    upserts: List[Cell] = []
+    for name, changes in diff.cells.items():
+        for col, (_, rate) in changes.items():
+            if rate != 0:
+                upserts.append((name, col, rate))
+            else:
+                deletes.append(Delete(name, col))
+    for name, rates in diff.cards_added.items():
+        upserts.extend((name, col, rate) for col, rate in rates.items() if rate != 0)
+    return upserts, deletes
+
+
+# -----------------------------------------------------------------------------
+# SQL text
+# -----------------------------------------------------------------------------
+
+def _copy_field(value: str) -> str:
+    """Escapes a value for COPY's text format."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _delete_sql(delete: Delete, table: str) -> str:
+    conditions = []
+    if delete.card_name is not None:
+        conditions.append(f"card_name = {_literal(delete.card_name)}")
+    if delete.category_name is not None:
+        conditions.append(f"category_name = {_literal(delete.category_name)}")
+    return f"DELETE FROM {table} WHERE {' AND '.join(conditions)};\n"
+
+
+_UPSERT_TAIL = (
+    "ON CONFLICT (card_name, category_name) DO UPDATE SET multiplier = EXCLUDED.multiplier\n"
+    "WHERE {table}.multiplier IS DISTINCT FROM EXCLUDED.multiplier;\n"
+)
+
+
+def write_copy(
+    cells: Iterable[Cell],
+    out: IO[str],
+    deletes: Iterable[Delete] = (),
+    prune: bool = False,
+    table: str = TABLE,
+) -> ExportCounts:
+    """
+    Writes a psql script: COPY into a staging table, then one upsert.
+
+    Args:
+        cells: Cells to upsert (streamed)
+        out: Text stream to write to
+        deletes: Rows to delete first (diff mode)
+        prune: Also delete table rows that aren't in cells (full loads only)
+        table: Target table
+
+    Returns:
+        Counts of cells written and delete statements
+    """
+    deleted = 0
+    out.write("BEGIN;\n")
+    for delete in deletes:
+        out.write(_delete_sql(delete, table))
+        deleted += 1
+    out.write(
+        "CREATE TEMP TABLE card_reward_matrix_stage "
+        "(card_name TEXT NOT NULL, category_name TEXT NOT NULL, multiplier NUMERIC NOT NULL) "
+        "ON COMMIT DROP;\n"
+    )
+    out.write(f"COPY card_reward_matrix_stage ({', '.join(COLUMNS)}) FROM stdin;\n")
+    upserted = 0
+    for card, category, rate in cells:
+        out.write(f"{_copy_field(card)}\t{_copy_field(category)}\t{format_multiplier(rate)}\n")
+        upserted += 1
+    out.write("\\.\n")
+    out.write(
+        f"INSERT INTO {table} ({', '.join(COLUMNS)})\n"
+        f"SELECT {', '.join(COLUMNS)} FROM card_reward_matrix_stage\n"
+        + _UPSERT_TAIL.format(table=table.rsplit(".", 1)[-1])
+    )
+    if prune:
+        out.write(
+            f"DELETE FROM {table} AS m WHERE NOT EXISTS (SELECT 1 FROM card_reward_matrix_stage s "
+            "WHERE s.card_name = m.card_name AND s.category_name = m.category_name);\n"
+        )
+    out.write("COMMIT;\n")
+    return ExportCounts(upserted, deleted)
+
+
+def write_upserts(
+    cells: Iterable[Cell],
+    out: IO[str],
+    deletes: Iterable[Delete] = (),
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    table: str = TABLE,
+) -> ExportCounts:
+    """
+    Writes batched multi-row INSERT ... ON CONFLICT statements.
+
+    Args:
+        cells: Cells to upsert (streamed)
+        out: Text stream to write to
+        deletes: Rows to delete first (diff mode)
+        batch_size: Rows per INSERT statement
+        table: Target table
+
+    Returns:
+        Counts of cells written and delete statements
+    """
+    deleted = 0
+    out.write("BEGIN;\n")
+    for delete in deletes:
+        out.write(_delete_sql(delete, table))
+        deleted += 1
+    upserted = 0
+    tail = _UPSERT_TAIL.format(table=table.rsplit(".", 1)[-1])
+    for batch in _batched(cells, batch_size):
+        values = ",\n".join(
+            f"({_literal(card)}, {_literal(category)}, {format_multiplier(rate)})"
+            for card, category, rate in batch
+        )
+        out.write(f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES\n{values}\n{tail}")
+        upserted += len(batch)
+    out.write("COMMIT;\n")
+    return ExportCounts(upserted, deleted)
+
+
+def _batched(cells: Iterable[Cell], size: int) -> Iterator[List[Cell]]:
+    batch: List[Cell] = []
+    for cell in cells:
+        batch.append(cell)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------------------------------------------------------
+# Direct loads
+# -----------------------------------------------------------------------------
+
+SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS {table} ("
+    "card_name TEXT NOT NULL, category_name TEXT NOT NULL, multiplier NUMERIC NOT NULL, "
+    "created_at TEXT DEFAULT CURRENT_TIMESTAMP NOT NULL, "
+    "updated_at TEXT DEFAULT CURRENT_TIMESTAMP NOT NULL, "
+    "UNIQUE (card_name, category_name))"
+)
+
+
+def _delete_params(delete: Delete) -> Tuple[str, Tuple[str, ...]]:
+    conditions, params = [], []
+    if delete.card_name is not None:
+        conditions.append("card_name = ?")
+        params.append(delete.card_name)
+    if delete.category_name is not None:
+        conditions.append("category_name = ?")
+        params.append(delete.category_name)
+    return " AND ".join(conditions), tuple(params)
+
+
+def load_sqlite(
+    db_path: str,
+    cells: Iterable[Cell],
+    deletes: Iterable[Delete] = (),
+    prune: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    table: str = TABLE,
+) -> ExportCounts:
+    """
+    Applies cells and deletes to a SQLite card_reward_matrix table.
+
+    The table is created with the migration's columns if it doesn't exist.
+    Everything happens in one transaction. SQLite has no schemas, so a
+    schema prefix on table ("public.") is dropped.
+
+    Args:
+        db_path: SQLite database file
+        cells: Cells to upsert (streamed in batches)
+        deletes: Rows to delete first (diff mode)
+        prune: Also delete rows that aren't in cells (full loads only)
+        batch_size: Rows per executemany call
+        table: Target table
+
+    Returns:
+        Counts of cells upserted and rows deleted
+    """
+    table = table.rsplit(".", 1)[-1]
+    db = sqlite3.connect(db_path)
+    try:
+        with db:
+            db.execute(SQLITE_SCHEMA.format(table=table))
+            deleted = 0
+            for delete in deletes:
+                where, params = _delete_params(delete)
+                deleted += db.execute(f"DELETE FROM {table} WHERE {where}", params).rowcount
+            if prune:
+                db.execute(
+                    "CREATE TEMP TABLE card_reward_matrix_stage "
+                    "(card_name TEXT, category_name TEXT, PRIMARY KEY (card_name, category_name))"
+                )
+            upserted = 0
+            for batch in _batched(cells, batch_size):
+                db.executemany(
+                    f"INSERT INTO {table} (card_name, category_name, multiplier) "
+                    "VALUES (?, ?, ?) ON CONFLICT (card_name, category_name) DO UPDATE SET "
+                    "multiplier = excluded.multiplier, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE multiplier IS NOT excluded.multiplier",
+                    batch,
+                )
+                if prune:
+                    db.executemany(
+                        "INSERT OR IGNORE INTO card_reward_matrix_stage VALUES (?, ?)",
+                        [(card, category) for card, category, _ in batch],
+                    )
+                upserted += len(batch)
+            if prune:
+                deleted += db.execute(
+                    f"DELETE FROM {table} WHERE NOT EXISTS ("
+                    "SELECT 1 FROM card_reward_matrix_stage s WHERE "
+                    f"s.card_name = {table}.card_name AND "
+                    f"s.category_name = {table}.category_name)"
+                ).rowcount
+                db.execute("DROP TABLE card_reward_matrix_stage")
+    finally:
+        db.close()
+    return ExportCounts(upserted, deleted)
+
+
+class _Lines:
+    """File-like view of an iterator of text lines (for COPY FROM STDIN)."""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def load_postgres(
+    dsn: str,
+    cells: Iterable[Cell],
+    deletes: Iterable[Delete] = (),
+    prune: bool = False,
+    table: str = TABLE,
+) -> ExportCounts:
+    """
+    Applies cells and deletes to Postgres with COPY (requires psycopg or psycopg2).
+
+    Args:
+        dsn: Connection string
+        cells: Cells to upsert (streamed through COPY)
+        deletes: Rows to delete first (diff mode)
+        prune: Also delete rows that aren't in cells (full loads only)
+        table: Target table
+
+    Returns:
+        Counts of cells upserted and rows deleted
+    """
+    try:
+        import psycopg
+    except ImportError:
+        psycopg = None
+        try:
+            import psycopg2
+        except ImportError as exc:
+            raise RuntimeError(
+                "Postgres export requires psycopg (pip install 'psycopg[binary]')."
+            ) from exc
+
+    counted = [0]
+
+    def copy_lines() -> Iterator[str]:
+        for card, category, rate in cells:
+            counted[0] += 1
+            yield f"{_copy_field(card)}\t{_copy_field(category)}\t{format_multiplier(rate)}\n"
+
+    conn = psycopg.connect(dsn) if psycopg is not None else psycopg2.connect(dsn)
+    try:
+        with conn:
+            cur = conn.cursor()
+            deleted = 0
+            for delete in deletes:
+                where, params = _delete_params(delete)
+                cur.execute(f"DELETE FROM {table} WHERE {where.replace('?', '%s')}", params)
+                deleted += cur.rowcount
+            cur.execute(
+                "CREATE TEMP TABLE card_reward_matrix_stage "
+                "(card_name TEXT NOT NULL, category_name TEXT NOT NULL, multiplier NUMERIC NOT NULL) "
+                "ON COMMIT DROP"
+            )
+            copy_sql = f"COPY card_reward_matrix_stage ({', '.join(COLUMNS)}) FROM STDIN"
+            if psycopg is not None:
+                with cur.copy(copy_sql) as copy:
+                    for line in copy_lines():
+                        copy.write(line)
+            else:
+                cur.copy_expert(copy_sql, _Lines(copy_lines()))
+            cur.execute(
+                f"INSERT INTO {table} ({', '.join(COLUMNS)}) "
+                f"SELECT {', '.join(COLUMNS)} FROM card_reward_matrix_stage "
+                + _UPSERT_TAIL.format(table=table.rsplit(".", 1)[-1]).rstrip(";\n")
+            )
+            if prune:
+                cur.execute(
+                    f"DELETE FROM {table} AS m WHERE NOT EXISTS (SELECT 1 FROM "
+                    "card_reward_matrix_stage s WHERE s.card_name = m.card_name "
+                    "AND s.category_name = m.category_name)"
+                )
+                deleted += cur.rowcount
+    finally:
+        conn.close()
+    return ExportCounts(counted[0], deleted)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Export the rewards matrix into the card_reward_matrix table."
+    )
+    parser.add_argument("matrix", help="rewards matrix CSV or snapshot")
+    parser.add_argument("--base", help="previous matrix version: export only the changes")
+    parser.add_argument("--format", choices=("copy", "upsert"), default="copy")
+    parser.add_argument("-o", "--output", help="SQL file to write (default stdout)")
+    parser.add_argument("--sqlite", help="apply to this SQLite database instead")
+    parser.add_argument("--postgres", metavar="DSN", help="apply to Postgres instead")
+    parser.add_argument("--prune", action="store_true", help="delete rows not in the matrix")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--table", default=TABLE)
+    args = parser.parse_args(argv)
+    if args.base and args.prune:
+        parser.error("--prune only applies to full exports")
+
+    matrix = RewardsMatrix.from_file(args.matrix)
+    if args.base:
+        cells, deletes = diff_cells(RewardsMatrix.from_file(args.base), matrix)
+    else:
+        cells, deletes = iter_cells(matrix), []
+
+    if args.sqlite:
+        counts = load_sqlite(
+            args.sqlite, cells, deletes, args.prune, args.batch_size, args.table
+        )
+    elif args.postgres:
+        counts = load_postgres(args.postgres, cells, deletes, args.prune, args.table)
+    else:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            if args.format == "copy":
+                counts = write_copy(cells, out, deletes, args.prune, args.table)
+            else:
+                counts = write_upserts(cells, out, deletes, args.batch_size, args.table)
+        finally:
+            if args.output:
+                out.close()
+    print(f"{counts.upserted} cells upserted, {counts.deleted} deletes", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,280 @@
+"""
+Compact binary snapshot of the rewards matrix.
+
+Compiling card_rewards_matrix.csv once into a snapshot lets every worker
+process skip pandas and the per-cell rate regex: the sparse rate arrays are
+memory-mapped straight from the file, so processes share one page-cached copy
+and start up in milliseconds.
+
+Layout (little-endian):
+
+    offset 0   8s   magic b"CGRMSNAP"
+           8   u32  format version
+          12   u32  header length in bytes
+          16   u64  data offset (64-byte aligned)
+          24   u32  number of cards
+          28   u32  number of columns
+          32   ...  header JSON (card_names, columns, content_hash,
+                    source_sha256, and an "arrays" table of
+                    {name: {offset, dtype, shape}})
+    data offset     the arrays, each 64-byte aligned
+
+The arrays are the SparseRates CSR (indptr, indices, data) and per-column
+(col_indptr, col_rows, col_data) forms. Rates are stored as float64 rather
+than float32 so that rendered offer text ("1.1% — ...") stays byte-identical
+to the CSV path.
+
+Snapshots may also carry the precomputed rankings from ranking_tables.py:
+the ranking_indptr, ranking_rows and ranking_scores arrays plus a
+"ranking_tables" header section (candidate columns and offer texts per
+table). Readers that don't know about them skip them.
+
+Usage:
+    python matrix_snapshot.py build card_rewards_matrix.csv [-o card_rewards_matrix.cgrm]
+    python matrix_snapshot.py info card_rewards_matrix.cgrm
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from atomic_write import atomic_open
+
+MAGIC = b"CGRMSNAP"
+FORMAT_VERSION = 2
+SNAPSHOT_SUFFIX = ".cgrm"
+_PREAMBLE = struct.Struct("<8sIIQII")
+_ALIGN = 64
+
+# SparseRates attribute → on-disk dtype
+_SPARSE_ARRAYS = (
+    ("indptr", "<i8"),
+    ("indices", "<i4"),
+    ("data", "<f8"),
+    ("col_indptr", "<i8"),
+    ("col_rows", "<i4"),
+    ("col_data", "<f8"),
+)
+
+# Optional precomputed rankings (ranking_tables.RankingTables.to_arrays)
+_RANKING_ARRAYS = (
+    ("ranking_indptr", "<i8"),
+    ("ranking_rows", "<i4"),
+    ("ranking_scores", "<f8"),
+)
+
+
+def is_snapshot(path: str) -> bool:
+    """True if the file starts with the snapshot magic."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int, Tuple[int, int]]:
+    """
+    Reads a snapshot's header.
+
+    Returns:
+        (header dict, data offset, (n_cards, n_columns))
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise ValueError(f"{path} is too short to be a matrix snapshot.")
+        magic, version, header_len, data_offset, n_cards, n_cols = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a matrix snapshot.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {version} in {path}.")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    return header, data_offset, (n_cards, n_cols)
+
+
+def map_arrays(path: str, header: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Read-only views of every array in a snapshot, backed by one mmap."""
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = spec["offset"]
+        arrays[name] = (
+            buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        )
+    return arrays
+
+
+def read_snapshot_arrays(path: str):
+    """
+    Memory-maps a snapshot.
+
+    Returns:
+        (card_names, columns, rates, content_hash, ranking_tables) where
+        rates is a SparseRates whose arrays are read-only views over the file,
+        and ranking_tables is the (header section, arrays) pair for
+        RankingTables.from_arrays, or None if the snapshot has no rankings
+    """
+    from sparse_rates import SparseRates
+
+    header, _, shape = read_header(path)
+    arrays = map_arrays(path, header)
+    rates = SparseRates(shape, *(arrays[name] for name, _ in _SPARSE_ARRAYS))
+    section = header.get("ranking_tables")
+    tables = (section, arrays) if section is not None else None
+    return header["card_names"], header["columns"], rates, header.get("content_hash"), tables
+
+
+def load_snapshot(path: str):
+    """Loads a snapshot as a RewardsMatrix (mtime-tracked like a CSV)."""
+    from rewards_matrix import RewardsMatrix
+
+    return RewardsMatrix.from_file(path)
+
+
+def write_snapshot(
+    matrix, path: str, source_sha256: Optional[str] = None, ranking_tables: bool = True
+) -> None:
+    """
+    Writes a RewardsMatrix to a snapshot file atomically.
+
+    The file is written next to its destination and renamed into place, so
+    processes that already mapped the old snapshot keep a consistent view.
+
+    Args:
+        matrix: RewardsMatrix to serialize
+        path: Destination snapshot path
+        source_sha256: Optional hash of the CSV the matrix came from
+        ranking_tables: Precompute rankings for every known category and
+            store them (plus any tables the matrix already built)
+    """
+    sparse = matrix.sparse
+    arrays = [
+        (name, np.ascontiguousarray(getattr(sparse, name), dtype=dtype))
+        for name, dtype in _SPARSE_ARRAYS
+    ]
+    header: Dict[str, Any] = {
+        "card_names": matrix.card_names,
+        "columns": matrix.columns,
+        "content_hash": matrix.content_hash,
+        "source_sha256": source_sha256,
+        "arrays": {},
+    }
+    if ranking_tables:
+        tables = matrix.ranking_tables
+        tables.precompute()
+        section, table_arrays = tables.to_arrays()
+        header["ranking_tables"] = section
+        for name, dtype in _RANKING_ARRAYS:
+            arrays.append((name, np.ascontiguousarray(table_arrays[name], dtype=dtype)))
+
+    # Array offsets depend on the header length, which depends on the
+    # offsets; lay out relative offsets first, then shift until stable.
+    relative = []
+    position = 0
+    for name, arr in arrays:
+        relative.append(position)
+        position += arr.nbytes
+        position += -position % _ALIGN
+    data_offset = 0
+    while True:
+        for (name, arr), rel in zip(arrays, relative):
+            header["arrays"][name] = {
+                "offset": data_offset + rel,
+                "dtype": arr.dtype.str,
+                "shape": list(arr.shape),
+            }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        needed = _PREAMBLE.size + len(header_bytes)
+        needed += -needed % _ALIGN
+        if needed <= data_offset:
+            break
+        data_offset = needed
+    preamble = _PREAMBLE.pack(
+        MAGIC, FORMAT_VERSION, len(header_bytes), data_offset, *sparse.shape
+    )
+
+    with atomic_open(path, "wb", prefix=".snapshot-", suffix=SNAPSHOT_SUFFIX) as f:
+        f.write(preamble)
+        f.write(header_bytes)
+        f.write(b"\0" * (data_offset - _PREAMBLE.size - len(header_bytes)))
+        for (name, arr), rel in zip(arrays, relative):
+            f.write(b"\0" * (data_offset + rel - f.tell()))
+            f.write(arr.tobytes())
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_snapshot(
+    csv_path: str, out_path: Optional[str] = None, ranking_tables: bool = True
+) -> str:
+    """
+    Compiles a rewards matrix CSV into a snapshot.
+
+    Args:
+        csv_path: Source CSV
+        out_path: Destination (defaults to the CSV path with a .cgrm suffix)
+        ranking_tables: Also store precomputed per-category rankings
+
+    Returns:
+        Path of the written snapshot
+    """
+    from rewards_matrix import RewardsMatrix
+
+    if out_path is None:
+        out_path = os.path.splitext(csv_path)[0] + SNAPSHOT_SUFFIX
+    matrix = RewardsMatrix.from_file(csv_path)
+    write_snapshot(
+        matrix, out_path, source_sha256=file_sha256(csv_path), ranking_tables=ranking_tables
+    )
+    return out_path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect rewards matrix snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile a matrix CSV into a snapshot")
+    build.add_argument("csv_path")
+    build.add_argument("-o", "--output")
+    build.add_argument(
+        "--no-ranking-tables", action="store_true", help="skip precomputed rankings"
+    )
+    info = sub.add_parser("info", help="print a snapshot's header summary")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        out_path = build_snapshot(
+            args.csv_path, args.output, ranking_tables=not args.no_ranking_tables
+        )
+        print(f"Wrote {out_path} ({os.path.getsize(out_path)} bytes)")
+        return 0
+
+    header, data_offset, shape = read_header(args.path)
+    print(json.dumps({
+        "cards": shape[0],
+        "columns": shape[1],
+        "nonzero": header["arrays"]["data"]["shape"][0],
+        "data_offset": data_offset,
+        "content_hash": header.get("content_hash"),
+        "source_sha256": header.get("source_sha256"),
+        "ranking_tables": len(header.get("ranking_tables", {}).get("columns", [])),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""
+Offer text rendering with memoization.
+
+Offer text lists a card's matched reward columns, highest rate first (ties
+keep column order), as "4% — Restaurants | 1% — Everywhere". For matrix
+cards the pieces never change between calls, so OfferTextCache keeps:
+
+- per card: its non-zero offers, already sorted by rate and formatted, as
+  (column index, "X% — Column") pairs
+- per (card, matched column set): the rendered string, in a bounded LRU
+
+A matched column set is what a query's search terms resolve to (see
+rewards_matrix.CategoryColumnIndex), so every category spelling that
+resolves to the same columns shares an entry. Filtering the pre-sorted
+per-card list keeps the same order as sorting the matched offers, so the
+output is byte-identical to rendering from scratch.
+"""
+
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple
+
+# Rendered strings kept per matrix version
+DEFAULT_MAX_ENTRIES = 65536
+
+
+def format_offer(category: str, rate: float) -> str:
+    """Formats one offer as "X% — Category Name" (no trailing zeros)."""
+    # Format rate: remove trailing zeros if it's a whole number
+    if rate == int(rate):
+        rate_str = str(int(rate))
+    else:
+        rate_str = str(rate).rstrip("0").rstrip(".")
+    return f"{rate_str}% — {category}"
+
+
+@lru_cache(maxsize=256)
+def matching_columns(columns: Tuple[str, ...], terms: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Columns (in order) whose lowercased name contains any lowercased term.
+
+    Args:
+        columns: All column names
+        terms: Search terms
+
+    Returns:
+        Matching column names, "Card Name" excluded
+    """
+    lowered_terms = [term.lower() for term in terms]
+    return tuple(
+        col for col in columns
+        if col != "Card Name" and any(term in col.lower() for term in lowered_terms)
+    )
+
+
+class OfferTextCache:
+    """
+    Memoized offer text for the cards of one matrix version.
+
+    Args:
+        matrix: RewardsMatrix the texts are rendered from
+        max_entries: Maximum number of rendered strings kept (LRU)
+    """
+
+    def __init__(self, matrix, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.matrix = matrix
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._offers: Dict[int, List[Tuple[int, str]]] = {}
+        self._texts: "OrderedDict[Tuple[int, FrozenSet[int]], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def text(self, row: int, matched_columns: FrozenSet[int]) -> str:
+        """
+        Offer text for a matrix row restricted to the matched columns.
+
+        Args:
+            row: Row index of the card in the matrix
+            matched_columns: Column indices matched by the search terms
+
+        Returns:
+            Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+        """
+        if not matched_columns:
+            return ""
+        key = (row, matched_columns)
+        with self._lock:
+            text = self._texts.get(key)
+            if text is not None:
+                self._texts.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+
+        text = " | ".join(
+            formatted for j, formatted in self.offers(row) if j in matched_columns
+        )
+        with self._lock:
+            self._texts[key] = text
+            while len(self._texts) > self.max_entries:
+                self._texts.popitem(last=False)
+        return text
+
+    def offers(self, row: int) -> List[Tuple[int, str]]:
+        """A card's positive offers as (column index, formatted), best rate first."""
+        offers = self._offers.get(row)
+        if offers is None:
+            columns, rates = self.matrix.sparse.row(row)
+            positive = [
+                (j, rate) for j, rate in zip(columns.tolist(), rates.tolist()) if rate > 0
+            ]
+            # Stable sort: equal rates keep column order
+            positive.sort(key=lambda offer: offer[1], reverse=True)
+            names = self.matrix.columns
+            offers = [(j, format_offer(names[j], rate)) for j, rate in positive]
+            self._offers[row] = offers
+        return offers
+
+    def clear(self) -> None:
+        with self._lock:
+            self._offers.clear()
+            self._texts.clear()
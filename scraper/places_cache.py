@@ -0,0 +1,189 @@
+"""
+Bounded cache for Google Places lookups.
+
+Entries are keyed by normalized query text and kept in an in-memory LRU,
+optionally backed by a SQLite file so results survive across runs and are
+shared between processes. Every entry has a TTL; after it expires the entry
+can still be served as "stale" for a grace period while the caller refreshes
+it in the background (stale-while-revalidate).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+FRESH = "fresh"
+STALE = "stale"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: lowercased with whitespace collapsed."""
+    return _WHITESPACE_RE.sub(" ", (text or "").strip().lower())
+
+
+class PlacesCache:
+    """
+    In-memory LRU with TTLs and an optional SQLite tier.
+
+    Args:
+        max_entries: Maximum number of entries kept in memory
+        ttl: Seconds an entry is considered fresh
+        stale_ttl: Extra seconds an expired entry may still be served as stale
+        db_path: Optional SQLite file for the on-disk tier
+        clock: Time source (seconds), injectable for tests
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: float = 24 * 3600,
+        stale_ttl: float = 24 * 3600,
+        db_path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.db_path = db_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "writes": 0,
+        }
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS places_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def get(self, query: str) -> Tuple[Any, Optional[str]]:
+        """
+        Looks up a query.
+
+        Returns:
+            (value, state) where state is FRESH, STALE or None (miss).
+            On a miss the value is None.
+        """
+        key = normalize_query(query)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            else:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, entry)
+
+            if entry is None:
+                self._stats["misses"] += 1
+                return None, None
+
+            value, fetched_at = entry
+            age = now - fetched_at
+            if age <= self.ttl:
+                self._stats["hits"] += 1
+                return value, FRESH
+            if age <= self.ttl + self.stale_ttl:
+                self._stats["stale_hits"] += 1
+                return value, STALE
+
+            # Too old to serve at all
+            del self._entries[key]
+            self._stats["misses"] += 1
+            return None, None
+
+    def set(self, query: str, value: Any) -> None:
+        """Stores a JSON-serializable value for a query."""
+        key = normalize_query(query)
+        entry = (value, self._clock())
+        with self._lock:
+            self._remember(key, entry)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO places_cache (key, value, fetched_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), entry[1]),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Drops every entry from memory and disk (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM places_cache")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Copy of the hit/miss counters plus the current in-memory size."""
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -------------------------------------------------------------------------
+    # Internals (called with the lock held)
+    # -------------------------------------------------------------------------
+
+    def _remember(self, key: str, entry: Tuple[Any, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _load_from_disk(self, key: str) -> Optional[Tuple[Any, float]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, fetched_at FROM places_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+
+def cache_from_env() -> PlacesCache:
+    """
+    Builds a cache from environment settings.
+
+    PLACES_CACHE_DB: SQLite file for the on-disk tier (unset = memory only)
+    PLACES_CACHE_TTL: Fresh lifetime in seconds (default one day)
+    PLACES_CACHE_STALE_TTL: Stale grace period in seconds (default one day)
+    """
+    return PlacesCache(
+        ttl=float(os.environ.get("PLACES_CACHE_TTL", 24 * 3600)),
+        stale_ttl=float(os.environ.get("PLACES_CACHE_STALE_TTL", 24 * 3600)),
+        db_path=os.environ.get("PLACES_CACHE_DB") or None,
+    )
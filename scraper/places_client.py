@@ -0,0 +1,431 @@
+"""
+Google Places "Find Place" client with caching and concurrent bulk lookups.
+
+Lookups go through a PlacesCache: fresh entries are returned directly, stale
+entries are returned immediately while a background refresh updates the
+cache, and misses hit the API. The endpoint URL is configurable so the client
+can be pointed at a local stub server (see fake_places.py).
+
+HTTP requests share one pooled requests.Session, are throttled by a token
+bucket, and are retried with exponential backoff on 429/5xx responses,
+OVER_QUERY_LIMIT bodies and connection errors. find_places/iter_find_places resolve many queries
+concurrently with a bounded number of requests in flight.
+
+nearby_search lists the places within a radius of a point (Nearby Search),
+following next_page_token pagination; results are cached (and stale ones
+revalidated in the background) like text queries.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import incr, stage
+from places_cache import FRESH, STALE, PlacesCache, normalize_query
+
+FIND_PLACE_URL = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+NEARBY_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+DEFAULT_FIELDS = "place_id,name,formatted_address,types"
+
+
+# Statuses worth retrying: rate limited or transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Google signals rate limiting in the body of an HTTP 200
+RETRY_BODY_STATUSES = frozenset({"OVER_QUERY_LIMIT"})
+
+# Google only activates a next_page_token a short while after issuing it
+NEARBY_PAGE_DELAY = 2.0
+# Nearby Search returns at most 3 pages of 20 results
+NEARBY_MAX_RESULTS = 60
+
+
+# Body statuses that carry a usable (possibly empty) result
+OK_STATUSES = frozenset({"OK", "ZERO_RESULTS"})
+
+
+class PlacesAPIError(requests.RequestException):
+    """
+    The Places API answered with an error status in the JSON body.
+
+    Google reports quota and auth failures (OVER_QUERY_LIMIT, REQUEST_DENIED,
+    INVALID_REQUEST, ...) as HTTP 200, so these are never cached as "no
+    results".
+    """
+
+    def __init__(self, status: str, message: str = ""):
+        super().__init__(f"Places API error {status}" + (f": {message}" if message else ""))
+        self.status = status
+
+
+def _check_status(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the response body, or raises PlacesAPIError for an error status."""
+    status = body.get("status", "OK")
+    if status not in OK_STATUSES:
+        raise PlacesAPIError(status, body.get("error_message", ""))
+    return body
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second
+        burst: Bucket capacity (defaults to one second's worth of tokens)
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class PlaceResult(NamedTuple):
+    """One resolved query from a bulk lookup."""
+
+    index: int
+    query: str
+    place: Optional[Dict[str, Any]]
+    error: Optional[Exception] = None
+
+
+class PlacesClient:
+    """
+    Cached, connection-pooled client for the Places findplacefromtext endpoint.
+
+    Args:
+        api_key: Google Places API key
+        cache: Optional PlacesCache (no caching if None)
+        base_url: Endpoint URL (override to target a stub server)
+        timeout: Per-request timeout in seconds
+        fields: Place fields to request
+        max_concurrency: Maximum requests in flight for bulk lookups
+        rate_limit: Maximum requests per second (None = unlimited)
+        max_retries: Retries after a 429/5xx response, OVER_QUERY_LIMIT or connection error
+        backoff: Base delay in seconds for exponential backoff
+        nearby_url: Nearby Search endpoint (defaults to base_url's sibling)
+        page_delay: Seconds to wait before requesting the next nearby page
+            (defaults to NEARBY_PAGE_DELAY for Google, 0 otherwise)
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[PlacesCache] = None,
+        base_url: str = FIND_PLACE_URL,
+        timeout: float = 10,
+        fields: str = DEFAULT_FIELDS,
+        max_concurrency: int = 8,
+        rate_limit: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        nearby_url: Optional[str] = None,
+        page_delay: Optional[float] = None,
+    ):
+        self.api_key = api_key
+        self.cache = cache
+        self.base_url = base_url
+        self.nearby_url = nearby_url or base_url.replace(
+            "findplacefromtext", "nearbysearch"
+        )
+        if page_delay is None:
+            page_delay = NEARBY_PAGE_DELAY if self.nearby_url == NEARBY_SEARCH_URL else 0.0
+        self.page_delay = page_delay
+        self.timeout = timeout
+        self.fields = fields
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_concurrency + 2
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.requests_sent = 0
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._inflight_lock = threading.Lock()
+        self._refreshing: set = set()
+        self._refresh_lock = threading.Lock()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        self.revalidations = 0
+
+    def find_candidates(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Returns the Places candidates for a text query (best match first).
+
+        Args:
+            text: Address or place name
+
+        Returns:
+            List of candidate dicts (possibly empty)
+
+        Raises:
+            PlacesAPIError: If the API answers with an error status (not cached)
+        """
+        if self.cache is None:
+            return self._fetch(text)
+
+        value, state = self.cache.get(text)
+        if state == FRESH:
+            incr("places.cache_hit")
+            return value
+        if state == STALE:
+            incr("places.cache_stale")
+            self._revalidate(text, lambda: self._fetch(text))
+            return value
+        incr("places.cache_miss")
+
+        # Single-flight: concurrent misses for the same query share one request
+        key = normalize_query(text)
+        with self._inflight_lock:
+            done = self._inflight.get(key)
+            if done is None:
+                self._inflight[key] = threading.Event()
+        if done is not None:
+            done.wait()
+            value, state = self.cache.get(text)
+            if state is not None:
+                return value
+            return self._fetch(text)
+
+        try:
+            candidates = self._fetch(text)
+            self.cache.set(text, candidates)
+            return candidates
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key).set()
+
+    def nearby_search(
+        self,
+        lat: float,
+        lng: float,
+        radius: float,
+        place_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Places within radius metres of a point (all pages, up to 60).
+
+        Args:
+            lat: Latitude of the centre
+            lng: Longitude of the centre
+            radius: Search radius in metres
+            place_type: Optional Places type filter (e.g. "restaurant")
+
+        Returns:
+            List of Places result dicts (place_id, name, types, geometry, ...)
+        """
+        key = f"nearby {lat:.6f},{lng:.6f} {radius:g} {place_type or ''}"
+        if self.cache is None:
+            return self._fetch_nearby(lat, lng, radius, place_type)
+
+        value, state = self.cache.get(key)
+        if state == FRESH:
+            incr("places.cache_hit")
+            return value
+        if state == STALE:
+            incr("places.cache_stale")
+            self._revalidate(key, lambda: self._fetch_nearby(lat, lng, radius, place_type))
+            return value
+        incr("places.cache_miss")
+        results = self._fetch_nearby(lat, lng, radius, place_type)
+        self.cache.set(key, results)
+        return results
+
+    def _fetch_nearby(
+        self, lat: float, lng: float, radius: float, place_type: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        params = {
+            "location": f"{lat:.6f},{lng:.6f}",
+            "radius": f"{radius:g}",
+            "key": self.api_key,
+        }
+        if place_type:
+            params["type"] = place_type
+        results: List[Dict[str, Any]] = []
+        with stage("places.nearby"):
+            while True:
+                body = _check_status(self._get(self.nearby_url, params))
+                results.extend(body.get("results", []))
+                token = body.get("next_page_token")
+                if not token:
+                    break
+                if self.page_delay:
+                    time.sleep(self.page_delay)
+                params = {"pagetoken": token, "key": self.api_key}
+        return results
+
+    def find_place(self, text: str) -> Optional[Dict[str, Any]]:
+        """Best-matching place for a text query, or None."""
+        candidates = self.find_candidates(text)
+        return candidates[0] if candidates else None
+
+    def iter_find_places(self, texts: Iterable[str]) -> Iterator[PlaceResult]:
+        """
+        Resolves many queries concurrently, yielding results as they complete.
+
+        At most max_concurrency lookups are in flight, and the input is
+        consumed lazily, so arbitrarily long streams use bounded memory.
+        Failures are reported per query in PlaceResult.error rather than
+        raised.
+
+        Args:
+            texts: Addresses or place names
+
+        Yields:
+            PlaceResult for each query, in completion order
+        """
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="places"
+        ) as pool:
+            pending: Dict[Future, tuple] = {}
+            source = iter(enumerate(texts))
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < self.max_concurrency:
+                    try:
+                        index, text = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(self.find_place, text)] = (index, text)
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, text = pending.pop(future)
+                    try:
+                        yield PlaceResult(index, text, future.result())
+                    except Exception as exc:
+                        yield PlaceResult(index, text, None, exc)
+
+    def find_places(self, texts: Iterable[str]) -> List[PlaceResult]:
+        """Like iter_find_places, but returns all results in input order."""
+        results = list(self.iter_find_places(texts))
+        results.sort(key=lambda result: result.index)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters plus request, retry and revalidation counts."""
+        stats = dict(self.cache.stats) if self.cache is not None else {}
+        stats["requests"] = self.requests_sent
+        stats["retries"] = self.retries
+        stats["revalidations"] = self.revalidations
+        return stats
+
+    def close(self) -> None:
+        """Waits for pending background refreshes and closes the session."""
+        if self._refresher is not None:
+            self._refresher.shutdown(wait=True)
+            self._refresher = None
+        self.session.close()
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _params(self, text: str) -> Dict[str, str]:
+        return {
+            "input": text,
+            "inputtype": "textquery",
+            "fields": self.fields,
+            "key": self.api_key,
+        }
+
+    def _fetch(self, text: str) -> List[Dict[str, Any]]:
+        body = _check_status(self._get(self.base_url, self._params(text)))
+        return body.get("candidates", [])
+
+    def _get(self, url: str, params: Dict[str, str]) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            if self._bucket is not None:
+                self._bucket.acquire()
+            with self._stats_lock:
+                self.requests_sent += 1
+            incr("places.http_request")
+            try:
+                with stage("places.http"):
+                    resp = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    resp.raise_for_status()
+                    body = resp.json()
+                    if (
+                        body.get("status") not in RETRY_BODY_STATUSES
+                        or attempt >= self.max_retries
+                    ):
+                        return body
+                retry_after = resp.headers.get("Retry-After")
+
+            with self._stats_lock:
+                self.retries += 1
+            incr("places.retry")
+            self._sleep_before_retry(attempt, retry_after)
+            attempt += 1
+
+    def _sleep_before_retry(self, attempt: int, retry_after: Optional[str]) -> None:
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def _revalidate(self, query: str, fetch: Callable[[], Any]) -> None:
+        """Refreshes a stale cache entry in the background (once at a time)."""
+        key = normalize_query(query)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="places-revalidate"
+                )
+            self.revalidations += 1
+        self._refresher.submit(self._refresh, query, key, fetch)
+
+    def _refresh(self, query: str, key: str, fetch: Callable[[], Any]) -> None:
+        try:
+            self.cache.set(query, fetch())
+        except requests.RequestException:
+            # Keep serving the stale copy; the next lookup will retry
+            pass
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,496 @@
+"""
+Card ranking against the rewards matrix.
+
+Library half of map.py: scores the user's cards (or any whitelist) for one
+or many reward categories using the preloaded RewardsMatrix, and renders the
+matching offers as display text. Importing this module does not touch the
+network, environment or command line.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from instrumentation import enabled, incr, stage
+from offer_text import format_offer, matching_columns
+from rewards_matrix import RewardsMatrix, load_matrix, parse_rate
+
+# -----------------------------------------------------------------------------
+# Configuration: User's credit card collection
+# -----------------------------------------------------------------------------
+USER_CARDS: List[str] = [
+    "Target REDcard",
+    "Capital One Venture X Rewards Credit Card",
+    "American Express® Gold Card",
+    "Chase Sapphire Reserve®",
+    "U.S. Bank Altitude® Go",
+]
+
+
+# -----------------------------------------------------------------------------
+# Helper Functions
+# -----------------------------------------------------------------------------
+
+def _generate_offer_text(
+    card_row, search_terms: List[str], all_columns: List[str]
+) -> str:
+    """
+    Generates reward offer text for a card from the rewards matrix data.
+    
+    Args:
+        card_row: Mapping (e.g. pandas Series) for one row of the rewards matrix
+        search_terms: List of category terms to prioritize
+        all_columns: List of all category columns in the dataframe
+        
+    Returns:
+        Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+    """
+    # Only show categories that match search terms; which columns match is
+    # memoized per (columns, terms), so only those cells are parsed
+    # Exclude all other unrelated categories (including fallback categories)
+    matched_offers = []
+    for col in matching_columns(tuple(all_columns), tuple(search_terms)):
+        # Convert to numeric if needed
+        value = parse_rate(card_row.get(col, 0.0))
+        
+        if value > 0:
+            matched_offers.append((col, value))
+    
+    return _render_offers(matched_offers)
+
+
+def _render_offers(matched_offers: List[Tuple[str, float]]) -> str:
+    """
+    Renders matched (category, rate) offers, highest rate first.
+    
+    Args:
+        matched_offers: (category, rate) pairs in matrix column order
+        
+    Returns:
+        Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+    """
+    # Sort by reward rate (highest first)
+    matched_offers = sorted(matched_offers, key=lambda x: x[1], reverse=True)
+    
+    # Format as "X% — Category Name" (remove trailing zeros for whole numbers)
+    return " | ".join(format_offer(category, rate) for category, rate in matched_offers)
+
+
+def _matrix_offer_text(
+    matrix: RewardsMatrix, row: int, matched_columns: FrozenSet[int]
+) -> str:
+    """
+    Generates reward offer text for one pre-parsed matrix row.
+    
+    Args:
+        matrix: Loaded rewards matrix
+        row: Row index of the card in the matrix
+        matched_columns: Column indices matched by the search terms
+        
+    Returns:
+        Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+    """
+    # Rendered from the card's pre-sorted offers and memoized per
+    # (card, matched columns) for the current matrix version
+    return matrix.offer_texts.text(row, matched_columns)
+
+
+def _whitelist_rows(
+    matrix: RewardsMatrix, card_whitelist: Optional[List[str]]
+) -> Tuple[List[int], List[str]]:
+    """
+    Resolves a card whitelist against the matrix.
+    
+    Args:
+        matrix: Loaded rewards matrix
+        card_whitelist: Optional list of cards to filter to (uses USER_CARDS if None)
+        
+    Returns:
+        Tuple of (matrix rows in file order, whitelisted names missing from the matrix)
+    """
+    whitelist = card_whitelist if card_whitelist is not None else USER_CARDS
+    
+    if not whitelist:
+        return list(range(len(matrix.card_names))), []
+    
+    whitelist_lower = {name.lower() for name in whitelist}
+    rows = [
+        i for i, name in enumerate(matrix.card_names_lower) if name in whitelist_lower
+    ]
+    
+    # Missing cards get zero rewards (so all user cards appear in results)
+    existing_lower = {matrix.card_names_lower[i] for i in rows}
+    missing_cards = [
+        card_name for card_name in whitelist if card_name.lower() not in existing_lower
+    ]
+    return rows, missing_cards
+
+
+def get_best_cards_for_category(
+    category: str,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    card_whitelist: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+    matrix: Optional[RewardsMatrix] = None,
+) -> List[Tuple[str, float, str]]:
+    """
+    Finds the best credit cards for a given reward category.
+    
+    This function:
+    1. Loads the rewards matrix (cached per path, reloaded when the file changes)
+    2. Filters to user's cards (or provided whitelist)
+    3. Finds reward columns matching the category
+    4. Ranks cards by maximum reward rate (precomputed per column set)
+    5. Returns top N cards with reward rates and offer text
+    
+    Args:
+        category: Primary reward category name
+        top_n: Number of top cards to return
+        matrix_csv_path: Path to rewards matrix CSV (ignored when matrix is given)
+        card_whitelist: Optional list of cards to filter to (uses USER_CARDS if None)
+        categories: Optional list of multiple categories to consider together
+        matrix: Optional preloaded RewardsMatrix to use instead of matrix_csv_path
+        
+    Returns:
+        List of tuples: (card_name, reward_rate, offer_text), sorted by reward rate descending
+    """
+    # Load rewards matrix (parsed once, re-parsed only when the file changes)
+    if matrix is None:
+        matrix = load_matrix(matrix_csv_path)
+    else:
+        matrix.refresh()
+    # Read one version throughout, even if a reload swaps in another
+    matrix = matrix.contents
+    
+    # Filter to user's cards (or provided whitelist); an empty whitelist
+    # means the whole catalog
+    whitelist = card_whitelist if card_whitelist is not None else USER_CARDS
+    if whitelist:
+        rows, missing_cards = _whitelist_rows(matrix, whitelist)
+        if not rows and not missing_cards:
+            return []
+    elif not matrix.card_names:
+        return []
+    
+    # Resolve category/categories to the reward columns their search terms match
+    # (precomputed per matrix version instead of scanning every column)
+    with stage("ranking.column_match"):
+        index = matrix.category_index
+        if categories:
+            matched_columns = index.columns_for_categories(categories)
+        else:
+            matched_columns = index.columns_for_category(category)
+        candidate_columns = sorted(matched_columns)
+    
+    # Fallback to generic "everywhere" columns if no specific match
+    if not candidate_columns:
+        incr("ranking.fallback_columns")
+        candidate_columns = list(index.fallback_columns)
+    
+    if not candidate_columns:
+        return []
+    
+    # Each card's score is its maximum reward rate across the candidate
+    # columns; the whole catalog's ranking for these columns is precomputed
+    # (ties keep matrix order, missing whitelist cards score zero)
+    with stage("ranking.score"):
+        tables = matrix.ranking_tables
+        table = tables.table(candidate_columns)
+        if whitelist:
+            ranked = table.rank(rows, len(missing_cards), top_n)
+            names = [matrix.card_names[i] for i in rows] + missing_cards
+        else:
+            ranked = table.top(top_n)
+            names = matrix.card_names
+    
+    # Build results with card name, reward rate, and offer text
+    # Offer text for the table's best entries is rendered once and reused
+    results: List[Tuple[str, float, str]] = []
+    with stage("ranking.offer_text"):
+        for idx, reward_value, position in ranked:
+            card_name = names[idx]
+            
+            # Only generate offer text if there's a match (reward_value > 0)
+            # Otherwise, show empty offer text
+            if reward_value > 0 and matched_columns:
+                offer_text = tables.offer_text(table, position)
+            else:
+                offer_text = ""
+            
+            results.append((card_name, reward_value, offer_text))
+    
+    return results
+
+
+# Queries are scored in chunks so the (queries × cards × columns) mask stays small
+_BATCH_CHUNK_CELLS = 4_000_000
+
+
+def get_best_cards_batch(
+    queries: List[Tuple[Optional[str], str]],
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    card_whitelist: Optional[List[str]] = None,
+    matrix: Optional[RewardsMatrix] = None,
+) -> List[List[Tuple[str, float, str]]]:
+    """
+    Finds the best credit cards for many places at once.
+    
+    Each query is a (brand_category, default_category) pair as returned by
+    map_place_to_categories, and gets the same result as the CLI's call:
+    get_best_cards_for_category(brand or default, categories=[brand, default]).
+    Identical column selections are scored once, and all scoring is a single
+    masked max-reduction over the pre-parsed rate matrix.
+    
+    Args:
+        queries: List of (brand_category_or_None, default_category) pairs
+        top_n: Number of top cards to return per query
+        matrix_csv_path: Path to rewards matrix CSV (ignored when matrix is given)
+        card_whitelist: Optional list of cards to filter to (uses USER_CARDS if None)
+        matrix: Optional preloaded RewardsMatrix to use instead of matrix_csv_path
+        
+    Returns:
+        One result list per query, in query order, each shaped like
+        get_best_cards_for_category's return value
+    """
+    if matrix is None:
+        matrix = load_matrix(matrix_csv_path)
+    else:
+        matrix.refresh()
+    matrix = matrix.contents
+    
+    results: List[List[Tuple[str, float, str]]] = [[] for _ in queries]
+    rows, missing_cards = _whitelist_rows(matrix, card_whitelist)
+    if not queries or (not rows and not missing_cards):
+        return results
+    
+    with stage("ranking.column_match"):
+        # Resolve each query to its matched column set, grouping identical sets
+        index = matrix.category_index
+        group_of: dict[FrozenSet[int], int] = {}
+        group_matched: List[FrozenSet[int]] = []
+        query_groups: List[int] = []
+        for brand_category, default_category in queries:
+            used = [c for c in (brand_category, default_category) if c]
+            if used:
+                matched = index.columns_for_categories(used)
+            else:
+                matched = index.columns_for_category("Other purchases")
+            group = group_of.get(matched)
+            if group is None:
+                group = group_of[matched] = len(group_matched)
+                group_matched.append(matched)
+            query_groups.append(group)
+        
+        # Candidate-column mask per group (fallback columns when nothing matched)
+        n_columns = len(matrix.columns)
+        mask = np.zeros((len(group_matched), n_columns), dtype=bool)
+        for g, matched in enumerate(group_matched):
+            mask[g, list(matched or index.fallback_columns)] = True
+        has_columns = mask.any(axis=1)
+    if enabled():
+        fallback_queries = sum(1 for group in query_groups if not group_matched[group])
+        if fallback_queries:
+            incr("ranking.fallback_columns", fallback_queries)
+    
+    with stage("ranking.score"):
+        # Masked max over candidate columns: (groups × cards)
+        rates = matrix.sparse.dense_rows(rows)
+        scores = np.zeros((len(group_matched), len(rows) + len(missing_cards)))
+        if rows:
+            chunk = max(1, _BATCH_CHUNK_CELLS // max(1, rates.size))
+            for start in range(0, len(group_matched), chunk):
+                block = mask[start:start + chunk, None, :]
+                scores[start:start + chunk, : len(rows)] = np.where(
+                    block, rates[None, :, :], -np.inf
+                ).max(axis=2)
+        scores[~has_columns] = 0.0
+        
+        # Sort cards by reward rate (highest first), ties keep matrix order
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :top_n]
+        names = [matrix.card_names[i] for i in rows] + missing_cards
+    
+    with stage("ranking.offer_text"):
+        group_results: List[List[Tuple[str, float, str]]] = []
+        for g, matched in enumerate(group_matched):
+            if not has_columns[g]:
+                group_results.append([])
+                continue
+            ranked: List[Tuple[str, float, str]] = []
+            for idx in order[g]:
+                reward_value = float(scores[g, idx])
+                if reward_value > 0:
+                    offer_text = _matrix_offer_text(matrix, rows[idx], matched)
+                else:
+                    offer_text = ""
+                ranked.append((names[idx], reward_value, offer_text))
+            group_results.append(ranked)
+    
+    for q, group in enumerate(query_groups):
+        results[q] = list(group_results[group])
+    return results
+
+
+# -----------------------------------------------------------------------------
+# Result cache with targeted invalidation
+# -----------------------------------------------------------------------------
+
+class RankingCache:
+    """
+    Memoized get_best_cards_for_category results for one matrix.
+    
+    Entries are keyed by (whitelist, matched columns, top_n), so different
+    categories that resolve to the same columns share an entry. A full
+    reload of the matrix clears the cache; an in-place patch
+    (matrix_diff.apply_diff) only drops the entries whose cards × candidate
+    columns include a changed cell.
+    
+    Args:
+        matrix: Matrix to rank against
+        max_entries: Maximum number of cached rankings (LRU)
+    """
+    
+    def __init__(self, matrix: RewardsMatrix, max_entries: int = 4096):
+        self.matrix = matrix
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[tuple, List[Tuple[str, float, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = matrix.version
+        matrix.add_watcher(self)
+    
+    def get_best_cards_for_category(
+        self,
+        category: str,
+        top_n: int = 20,
+        card_whitelist: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None,
+    ) -> List[Tuple[str, float, str]]:
+        """Cached equivalent of the module-level get_best_cards_for_category."""
+        self.matrix.refresh()
+        matrix = self.matrix.contents
+        version = matrix.version
+        with self._lock:
+            if version != self._version:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._version = version
+        
+        index = matrix.category_index
+        if categories:
+            matched = index.columns_for_categories(categories)
+        else:
+            matched = index.columns_for_category(category)
+        whitelist = tuple(card_whitelist if card_whitelist is not None else USER_CARDS)
+        key = (whitelist, matched, top_n)
+        
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(results)
+            self.misses += 1
+        
+        results = get_best_cards_for_category(
+            category,
+            top_n=top_n,
+            card_whitelist=list(whitelist),
+            categories=categories,
+            matrix=matrix,
+        )
+        with self._lock:
+            # Don't store a result computed against a since-replaced matrix
+            if matrix.version == self._version:
+                self._entries[key] = results
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return list(results)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def matrix_patched(self, diff, old_version: int, new_version: int) -> int:
+        """
+        Drops the entries a matrix_diff.MatrixDiff affects.
+        
+        Returns:
+            Number of entries invalidated
+        """
+        with self._lock:
+            stale = self._stale(diff, old_version)
+            for key in stale:
+                del self._entries[key]
+            self._version = new_version
+            self.invalidations += len(stale)
+            return len(stale)
+    
+    def carry_over(self, old: "RankingCache", diff) -> int:
+        """
+        Fills this cache with the entries of another matrix's cache that a
+        diff leaves valid (this cache's matrix being the old one, patched).
+        
+        Args:
+            old: Cache of the matrix the diff was applied to
+            diff: matrix_diff.MatrixDiff taking old's matrix to this one
+        
+        Returns:
+            Number of old entries invalidated
+        """
+        with old._lock:
+            stale = set(old._stale(diff, old.matrix.version))
+            kept = [(key, results) for key, results in old._entries.items() if key not in stale]
+            hits, misses, invalidations = old.hits, old.misses, old.invalidations
+        with self._lock:
+            self._entries.update(kept)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.hits += hits
+            self.misses += misses
+            self.invalidations += invalidations + len(stale)
+        return len(stale)
+    
+    def _stale(self, diff, old_version: int) -> List[tuple]:
+        """Keys a diff from old_version invalidates (all of them unless targeted)."""
+        if self._version == old_version and not diff.reshaped and diff.card_order is None:
+            return self._affected(diff)
+        return list(self._entries)
+    
+    def _affected(self, diff) -> List[tuple]:
+        """Keys whose rankings can change under a column-preserving diff."""
+        column_index = self.matrix.column_index
+        fallback = frozenset(self.matrix.category_index.fallback_columns)
+        changed_cells = {
+            name.lower(): frozenset(column_index[col] for col in changes)
+            for name, changes in diff.cells.items()
+        }
+        changed_any = frozenset().union(*changed_cells.values())
+        added_or_removed = {
+            name.lower() for name in list(diff.cards_added) + list(diff.cards_removed)
+        }
+        
+        affected = []
+        for key in self._entries:
+            whitelist, matched, _ = key
+            candidate = matched or fallback
+            if not whitelist:
+                # Whole catalog: any added/removed card changes the list
+                if added_or_removed or not changed_any.isdisjoint(candidate):
+                    affected.append(key)
+                continue
+            names = {name.lower() for name in whitelist}
+            if not names.isdisjoint(added_or_removed) or any(
+                not changed_cells[name].isdisjoint(candidate)
+                for name in names.intersection(changed_cells)
+            ):
+                affected.append(key)
+        return affected
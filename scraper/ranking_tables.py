@@ -0,0 +1,356 @@
+"""
+Precomputed per-category card rankings.
+
+get_best_cards_for_category scores cards by their maximum rate over the
+category's candidate columns (the matched columns, or the fallback columns
+when nothing matched). The full ranking for a set of candidate columns is the
+same for every query that resolves to it, so RankingTables computes it once:
+
+- rows: every card with a non-zero score, best first (ties keep matrix
+  order), with its score
+- texts: the offer text of the first `depth` positive entries
+
+Every card not in rows scores zero, and zero-score cards rank in matrix
+order between the positive and negative entries, so the complete ranking is
+implied without storing one entry per card.
+
+Catalog-wide queries read the top of a table directly. Whitelisted queries
+walk the table in order and stop once they have top_n whitelisted cards;
+short whitelists order just their own cards' table positions instead.
+
+Tables for every known category are precomputed when a snapshot is written
+(see matrix_snapshot.py) and stored in it. Any other column set is built on
+first use and memoized for the lifetime of the matrix version.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Offer texts kept per table (get_best_cards_for_category's default top_n)
+DEFAULT_DEPTH = 20
+
+# Column sets built on demand (unusual category combinations); cap the memo
+_MAX_TABLES = 4096
+
+# (row or whitelist index, score, table position or -1 for zero scores)
+RankedEntry = Tuple[int, float, int]
+
+
+class RankingTable:
+    """
+    Ranking of the whole catalog for one set of candidate columns.
+
+    Attributes:
+        columns: Candidate column indices, sorted
+        rows: Matrix rows with a non-zero score, best first
+        scores: Score of each entry in rows
+        n_positive: Number of leading entries with a positive score
+        texts: Offer text of the first positive entries (None = not rendered yet)
+    """
+
+    def __init__(
+        self,
+        columns: Tuple[int, ...],
+        n_cards: int,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        texts: Optional[List[str]] = None,
+        depth: int = DEFAULT_DEPTH,
+    ):
+        self.columns = columns
+        self.n_cards = n_cards
+        self.rows = rows
+        self.scores = scores
+        self.n_positive = int(np.count_nonzero(scores > 0))
+        size = min(depth, self.n_positive)
+        self.texts: List[Optional[str]] = list(texts[:size]) if texts else []
+        self.texts += [None] * (size - len(self.texts))
+        # Table position and score of every row, built on first whitelisted lookup
+        self._positions: Optional[np.ndarray] = None
+        self._row_scores: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_scores(
+        cls, columns: Tuple[int, ...], scores: np.ndarray, depth: int = DEFAULT_DEPTH
+    ) -> "RankingTable":
+        """Builds a table from one score per matrix row."""
+        order = np.argsort(-scores, kind="stable")
+        order = order[scores[order] != 0]
+        return cls(columns, len(scores), order.astype(np.int32), scores[order], depth=depth)
+
+    def top(self, top_n: int) -> List[RankedEntry]:
+        """
+        Best cards of the whole catalog.
+
+        Returns:
+            Up to top_n (row, score, table position) entries
+        """
+        head = min(top_n, self.n_positive)
+        ranked = [
+            (row, score, k)
+            for k, (row, score) in enumerate(
+                zip(self.rows[:head].tolist(), self.scores[:head].tolist())
+            )
+        ]
+        if len(ranked) < top_n:
+            scored = np.zeros(self.n_cards, dtype=bool)
+            scored[self.rows] = True
+            for row in np.flatnonzero(~scored)[: top_n - len(ranked)].tolist():
+                ranked.append((row, 0.0, -1))
+            for k in range(self.n_positive, len(self.rows)):
+                if len(ranked) >= top_n:
+                    break
+                ranked.append((int(self.rows[k]), float(self.scores[k]), k))
+        return ranked
+
+    def rank(self, rows: Sequence[int], n_missing: int, top_n: int) -> List[RankedEntry]:
+        """
+        Best cards among a whitelist.
+
+        Entries rank as: positive entries by position, then zero-score rows in
+        matrix order, then missing names, then negative entries by position.
+        A large whitelist walks the table in that order and stops at top_n
+        hits; a small one (where the walk would pass mostly other cards)
+        sorts its own entries instead.
+
+        Args:
+            rows: Whitelisted matrix rows, in matrix order
+            n_missing: Whitelisted names missing from the matrix (they score
+                zero and rank after zero-score rows, in whitelist order)
+            top_n: Number of entries to return
+
+        Returns:
+            Up to top_n (index, score, table position) entries, where index
+            points into rows followed by the missing names
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, row_scores = self._per_row()
+        # A walk reads about top_n * n_cards / len(rows) entries to find top_n
+        if len(rows) * len(rows) <= top_n * self.n_cards:
+            return self._rank_sorted(rows, positions[rows], row_scores[rows], n_missing, top_n)
+
+        member = np.zeros(self.n_cards, dtype=bool)
+        member[rows] = True
+        ranked = self._walk(rows, member, 0, self.n_positive, top_n)
+        if len(ranked) < top_n:
+            unscored = np.flatnonzero(positions[rows] < 0)
+            ranked += [(idx, 0.0, -1) for idx in unscored[: top_n - len(ranked)].tolist()]
+        if len(ranked) < top_n:
+            extra = min(n_missing, top_n - len(ranked))
+            ranked += [(len(rows) + i, 0.0, -1) for i in range(extra)]
+        if len(ranked) < top_n:
+            ranked += self._walk(rows, member, self.n_positive, len(self.rows), top_n - len(ranked))
+        return ranked
+
+    def _walk(
+        self, rows: np.ndarray, member: np.ndarray, start: int, stop: int, limit: int
+    ) -> List[RankedEntry]:
+        """Whitelisted entries among table positions [start, stop), up to limit."""
+        ranked: List[RankedEntry] = []
+        step = max(64, 4 * limit)
+        while start < stop and len(ranked) < limit:
+            chunk = self.rows[start:min(start + step, stop)]
+            hits = np.flatnonzero(member[chunk])[: limit - len(ranked)]
+            indices = np.searchsorted(rows, chunk[hits]).tolist()
+            for idx, k in zip(indices, hits.tolist()):
+                ranked.append((idx, float(self.scores[start + k]), start + k))
+            start += step
+            step *= 2
+        return ranked
+
+    def _rank_sorted(
+        self,
+        rows: np.ndarray,
+        position: np.ndarray,
+        score: np.ndarray,
+        n_missing: int,
+        top_n: int,
+    ) -> List[RankedEntry]:
+        """rank() by sorting one key per whitelisted card."""
+        p, n = self.n_positive, self.n_cards
+        keys = np.concatenate([
+            np.where(score > 0, position, np.where(score == 0, p + rows, n + n_missing + position)),
+            p + n + np.arange(n_missing, dtype=np.int64),
+        ])
+        ranked = []
+        for idx in np.argsort(keys)[:top_n].tolist():
+            if idx < len(rows):
+                value = float(score[idx])
+                ranked.append((idx, value, int(position[idx]) if value != 0 else -1))
+            else:
+                ranked.append((idx, 0.0, -1))
+        return ranked
+
+    def _per_row(self) -> Tuple[np.ndarray, np.ndarray]:
+        positions, row_scores = self._positions, self._row_scores
+        if positions is None:
+            positions = np.full(self.n_cards, -1, dtype=np.int64)
+            positions[self.rows] = np.arange(len(self.rows))
+            row_scores = np.zeros(self.n_cards, dtype=np.float64)
+            row_scores[self.rows] = self.scores
+            self._positions, self._row_scores = positions, row_scores
+        return positions, row_scores
+
+
+class RankingTables:
+    """
+    RankingTable per candidate column set for one matrix version.
+
+    Args:
+        matrix: RewardsMatrix the tables rank
+        depth: Offer texts kept per table
+        tables: Prebuilt tables (e.g. loaded from a snapshot)
+    """
+
+    def __init__(self, matrix, depth: int = DEFAULT_DEPTH, tables: Iterable[RankingTable] = ()):
+        self.matrix = matrix
+        self.depth = depth
+        self._tables: Dict[Tuple[int, ...], RankingTable] = {t.columns: t for t in tables}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def table(self, candidate_columns: Sequence[int]) -> RankingTable:
+        """Table for sorted candidate column indices (built on first use)."""
+        key = tuple(candidate_columns)
+        table = self._tables.get(key)
+        if table is None:
+            n_cards = self.matrix.shape[0]
+            scores = self.matrix.sparse.max_over_columns(np.arange(n_cards), list(key))
+            table = RankingTable.from_scores(key, scores, self.depth)
+            with self._lock:
+                if len(self._tables) >= _MAX_TABLES:
+                    self._tables.clear()
+                table = self._tables.setdefault(key, table)
+        return table
+
+    def carry_over(self, old: "RankingTables", diff) -> int:
+        """
+        Reuses another matrix's tables that a diff leaves unchanged.
+
+        Only diffs that keep the cards and columns in place qualify; tables
+        whose column set holds a changed cell are left to be rebuilt.
+
+        Args:
+            old: Tables of the matrix the diff was applied to
+            diff: matrix_diff.MatrixDiff taking old's matrix to this one
+
+        Returns:
+            Number of tables reused
+        """
+        if (
+            old.depth != self.depth
+            or diff.reshaped
+            or diff.cards_added
+            or diff.cards_removed
+            or diff.card_order is not None
+        ):
+            return 0
+        column_index = self.matrix.column_index
+        changed = {column_index[col] for col in diff.columns_changed}
+        with old._lock:
+            tables = list(old._tables.items())
+        reused = 0
+        with self._lock:
+            for key, table in tables:
+                if changed.isdisjoint(key) and key not in self._tables:
+                    self._tables[key] = table
+                    reused += 1
+        return reused
+
+    def offer_text(self, table: RankingTable, position: int) -> str:
+        """
+        Offer text of a positive table entry, with the table's columns as
+        the matched columns (rendered once per kept position).
+        """
+        text = table.texts[position] if position < len(table.texts) else None
+        if text is None:
+            from ranking import _matrix_offer_text
+
+            text = _matrix_offer_text(
+                self.matrix, int(table.rows[position]), frozenset(table.columns)
+            )
+            if position < len(table.texts):
+                table.texts[position] = text
+        return text
+
+    def precompute(self, categories: Optional[Iterable[str]] = None) -> int:
+        """
+        Builds the tables (and offer texts) for categories' candidate columns.
+
+        Args:
+            categories: Categories to cover (every known category if None)
+
+        Returns:
+            Number of tables held afterwards
+        """
+        if categories is None:
+            from map_to_category import known_categories
+
+            categories = known_categories()
+        index = self.matrix.category_index
+        for category in categories:
+            columns = sorted(index.columns_for_category(category)) or list(index.fallback_columns)
+            if not columns:
+                continue
+            table = self.table(columns)
+            for position in range(len(table.texts)):
+                self.offer_text(table, position)
+        return len(self._tables)
+
+    # -------------------------------------------------------------------------
+    # Snapshot serialization
+    # -------------------------------------------------------------------------
+
+    def to_arrays(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """
+        Flattens every table for matrix_snapshot.
+
+        Returns:
+            (header section, arrays) where the arrays hold each table's rows
+            and scores back to back, delimited by ranking_indptr
+        """
+        tables = list(self._tables.values())
+        for table in tables:
+            for position in range(len(table.texts)):
+                self.offer_text(table, position)
+        counts = [len(t.rows) for t in tables]
+        indptr = np.zeros(len(tables) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(counts)
+        empty_rows, empty_scores = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+        arrays = {
+            "ranking_indptr": indptr,
+            "ranking_rows": np.concatenate([t.rows for t in tables] or [empty_rows]),
+            "ranking_scores": np.concatenate([t.scores for t in tables] or [empty_scores]),
+        }
+        section = {
+            "depth": self.depth,
+            "columns": [list(t.columns) for t in tables],
+            "texts": [t.texts for t in tables],
+        }
+        return section, arrays
+
+    @classmethod
+    def from_arrays(cls, matrix, section: Dict, arrays: Dict[str, np.ndarray]) -> "RankingTables":
+        """Inverse of to_arrays (the arrays may be read-only snapshot views)."""
+        depth = int(section["depth"])
+        # Plain ndarray views of the mapped arrays (memmap slicing is slower)
+        indptr = np.asarray(arrays["ranking_indptr"]).tolist()
+        rows = np.asarray(arrays["ranking_rows"])
+        scores = np.asarray(arrays["ranking_scores"])
+        n_cards = matrix.shape[0]
+        tables = [
+            RankingTable(
+                tuple(columns),
+                n_cards,
+                rows[indptr[t]:indptr[t + 1]],
+                scores[indptr[t]:indptr[t + 1]],
+                texts,
+                depth,
+            )
+            for t, (columns, texts) in enumerate(zip(section["columns"], section["texts"]))
+        ]
+        return cls(matrix, depth, tables)
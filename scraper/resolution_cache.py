@@ -0,0 +1,255 @@
+"""
+Persistent cache of merchant → category resolutions.
+
+The same merchant names and Google types come up again and again, both
+within a run and across runs. ResolutionCache remembers what
+map_place_to_categories returned for them, and which rule fired, in an
+in-memory LRU backed by an optional SQLite file shared between runs and
+worker processes (WAL mode: any number of concurrent readers alongside a
+writer).
+
+Keys are chosen so a cached answer is always what map_place_to_categories
+would return:
+- Types are reduced to the first one in TYPE_TO_CATEGORY (the only one
+  that affects the result), so noise types like "point_of_interest" and
+  "establishment" don't fragment the cache. Order is not normalized away,
+  because the first mapped type wins.
+- When a type decides the default category, only brand matching looks at
+  the name, and it is case-insensitive, so the name is lowercased with
+  whitespace collapsed. Otherwise the fuzzy matcher sees the exact name,
+  and it is case-sensitive, so the name is kept verbatim.
+
+Every row carries rules_fingerprint(), a content hash of BRAND_OVERRIDES,
+TYPE_TO_CATEGORY, CATEGORIES and the fuzzy matcher configuration, so editing
+any of them invalidates old entries automatically.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import map_to_category
+from places_cache import normalize_query
+
+BRAND = "brand"
+TYPE = "type"
+FUZZY = "fuzzy"
+DEFAULT = "default"
+
+
+class Resolution(NamedTuple):
+    """Result of resolving one merchant."""
+
+    brand_category: Optional[str]
+    default_category: str
+    # Rule behind the primary category: brand, type, fuzzy or default
+    rule: str
+
+    @property
+    def category(self) -> str:
+        """What map_place_to_category returns for the same input."""
+        return self.brand_category or self.default_category
+
+
+def resolution_key(place_name: str, types: Optional[List[str]]) -> str:
+    """Cache key for a merchant (see the module docstring)."""
+    effective_type = ""
+    for t in types or ():
+        if t in map_to_category.TYPE_TO_CATEGORY:
+            effective_type = t
+            break
+    name = normalize_query(place_name) if effective_type else (place_name or "")
+    return f"{effective_type}\x1f{name}"
+
+
+class ResolutionCache:
+    """
+    Memoizing front end for map_place_to_categories.
+
+    Args:
+        db_path: Optional SQLite file shared between runs and processes
+        max_entries: Maximum number of resolutions kept in memory
+        flush_every: New resolutions buffered before they are written to disk
+        prune_stale: Delete rows from other rule fingerprints when opening
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_entries: int = 100_000,
+        flush_every: int = 256,
+        prune_stale: bool = True,
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Resolution]" = OrderedDict()
+        self._pending: List[Tuple[str, str, Optional[str], str, str, float]] = []
+        self._fingerprint = map_to_category.rules_fingerprint()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "writes": 0,
+        }
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions ("
+                "fingerprint TEXT NOT NULL, key TEXT NOT NULL, "
+                "brand_category TEXT, default_category TEXT NOT NULL, "
+                "rule TEXT NOT NULL, resolved_at REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, key))"
+            )
+            if prune_stale:
+                self._db.execute(
+                    "DELETE FROM resolutions WHERE fingerprint != ?", (self._fingerprint,)
+                )
+            self._db.commit()
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def resolve(self, place_name: str, types: Optional[List[str]]) -> Resolution:
+        """Cached equivalent of map_to_category.resolve_place_categories."""
+        self._check_fingerprint()
+        key = resolution_key(place_name, types)
+        with self._lock:
+            resolution = self._entries.get(key)
+            if resolution is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return resolution
+            resolution = self._load_from_disk(key)
+            if resolution is not None:
+                self._stats["disk_hits"] += 1
+                self._remember(key, resolution)
+                return resolution
+            self._stats["misses"] += 1
+
+        brand, default, default_rule = map_to_category.resolve_place_categories(
+            place_name, types or []
+        )
+        resolution = Resolution(brand, default, BRAND if brand is not None else default_rule)
+        with self._lock:
+            self._remember(key, resolution)
+            if self._db is not None:
+                self._pending.append(
+                    (self._fingerprint, key, brand, default, resolution.rule, time.time())
+                )
+                if len(self._pending) >= self.flush_every:
+                    self._flush()
+        return resolution
+
+    def map_place_to_categories(
+        self, place_name: str, types: Optional[List[str]]
+    ) -> Tuple[Optional[str], str]:
+        """Drop-in for map_to_category.map_place_to_categories."""
+        resolution = self.resolve(place_name, types)
+        return (resolution.brand_category, resolution.default_category)
+
+    def map_place_to_category(self, place_name: str, types: Optional[List[str]]) -> str:
+        """Drop-in for map_to_category.map_place_to_category."""
+        return self.resolve(place_name, types).category
+
+    # -------------------------------------------------------------------------
+    # Maintenance
+    # -------------------------------------------------------------------------
+
+    def flush(self) -> None:
+        """Writes buffered resolutions to disk."""
+        with self._lock:
+            self._flush()
+
+    def clear(self) -> None:
+        """Drops every entry from memory and disk (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM resolutions")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+                self._db.close()
+                self._db = None
+
+    def __enter__(self) -> "ResolutionCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Copy of the hit/miss counters plus the current in-memory size."""
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _check_fingerprint(self) -> None:
+        fingerprint = map_to_category.rules_fingerprint()
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                self._flush()
+                self._entries.clear()
+                self._fingerprint = fingerprint
+                self._stats["invalidations"] += 1
+
+    # Called with the lock held
+
+    def _remember(self, key: str, resolution: Resolution) -> None:
+        self._entries[key] = resolution
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Optional[Resolution]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT brand_category, default_category, rule FROM resolutions "
+            "WHERE fingerprint = ? AND key = ?",
+            (self._fingerprint, key),
+        ).fetchone()
+        return Resolution(*row) if row is not None else None
+
+    def _flush(self) -> None:
+        if self._db is None or not self._pending:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO resolutions "
+            "(fingerprint, key, brand_category, default_category, rule, resolved_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            self._pending,
+        )
+        self._db.commit()
+        self._stats["writes"] += len(self._pending)
+        self._pending.clear()
+
+
+def resolution_cache_from_env() -> ResolutionCache:
+    """
+    Builds a resolution cache from environment settings.
+
+    RESOLUTION_CACHE_DB: SQLite file shared across runs (unset = memory only)
+    """
+    return ResolutionCache(db_path=os.environ.get("RESOLUTION_CACHE_DB") or None)
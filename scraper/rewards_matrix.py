@@ -0,0 +1,540 @@
+"""
+Preloaded rewards matrix used by the card ranking code.
+
+The rewards CSV is parsed once into sparse non-zero rate lists (cards ×
+categories, see sparse_rates.py) together with card-name and column-name
+lookup tables. Matrices loaded through
+`load_matrix` are cached per path and reloaded automatically when the file's
+modification time changes, so callers can keep asking for the matrix on every
+request without paying the CSV parse again.
+
+A matrix can also be loaded from a binary snapshot (see matrix_snapshot.py),
+which memory-maps the rate arrays instead of parsing anything.
+
+Reloads and patches never modify a matrix's data in place: they build a new
+MatrixContents and swap it in with one assignment. Readers that may run
+during a reload take `matrix.contents` once per call.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union
+
+import numpy as np
+
+from instrumentation import stage
+from map_to_category import DEFAULT_FALLBACK_TERMS, FALLBACK_KEYWORDS, known_categories
+from sparse_rates import SparseRates
+
+CARD_NAME_COLUMN = "Card Name"
+
+# Same pattern the ranking code has always used to pull a rate out of a cell
+_RATE_RE = re.compile(r"(-?\d+(?:\.\d+)?)")
+
+
+def parse_rate(value) -> float:
+    """
+    Parses a single matrix cell into a reward rate.
+
+    Strings are cleaned of thousands separators and the first number is
+    extracted ("5% back" -> 5.0). Numeric cells are used as-is, and anything
+    unparseable (including NaN) becomes 0.0.
+    """
+    if isinstance(value, str):
+        match = _RATE_RE.search(value.replace(",", "").strip())
+        return float(match.group(1)) if match else 0.0
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if rate != rate else rate
+
+
+def content_hash(card_names: List[str], columns: List[str], rates: SparseRates) -> str:
+    """Short hash of card names, columns and rates (stable across formats)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([card_names, columns]).encode("utf-8"))
+    for arr, dtype in (
+        (rates.indptr, "<i8"),
+        (rates.indices, "<i4"),
+        (rates.data, "<f8"),
+    ):
+        digest.update(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class MatrixContents:
+    """
+    One version of a matrix: names, rates and the indexes derived from them.
+
+    A MatrixContents is never modified once built; reloads and patches build
+    a new one and publish it with a single assignment (see RewardsMatrix).
+    The derived structures (dense view, category index, ranking tables,
+    offer texts) are built lazily, each for this version only.
+
+    It has the same read API as RewardsMatrix, so code that takes
+    `matrix.contents` once per call can keep using it as a matrix and sees
+    one consistent version throughout.
+
+    Attributes:
+        card_names: Card names in file order
+        columns: Reward category columns in file order ("Card Name" excluded)
+        sparse: Non-zero rates by card and by column (SparseRates)
+        rates: Dense float64 view (cards × columns), materialized on first use
+        version: Version number (RewardsMatrix counts up on every replacement)
+        ranking_tables: Precomputed rankings per candidate column set
+        offer_texts: Memoized offer text per card and matched column set
+    """
+
+    def __init__(
+        self,
+        card_names: List[str],
+        columns: List[str],
+        rates: Union[np.ndarray, SparseRates],
+        version: int = 1,
+        content_hash: Optional[str] = None,
+        ranking_tables=None,
+        category_index: Optional["CategoryColumnIndex"] = None,
+    ):
+        if not isinstance(rates, SparseRates):
+            rates = SparseRates.from_dense(rates)
+        if rates.shape != (len(card_names), len(columns)):
+            raise ValueError(
+                f"Rate array shape {rates.shape} does not match "
+                f"{len(card_names)} cards × {len(columns)} columns."
+            )
+        card_index: Dict[str, int] = {}
+        card_index_lower: Dict[str, int] = {}
+        for i, name in enumerate(card_names):
+            card_index.setdefault(name, i)
+            card_index_lower.setdefault(name.lower(), i)
+
+        self.card_names = list(card_names)
+        self.card_names_lower = [name.lower() for name in card_names]
+        self.columns = list(columns)
+        self.column_index = {col: j for j, col in enumerate(columns)}
+        self.sparse = rates
+        self.version = version
+        self._dense: Optional[np.ndarray] = None
+        self._card_index = card_index
+        self._card_index_lower = card_index_lower
+        # The column index depends only on the columns, so it can be shared
+        self._category_index = category_index
+        self._content_hash = content_hash
+        # (header section, arrays) from a snapshot, turned into RankingTables lazily
+        self._ranking_tables_data = ranking_tables
+        self._ranking_tables = None
+        self._offer_texts = None
+
+    @property
+    def contents(self) -> "MatrixContents":
+        return self
+
+    def refresh(self) -> bool:
+        """A fixed version never reloads."""
+        return False
+
+    @property
+    def shape(self):
+        return self.sparse.shape
+
+    @property
+    def rates(self) -> np.ndarray:
+        """Dense cards × columns array (built from the sparse form and cached)."""
+        dense = self._dense
+        if dense is None:
+            dense = self.sparse.to_dense()
+            dense.flags.writeable = False
+            self._dense = dense
+        return dense
+
+    def row_for(self, card_name: str) -> Optional[int]:
+        """Row index for an exact card name, or None."""
+        return self._card_index.get(card_name)
+
+    def row_for_lower(self, card_name: str) -> Optional[int]:
+        """Row index for a card name compared case-insensitively, or None."""
+        return self._card_index_lower.get(card_name.lower())
+
+    @property
+    def content_hash(self) -> str:
+        """Short hash of card names, columns and rates (stable across formats)."""
+        if self._content_hash is None:
+            self._content_hash = content_hash(self.card_names, self.columns, self.sparse)
+        return self._content_hash
+
+    @property
+    def category_index(self) -> "CategoryColumnIndex":
+        """Category → column index for these columns (built lazily)."""
+        index = self._category_index
+        if index is None:
+            index = CategoryColumnIndex(self.columns, known_categories())
+            self._category_index = index
+        return index
+
+    @property
+    def ranking_tables(self):
+        """RankingTables for this version (see ranking_tables.py)."""
+        tables = self._ranking_tables
+        if tables is None:
+            from ranking_tables import RankingTables
+
+            data = self._ranking_tables_data
+            if data is not None:
+                tables = RankingTables.from_arrays(self, *data)
+            else:
+                tables = RankingTables(self)
+            self._ranking_tables = tables
+        return tables
+
+    @property
+    def offer_texts(self):
+        """OfferTextCache for this version (see offer_text.py)."""
+        texts = self._offer_texts
+        if texts is None:
+            from offer_text import OfferTextCache
+
+            texts = OfferTextCache(self)
+            self._offer_texts = texts
+        return texts
+
+
+class RewardsMatrix:
+    """
+    Cards × categories reward rates with name → row and column → index maps.
+
+    The data lives in a MatrixContents, which a reload or patch replaces
+    whole. The read attributes below always show the current contents; a
+    reader that needs several of them to agree (names with rates, say)
+    takes `matrix.contents` once and reads from that.
+
+    Attributes:
+        contents: Current MatrixContents
+        card_names, columns, sparse, rates, version, ranking_tables,
+        offer_texts: Those of the current contents
+        source_path: CSV or snapshot the matrix was loaded from, if any
+    """
+
+    def __init__(
+        self,
+        card_names: List[str],
+        columns: List[str],
+        rates: Union[np.ndarray, SparseRates],
+        source_path: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        ranking_tables=None,
+    ):
+        self._attach(
+            MatrixContents(card_names, columns, rates, 1, content_hash, ranking_tables),
+            source_path,
+        )
+
+    def _attach(self, contents: MatrixContents, source_path: Optional[str]) -> None:
+        self.source_path = source_path
+        self._contents = contents
+        self._mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+        # Objects told about in-place patches (see matrix_diff.apply_diff)
+        self._watchers: "weakref.WeakSet" = weakref.WeakSet()
+
+    @classmethod
+    def from_contents(cls, contents: MatrixContents) -> "RewardsMatrix":
+        """Matrix (with no source file) starting at existing contents."""
+        matrix = cls.__new__(cls)
+        matrix._attach(contents, None)
+        return matrix
+
+    def _set_data(
+        self,
+        card_names: List[str],
+        columns: List[str],
+        rates: Union[np.ndarray, SparseRates],
+        content_hash: Optional[str] = None,
+        ranking_tables=None,
+        category_index: Optional["CategoryColumnIndex"] = None,
+    ) -> None:
+        # Built in full first, then published with one assignment, so a
+        # concurrent reader holding the old contents is unaffected
+        self._contents = MatrixContents(
+            card_names, columns, rates, self._contents.version + 1,
+            content_hash, ranking_tables, category_index,
+        )
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    @classmethod
+    def from_file(cls, path: str) -> "RewardsMatrix":
+        """
+        Loads a rewards matrix CSV or binary snapshot.
+
+        Args:
+            path: Path to the rewards matrix CSV or snapshot
+
+        Returns:
+            RewardsMatrix whose mtime is tracked for automatic reloads
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        card_names, columns, rates, content_hash, tables = _read_matrix_file(path)
+        matrix = cls(
+            card_names, columns, rates, source_path=path,
+            content_hash=content_hash, ranking_tables=tables,
+        )
+        matrix._mtime_ns = mtime_ns
+        return matrix
+
+    # Kept for callers that only ever deal with CSVs
+    from_csv = from_file
+
+    def refresh(self) -> bool:
+        """
+        Reloads the matrix if its source file changed on disk.
+
+        Returns:
+            True if the matrix was reloaded
+        """
+        if self.source_path is None:
+            return False
+        try:
+            mtime_ns = os.stat(self.source_path).st_mtime_ns
+        except OSError:
+            # Keep serving the last good copy if the file is briefly missing
+            return False
+        if mtime_ns == self._mtime_ns:
+            return False
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return False
+            card_names, columns, rates, content_hash, tables = _read_matrix_file(self.source_path)
+            self._set_data(card_names, columns, rates, content_hash, tables)
+            self._mtime_ns = mtime_ns
+        return True
+
+    def copy(self) -> "RewardsMatrix":
+        """
+        Detached matrix at the same contents (no source file, no watchers).
+
+        Contents are immutable, so the copy shares them (and their ranking
+        tables); patching the copy publishes new contents on the copy only.
+        """
+        return RewardsMatrix.from_contents(self._contents)
+
+    def add_watcher(self, watcher) -> None:
+        """
+        Registers an object whose matrix_patched(diff, old_version,
+        new_version) method is called after matrix_diff.apply_diff patches
+        this matrix. Watchers are held weakly.
+        """
+        self._watchers.add(watcher)
+
+    # -------------------------------------------------------------------------
+    # Lookups (each reads the current contents)
+    # -------------------------------------------------------------------------
+
+    @property
+    def contents(self) -> MatrixContents:
+        """Current contents; take once per call for a consistent view."""
+        return self._contents
+
+    @property
+    def version(self) -> int:
+        return self._contents.version
+
+    @property
+    def card_names(self) -> List[str]:
+        return self._contents.card_names
+
+    @property
+    def card_names_lower(self) -> List[str]:
+        return self._contents.card_names_lower
+
+    @property
+    def columns(self) -> List[str]:
+        return self._contents.columns
+
+    @property
+    def column_index(self) -> Dict[str, int]:
+        return self._contents.column_index
+
+    @property
+    def sparse(self) -> SparseRates:
+        return self._contents.sparse
+
+    @property
+    def shape(self):
+        return self._contents.shape
+
+    @property
+    def rates(self) -> np.ndarray:
+        return self._contents.rates
+
+    def row_for(self, card_name: str) -> Optional[int]:
+        return self._contents.row_for(card_name)
+
+    def row_for_lower(self, card_name: str) -> Optional[int]:
+        return self._contents.row_for_lower(card_name)
+
+    @property
+    def content_hash(self) -> str:
+        return self._contents.content_hash
+
+    @property
+    def category_index(self) -> "CategoryColumnIndex":
+        return self._contents.category_index
+
+    @property
+    def ranking_tables(self):
+        return self._contents.ranking_tables
+
+    @property
+    def offer_texts(self):
+        return self._contents.offer_texts
+
+
+# -----------------------------------------------------------------------------
+# Category → column index
+# -----------------------------------------------------------------------------
+
+# Unknown categories are resolved on demand; cap how many we remember
+_MAX_CACHED_CATEGORIES = 4096
+
+
+class CategoryColumnIndex:
+    """
+    Resolves categories to the set of matrix columns they match.
+
+    A category matches every column that contains it (case-insensitive), plus
+    the columns matched by the generic fallback terms ("Everywhere",
+    "Other purchases"). This is exactly the set of columns the search terms
+    from map_to_category.build_search_terms would match, so lookups give the
+    same results as scanning the columns with substring tests.
+
+    Known categories are resolved when the index is built; anything else is
+    resolved on first use and memoized.
+    """
+
+    def __init__(self, columns: List[str], categories: Iterable[str] = ()):
+        self.columns_lower = [col.lower() for col in columns]
+        self._term_columns: Dict[str, FrozenSet[int]] = {}
+        self._category_columns: Dict[str, FrozenSet[int]] = {}
+
+        default_columns: FrozenSet[int] = frozenset()
+        for term in DEFAULT_FALLBACK_TERMS:
+            default_columns |= self.columns_for_term(term)
+        self._default_columns = default_columns
+
+        # Columns used when nothing (not even the default terms) matches
+        fallback = frozenset()
+        for keyword in FALLBACK_KEYWORDS:
+            fallback |= self.columns_for_term(keyword)
+        self.fallback_columns = tuple(sorted(fallback))
+
+        for category in categories:
+            self.columns_for_category(category)
+
+    def columns_for_term(self, term: str) -> FrozenSet[int]:
+        """Indices of columns containing a term (case-insensitive)."""
+        key = term.lower()
+        columns = self._term_columns.get(key)
+        if columns is None:
+            columns = frozenset(
+                j for j, col in enumerate(self.columns_lower) if key in col
+            )
+            if len(self._term_columns) >= _MAX_CACHED_CATEGORIES:
+                self._term_columns.clear()
+            self._term_columns[key] = columns
+        return columns
+
+    def columns_for_category(self, category: str) -> FrozenSet[int]:
+        """
+        Indices of columns matched by a category's search terms.
+
+        Args:
+            category: Reward category name (as returned by the mappers)
+
+        Returns:
+            Frozen set of column indices (possibly empty)
+        """
+        columns = self._category_columns.get(category)
+        if columns is None:
+            normalized = (category or "").strip()
+            if normalized:
+                columns = self.columns_for_term(normalized) | self._default_columns
+            else:
+                columns = self._default_columns
+            if len(self._category_columns) >= _MAX_CACHED_CATEGORIES:
+                self._category_columns.clear()
+            self._category_columns[category] = columns
+        return columns
+
+    def columns_for_categories(self, categories: Iterable[str]) -> FrozenSet[int]:
+        """Union of columns_for_category over several categories."""
+        columns: FrozenSet[int] = frozenset()
+        for category in categories:
+            columns |= self.columns_for_category(category)
+        return columns
+
+
+def _read_matrix_file(path: str):
+    from matrix_snapshot import is_snapshot, read_snapshot_arrays
+
+    with stage("matrix.load"):
+        if is_snapshot(path):
+            return read_snapshot_arrays(path)
+        card_names, columns, rates = _read_matrix_csv(path)
+        return card_names, columns, rates, None, None
+
+
+def _read_matrix_csv(path: str):
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    if CARD_NAME_COLUMN not in df.columns:
+        raise ValueError("Matrix CSV must have a 'Card Name' column.")
+
+    columns = [col for col in df.columns if col != CARD_NAME_COLUMN]
+    card_names = [str(name) for name in df[CARD_NAME_COLUMN].tolist()]
+    rates = np.zeros((len(card_names), len(columns)), dtype=np.float64)
+    for j, col in enumerate(columns):
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series):
+            rates[:, j] = pd.to_numeric(series, errors="coerce").fillna(0.0).to_numpy()
+        else:
+            rates[:, j] = [parse_rate(value) for value in series.tolist()]
+    return card_names, columns, rates
+
+
+# -----------------------------------------------------------------------------
+# Per-path cache
+# -----------------------------------------------------------------------------
+
+_MATRIX_CACHE: Dict[str, RewardsMatrix] = {}
+_MATRIX_CACHE_LOCK = threading.Lock()
+
+
+def load_matrix(path: str = "card_rewards_matrix.csv") -> RewardsMatrix:
+    """
+    Returns the cached matrix for a path, loading or reloading it as needed.
+
+    Args:
+        path: Path to the rewards matrix CSV or binary snapshot
+
+    Returns:
+        Shared RewardsMatrix instance for that file
+    """
+    key = os.path.abspath(path)
+    matrix = _MATRIX_CACHE.get(key)
+    if matrix is None:
+        with _MATRIX_CACHE_LOCK:
+            matrix = _MATRIX_CACHE.get(key)
+            if matrix is None:
+                matrix = RewardsMatrix.from_file(key)
+                _MATRIX_CACHE[key] = matrix
+                return matrix
+    matrix.refresh()
+    return matrix
@@ -0,0 +1,563 @@
+"""
+Local HTTP recommendation service.
+
+Keeps the rewards matrix, its ranking tables and the mapping tables warm in
+one long-running process, so a recommendation costs a lookup instead of an
+interpreter start, a CSV parse and a fresh Places connection. Requests and
+responses are JSON, and every endpoint takes a batch:
+
+    POST /map        {"places": [{"name": "Starbucks", "types": ["cafe"]}, ...]}
+    POST /rank       {"queries": [{"category": "Dining", "categories": [...],
+                                   "top_n": 5, "cards": [...]}, ...],
+                      "top_n": 20, "cards": [...]}     (per-query values win)
+    POST /recommend  {"addresses": ["1 Market St, SF", ...], "top_n": 5, "cards": [...]}
+    POST /reload     {}  reload the matrix file now, or
+                     {"patch": <matrix_diff JSON>}  apply a patch (verified, then swapped in)
+    GET  /health     matrix version/hash and cache counters
+    GET  /metrics    Prometheus text (when started with --metrics)
+
+"cards" is a whitelist (omit for USER_CARDS, [] for the whole catalog).
+/recommend runs the same pipeline as map.py: Places lookup (pooled, cached,
+concurrent), merchant → category mapping (ResolutionCache) and ranking
+(RankingCache).
+
+Reloads are graceful: a changed matrix file is loaded and warmed off the
+request path, then swapped in; requests already ranking finish on the old
+matrix. A file watcher polls the matrix's mtime, and SIGHUP forces a check.
+
+Usage:
+    python server.py [--port 8080] [--matrix card_rewards_matrix.cgrm]
+                     [--places-url http://127.0.0.1:8765/maps/api/place/findplacefromtext/json]
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import map_to_category
+from instrumentation import get_recorder, incr, stage
+from matrix_diff import MatrixDiff, apply_diff
+from ranking import RankingCache
+from resolution_cache import ResolutionCache
+from rewards_matrix import RewardsMatrix
+
+DEFAULT_TOP_N = 20
+
+
+class RequestError(ValueError):
+    """A malformed request (answered with HTTP 400)."""
+
+
+class RecommendationService:
+    """
+    Warm state and request handling, independent of the HTTP layer.
+
+    Args:
+        matrix_path: Rewards matrix CSV or snapshot
+        places_client: PlacesClient for /recommend (None disables it)
+        resolver: ResolutionCache for merchant → category mapping
+        max_batch: Largest batch accepted per request
+        cache_entries: Size of the ranking result cache
+    """
+
+    def __init__(
+        self,
+        matrix_path: str = "card_rewards_matrix.csv",
+        places_client=None,
+        resolver: Optional[ResolutionCache] = None,
+        max_batch: int = 1000,
+        cache_entries: int = 4096,
+    ):
+        self.matrix_path = matrix_path
+        self.places_client = places_client
+        self.resolver = resolver if resolver is not None else ResolutionCache()
+        self.max_batch = max_batch
+        self.cache_entries = cache_entries
+        self.reloads = 0
+        self.patches = 0
+        # Ranking and matrix swaps/patches are serialized; ranking is
+        # CPU-bound and short, and Places I/O happens outside the lock
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Warm the mapping tables (brand matchers, fuzzy index, fingerprint)
+        map_to_category.rules_fingerprint()
+        map_to_category.resolve_place_categories("", [])
+        self._mtime_ns, self._matrix, self._cache = self._load()
+
+    # -------------------------------------------------------------------------
+    # Matrix state
+    # -------------------------------------------------------------------------
+
+    def _load(self) -> Tuple[int, RewardsMatrix, RankingCache]:
+        """Loads and warms a matrix (off the request path)."""
+        mtime_ns = os.stat(self.matrix_path).st_mtime_ns
+        matrix = RewardsMatrix.from_file(self.matrix_path)
+        # The service reloads by swapping whole matrices; the matrix itself
+        # must not reload in place under a request
+        matrix.source_path = None
+        matrix.ranking_tables.precompute()
+        return mtime_ns, matrix, RankingCache(matrix, self.cache_entries)
+
+    @property
+    def matrix(self) -> RewardsMatrix:
+        return self._matrix
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Swaps in the matrix file if it changed on disk (or always, if forced).
+
+        Returns:
+            True if a new matrix was swapped in
+        """
+        with self._reload_lock:
+            try:
+                mtime_ns = os.stat(self.matrix_path).st_mtime_ns
+            except OSError:
+                # Keep serving the last good copy if the file is briefly missing
+                return False
+            if not force and mtime_ns == self._mtime_ns:
+                return False
+            with stage("server.reload"):
+                loaded = self._load()
+            with self._lock:
+                self._mtime_ns, self._matrix, self._cache = loaded
+                self.reloads += 1
+            incr("server.reload")
+            return True
+
+    def patch(self, diff: MatrixDiff) -> Dict[str, Any]:
+        """
+        Applies a matrix_diff patch.
+
+        The patch is applied to a copy of the live matrix and verified
+        (apply_diff checks both content hashes), then the copy is warmed and
+        swapped in like a reload. Ranking tables and cached rankings the diff
+        doesn't touch are carried over, so only those covering a changed cell
+        are rebuilt. A rejected patch raises ValueError and the live matrix
+        keeps serving.
+        """
+        with self._reload_lock:
+            live = self._matrix
+            patched = live.copy()
+            with stage("server.patch"):
+                result = apply_diff(patched, diff)
+                tables = patched.ranking_tables
+                tables.carry_over(live.ranking_tables, diff)
+                tables.precompute()
+            cache = RankingCache(patched, self.cache_entries)
+            with self._lock:
+                invalidated = cache.carry_over(self._cache, diff)
+                self._matrix, self._cache = patched, cache
+                self.patches += 1
+        incr("server.patch")
+        return {
+            "version": result.version,
+            "content_hash": patched.content_hash,
+            "invalidated": invalidated,
+            "changelog": result.changelog,
+        }
+
+    def start_watcher(self, interval: float = 2.0) -> None:
+        """Polls the matrix file's mtime in the background."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as exc:  # a bad file must not stop the watcher
+                    print(f"Matrix reload failed: {exc}")
+
+        self._watcher = threading.Thread(target=watch, name="matrix-watcher", daemon=True)
+        self._watcher.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        if self.places_client is not None:
+            self.places_client.close()
+        self.resolver.close()
+
+    # -------------------------------------------------------------------------
+    # Endpoints
+    # -------------------------------------------------------------------------
+
+    def map_places(self, places: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Categories for a batch of {"name", "types"} places."""
+        self._check_batch(places, "places")
+        results = []
+        with stage("server.map"):
+            for place in places:
+                if not isinstance(place, dict):
+                    raise RequestError("Each place must be an object with name and types.")
+                resolution = self.resolver.resolve(
+                    str(place.get("name") or ""), _names(place.get("types"), "types") or []
+                )
+                results.append(_resolution_dict(resolution))
+        return results
+
+    def rank(
+        self,
+        queries: List[Dict[str, Any]],
+        top_n: int = DEFAULT_TOP_N,
+        cards: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Best cards for a batch of category queries."""
+        self._check_batch(queries, "queries")
+        results = []
+        with stage("server.rank"), self._lock:
+            cache = self._cache
+            for query in queries:
+                if not isinstance(query, dict) or not isinstance(query.get("category", ""), str):
+                    raise RequestError("Each query must be an object with a category.")
+                ranked = cache.get_best_cards_for_category(
+                    query.get("category", ""),
+                    top_n=_int(query.get("top_n", top_n), "top_n"),
+                    card_whitelist=_names(query.get("cards", cards), "cards"),
+                    categories=_names(query.get("categories"), "categories") or None,
+                )
+                results.append(_cards_list(ranked))
+        return results
+
+    def recommend(
+        self,
+        addresses: List[str],
+        top_n: int = DEFAULT_TOP_N,
+        cards: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Places lookup, category mapping and ranking for a batch of addresses."""
+        if self.places_client is None:
+            raise RequestError("Places lookups are not configured on this server.")
+        self._check_batch(addresses, "addresses")
+        with stage("server.places"):
+            lookups = self.places_client.find_places([str(a) for a in addresses])
+
+        results: List[Dict[str, Any]] = []
+        rank_queries: List[Tuple[int, Dict[str, Any]]] = []
+        for lookup in lookups:
+            item: Dict[str, Any] = {"query": lookup.query, "place": None}
+            results.append(item)
+            if lookup.error is not None:
+                item["error"] = str(lookup.error)
+                continue
+            if lookup.place is None:
+                continue
+            place = lookup.place
+            item["place"] = {
+                key: place.get(key) for key in ("name", "formatted_address", "place_id", "types")
+            }
+            resolution = self.resolver.resolve(place.get("name", ""), place.get("types", []))
+            item.update(_resolution_dict(resolution))
+            # Same query map.py makes for a place
+            categories_used = [
+                c for c in (resolution.brand_category, resolution.default_category) if c
+            ]
+            rank_queries.append((len(results) - 1, {
+                "category": resolution.category or "Other purchases",
+                "categories": categories_used,
+            }))
+
+        ranked = self.rank([q for _, q in rank_queries], top_n, cards) if rank_queries else []
+        for (i, _), cards_list in zip(rank_queries, ranked):
+            results[i]["cards"] = cards_list
+        return results
+
+    def health(self) -> Dict[str, Any]:
+        matrix, cache = self._matrix, self._cache
+        health = {
+            "status": "ok",
+            "matrix": {
+                "path": self.matrix_path,
+                "content_hash": matrix.content_hash,
+                "version": matrix.version,
+                "cards": matrix.shape[0],
+                "columns": matrix.shape[1],
+                "ranking_tables": len(matrix.ranking_tables),
+                "reloads": self.reloads,
+                "patches": self.patches,
+            },
+            "ranking_cache": {
+                "size": len(cache),
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "invalidations": cache.invalidations,
+            },
+            "resolution_cache": self.resolver.stats,
+        }
+        if self.places_client is not None:
+            health["places"] = self.places_client.stats()
+        return health
+
+    def _check_batch(self, items: Any, field: str) -> None:
+        if not isinstance(items, list):
+            raise RequestError(f"{field!r} must be a list.")
+        if len(items) > self.max_batch:
+            raise RequestError(f"At most {self.max_batch} {field} per request.")
+
+
+def _int(value: Any, field: str) -> int:
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise RequestError(f"{field!r} must be a non-negative integer.")
+    return value
+
+
+def _names(value: Any, field: str) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise RequestError(f"{field!r} must be a list of strings.")
+    return value
+
+
+def _resolution_dict(resolution) -> Dict[str, Any]:
+    return {
+        "brand_category": resolution.brand_category,
+        "default_category": resolution.default_category,
+        "category": resolution.category,
+        "rule": resolution.rule,
+    }
+
+
+def _cards_list(ranked: List[Tuple[str, float, str]]) -> List[Dict[str, Any]]:
+    return [{"card": card, "rate": rate, "offer": offer} for card, rate, offer in ranked]
+
+
+# -----------------------------------------------------------------------------
+# HTTP layer
+# -----------------------------------------------------------------------------
+
+class RecommendationServer:
+    """
+    Threaded HTTP front end for a RecommendationService.
+
+    Args:
+        service: Service answering the requests
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+    """
+
+    def __init__(self, service: RecommendationService, host: str = "127.0.0.1", port: int = 0):
+        self.service = service
+        self._thread: Optional[threading.Thread] = None
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "RecommendationServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "RecommendationServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -------------------------------------------------------------------------
+    # Request handling
+    # -------------------------------------------------------------------------
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        path = request.path.split("?", 1)[0]
+        try:
+            if method == "GET" and path == "/health":
+                self._send(request, 200, self.service.health())
+            elif method == "GET" and path == "/metrics":
+                recorder = get_recorder()
+                if recorder is None:
+                    self._send(request, 404, {"error": "metrics are disabled"})
+                else:
+                    self._send_text(request, recorder.to_prometheus())
+            elif method == "POST" and path in _POST_ROUTES:
+                body = self._read_json(request)
+                self._send(request, 200, _POST_ROUTES[path](self.service, body))
+            else:
+                self._send(request, 404, {"error": "not found"})
+        except RequestError as exc:
+            self._send(request, 400, {"error": str(exc)})
+        except Exception as exc:
+            self._send(request, 500, {"error": f"{type(exc).__name__}: {exc}"})
+
+    @staticmethod
+    def _read_json(request: BaseHTTPRequestHandler) -> Dict[str, Any]:
+        length = int(request.headers.get("Content-Length") or 0)
+        raw = request.rfile.read(length) if length else b"{}"
+        try:
+            body = json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise RequestError(f"Invalid JSON: {exc}") from exc
+        if not isinstance(body, dict):
+            raise RequestError("Request body must be a JSON object.")
+        return body
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json; charset=utf-8")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    @staticmethod
+    def _send_text(request: BaseHTTPRequestHandler, text: str) -> None:
+        payload = text.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "text/plain; version=0.0.4")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+def _post_map(service: RecommendationService, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {"results": service.map_places(body.get("places"))}
+
+
+def _post_rank(service: RecommendationService, body: Dict[str, Any]) -> Dict[str, Any]:
+    top_n = _int(body.get("top_n", DEFAULT_TOP_N), "top_n")
+    return {"results": service.rank(body.get("queries"), top_n, body.get("cards"))}
+
+
+def _post_recommend(service: RecommendationService, body: Dict[str, Any]) -> Dict[str, Any]:
+    top_n = _int(body.get("top_n", DEFAULT_TOP_N), "top_n")
+    return {"results": service.recommend(body.get("addresses"), top_n, body.get("cards"))}
+
+
+def _post_reload(service: RecommendationService, body: Dict[str, Any]) -> Dict[str, Any]:
+    if body.get("patch") is not None:
+        try:
+            diff = MatrixDiff.from_dict(body["patch"])
+        except (KeyError, TypeError, ValueError) as exc:
+            raise RequestError(f"Invalid patch: {exc}") from exc
+        try:
+            return {"patched": service.patch(diff)}
+        except ValueError as exc:
+            raise RequestError(str(exc)) from exc
+    reloaded = service.reload(force=bool(body.get("force")))
+    return {"reloaded": reloaded, "content_hash": service.matrix.content_hash}
+
+
+_POST_ROUTES = {
+    "/map": _post_map,
+    "/rank": _post_rank,
+    "/recommend": _post_recommend,
+    "/reload": _post_reload,
+}
+
+
+def build_service(
+    matrix_path: str = "card_rewards_matrix.csv",
+    places_url: Optional[str] = None,
+    places_concurrency: int = 16,
+) -> RecommendationService:
+    """
+    Builds a service from environment settings, like map.py does.
+
+    GOOGLE_PLACES_API_KEY enables /recommend against Google (any key works
+    with a places_url stub); PLACES_CACHE_* and RESOLUTION_CACHE_DB configure
+    the caches as for the CLI.
+    """
+    from dotenv import load_dotenv
+
+    from places_cache import cache_from_env
+    from places_client import FIND_PLACE_URL, PlacesClient
+    from resolution_cache import resolution_cache_from_env
+
+    load_dotenv()
+    api_key = os.environ.get("GOOGLE_PLACES_API_KEY") or ("local" if places_url else None)
+    client = None
+    if api_key:
+        client = PlacesClient(
+            api_key,
+            cache=cache_from_env(),
+            base_url=places_url or FIND_PLACE_URL,
+            max_concurrency=places_concurrency,
+        )
+    return RecommendationService(
+        matrix_path, places_client=client, resolver=resolution_cache_from_env()
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve card recommendations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="CSV or snapshot")
+    parser.add_argument("--places-url", help="findplacefromtext endpoint (e.g. fake_places.py)")
+    parser.add_argument("--places-concurrency", type=int, default=16)
+    parser.add_argument(
+        "--reload-interval", type=float, default=2.0,
+        help="seconds between matrix mtime checks (0 disables the watcher)",
+    )
+    parser.add_argument("--metrics", action="store_true", help="record stage timings for /metrics")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        import instrumentation
+
+        instrumentation.enable()
+    start = time.perf_counter()
+    service = build_service(args.matrix, args.places_url, args.places_concurrency)
+    service.start_watcher(args.reload_interval)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(
+            signal.SIGHUP,
+            lambda *_: threading.Thread(target=service.reload, daemon=True).start(),
+        )
+    server = RecommendationServer(service, args.host, args.port)
+    print(
+        f"Serving on {server.base_url} (warm in {time.perf_counter() - start:.2f}s, "
+        f"matrix {service.matrix.content_hash}, "
+        f"places {'on' if service.places_client else 'off'})"
+    )
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+"""
+Sparse storage for the cards × categories rate matrix.
+
+Most cells of the rewards matrix are zero, so rates are kept in two
+compressed forms over the same non-zero entries:
+
+- CSR by card (indptr / indices / data): a card's offers are one slice, so
+  per-card offer text only touches that card's non-zero categories.
+- Per-column lists (col_indptr / col_rows / col_data): scoring a category
+  only touches the cards that actually earn something in its columns.
+
+Memory scales with the number of real offers rather than cards × columns.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SparseRates:
+    """
+    Non-zero reward rates in CSR (by card) and per-column form.
+
+    Args:
+        shape: (n_cards, n_columns)
+        indptr: int64 array, row i's entries are [indptr[i], indptr[i + 1])
+        indices: int32 column index of each entry (ascending within a row)
+        data: float64 rate of each entry
+        col_indptr, col_rows, col_data: Same entries grouped by column
+            (computed from the CSR arrays when omitted)
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+        col_indptr: Optional[np.ndarray] = None,
+        col_rows: Optional[np.ndarray] = None,
+        col_data: Optional[np.ndarray] = None,
+    ):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        if col_indptr is None or col_rows is None or col_data is None:
+            col_indptr, col_rows, col_data = self._by_column()
+        self.col_indptr = col_indptr
+        self.col_rows = col_rows
+        self.col_data = col_data
+
+    @classmethod
+    def from_dense(cls, dense: np.ndarray) -> "SparseRates":
+        """Builds the sparse form of a dense (cards × columns) array."""
+        dense = np.asarray(dense, dtype=np.float64)
+        rows, cols = np.nonzero(dense)
+        indptr = np.zeros(dense.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=dense.shape[0]), out=indptr[1:])
+        return cls(
+            dense.shape,
+            indptr,
+            cols.astype(np.int32),
+            dense[rows, cols].astype(np.float64),
+        )
+
+    def _by_column(self):
+        n_cards, n_cols = self.shape
+        entry_rows = np.repeat(
+            np.arange(n_cards, dtype=np.int32), np.diff(self.indptr).astype(np.int64)
+        )
+        order = np.argsort(self.indices, kind="stable")
+        col_indptr = np.zeros(n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=n_cols), out=col_indptr[1:])
+        return col_indptr, entry_rows[order], self.data[order]
+
+    # -------------------------------------------------------------------------
+    # Access
+    # -------------------------------------------------------------------------
+
+    @property
+    def nnz(self) -> int:
+        return int(self.data.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            arr.nbytes
+            for arr in (
+                self.indptr, self.indices, self.data,
+                self.col_indptr, self.col_rows, self.col_data,
+            )
+        )
+
+    def row(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(column indices, rates) of card i's non-zero entries."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def column(self, j: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(card rows, rates) of column j's non-zero entries."""
+        start, end = self.col_indptr[j], self.col_indptr[j + 1]
+        return self.col_rows[start:end], self.col_data[start:end]
+
+    def dense_rows(self, rows: Sequence[int]) -> np.ndarray:
+        """Dense (len(rows) × n_columns) array for the given cards."""
+        out = np.zeros((len(rows), self.shape[1]), dtype=np.float64)
+        for k, i in enumerate(rows):
+            cols, vals = self.row(i)
+            out[k, cols] = vals
+        return out
+
+    def to_dense(self) -> np.ndarray:
+        return self.dense_rows(range(self.shape[0]))
+
+    def max_over_columns(self, rows: Sequence[int], columns: Sequence[int]) -> np.ndarray:
+        """
+        Per-card maximum rate over a set of columns.
+
+        Equivalent to dense[np.ix_(rows, columns)].max(axis=1), but only the
+        non-zero entries of the given columns are visited. Cells that are not
+        stored count as 0.
+
+        Args:
+            rows: Card rows to score (distinct)
+            columns: Column indices to take the maximum over (distinct, non-empty)
+
+        Returns:
+            float64 array aligned with rows
+        """
+        n_rows = len(rows)
+        position = np.full(self.shape[0], -1, dtype=np.int64)
+        position[np.asarray(rows, dtype=np.int64)] = np.arange(n_rows)
+
+        columns = np.asarray(columns, dtype=np.int64)
+        starts = self.col_indptr[columns]
+        lengths = self.col_indptr[columns + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(n_rows, dtype=np.float64)
+
+        # Flat positions of every stored entry in the selected columns
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        entries = offsets + np.arange(total)
+        pos = position[self.col_rows[entries]]
+        keep = pos >= 0
+        pos = pos[keep]
+        vals = self.col_data[entries][keep]
+
+        best = np.full(n_rows, -np.inf)
+        np.maximum.at(best, pos, vals)
+        # Any card with fewer stored entries than columns also has a 0 cell
+        stored = np.bincount(pos, minlength=n_rows)
+        return np.where(stored < len(columns), np.maximum(best, 0.0), best)
@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the scraper tests.
+
+The scraper modules are flat scripts, so the scraper directory goes on
+sys.path. Baselines in tests/data are the original implementation's
+outputs; see generate_baselines.py.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPER_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, SCRAPER_DIR)
+
+from rewards_matrix import RewardsMatrix  # noqa: E402
+
+MATRIX_CSV = os.path.join(SCRAPER_DIR, "card_rewards_matrix.csv")
+
+
+def _load_baseline(filename: str) -> Dict[str, Any]:
+    with open(os.path.join(TESTS_DIR, "data", filename), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="session")
+def ranking_baseline() -> Dict[str, Any]:
+    return _load_baseline("ranking_baseline.json")
+
+
+@pytest.fixture(scope="session")
+def mapping_baseline() -> Dict[str, Any]:
+    return _load_baseline("mapping_baseline.json")
+
+
+@pytest.fixture(scope="session")
+def matrix_csv() -> str:
+    return MATRIX_CSV
+
+
+@pytest.fixture
+def matrix() -> RewardsMatrix:
+    """A freshly loaded copy of the repository's rewards matrix."""
+    return RewardsMatrix.from_file(MATRIX_CSV)
@@ -0,0 +1,146 @@
+"""
+Regenerates the baseline outputs the equivalence tests compare against.
+
+The baselines are what the original map.py and map_to_category.py (before
+the matrix, ranking and mapping rewrites) returned for a fixed set of
+inputs. Check that version out and point this script at its scraper
+directory:
+
+    git worktree add /tmp/baseline 65bfb61
+    python tests/generate_baselines.py /tmp/baseline/scraper
+
+Writes tests/data/ranking_baseline.json and tests/data/mapping_baseline.json.
+Inputs are generated from fixed seeds, so rerunning against the same
+baseline reproduces the files exactly.
+"""
+
+import json
+import os
+import random
+import string
+import sys
+from typing import Any, Dict, List
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPER_DIR = os.path.dirname(TESTS_DIR)
+MATRIX_CSV = os.path.join(SCRAPER_DIR, "card_rewards_matrix.csv")
+NEARBY_FIXTURES = os.path.join(SCRAPER_DIR, "fixtures", "nearby_union_square.json")
+
+
+def _load_baseline(src_dir: str):
+    """Imports the baseline map_to_category and get_best_cards_for_category."""
+    sys.path.insert(0, src_dir)
+    import map_to_category
+
+    with open(os.path.join(src_dir, "map.py"), encoding="utf-8") as f:
+        code = f.read()
+    # The original map.py ran its command-line script at import time
+    code = code.split("# Main Script")[0]
+    namespace: Dict[str, Any] = {"__name__": "baseline_map"}
+    exec(compile(code, "map.py", "exec"), namespace)
+    return map_to_category, namespace["get_best_cards_for_category"]
+
+
+def ranking_cases(mtc, get_best_cards) -> Dict[str, Any]:
+    import pandas as pd
+
+    all_cards = pd.read_csv(MATRIX_CSV)["Card Name"].tolist()
+    categories = sorted(
+        set(mtc.CATEGORIES) | set(mtc.TYPE_TO_CATEGORY.values()) | set(mtc.BRAND_OVERRIDES.values())
+    ) + ["", "Nonexistent thing", "hotel", "AIR"]
+    rnd = random.Random(1)
+    whitelists = [
+        (None, 5),
+        (all_cards[:40], 12),
+        ([name.upper() for name in rnd.sample(all_cards, 30)] + ["Fake Card"], 5),
+    ]
+    cases = []
+    for index, (whitelist, top_n) in enumerate(whitelists):
+        for category in categories:
+            extra = rnd.choice(categories)
+            for combined in (None, [category, extra]):
+                result = get_best_cards(
+                    category,
+                    top_n=top_n,
+                    matrix_csv_path=MATRIX_CSV,
+                    card_whitelist=whitelist,
+                    categories=combined,
+                )
+                cases.append({
+                    "category": category,
+                    "categories": combined,
+                    "top_n": top_n,
+                    "card_whitelist": index,
+                    "expected": [list(row) for row in result],
+                })
+    return {"card_whitelists": [whitelist for whitelist, _ in whitelists], "cases": cases}
+
+
+def _place_names(mtc, rnd: random.Random) -> List[Any]:
+    brands = list(mtc.BRAND_OVERRIDES)
+    words = [
+        "Store", "Market", "the", "&", "Co.", "Inc", "'s", "Gas", "Station", "Hotel", "Cafe",
+        "Restaurant", "Depot", "", "Grocery", "Dining", "Targe", "Theatres",
+    ]
+    names: List[Any] = []
+    for _ in range(3000):
+        parts = [rnd.choice(words) for _ in range(rnd.randint(0, 3))]
+        if rnd.random() < 0.7:
+            brand = rnd.choice(brands)
+            parts.insert(rnd.randint(0, len(parts)), brand.title() if rnd.random() < 0.5 else brand)
+        if rnd.random() < 0.3:
+            noise = "".join(rnd.choice(string.ascii_letters) for _ in range(rnd.randint(1, 9)))
+            parts.insert(0, noise)
+        names.append(" ".join(parts))
+    for brand in brands:
+        names += [brand, brand.title(), brand.upper(), f"{brand} #1042", f"The {brand} Store"]
+    names += ["", None, "Target", "Whole Foods Market", "Sams Club", "AT&T Store", "Barnes and Noble", "Reise"]
+    return names
+
+
+def mapping_cases(mtc) -> Dict[str, Any]:
+    rnd = random.Random(5)
+    types_pool = list(mtc.TYPE_TO_CATEGORY) + ["point_of_interest", "establishment"]
+    inputs = []
+    for name in _place_names(mtc, rnd):
+        types = rnd.sample(types_pool, rnd.randint(0, 2)) if rnd.random() < 0.6 else []
+        inputs.append((name, types))
+    inputs += [("", [place_type]) for place_type in types_pool]
+    with open(NEARBY_FIXTURES, encoding="utf-8") as f:
+        inputs += [(place["name"], place["types"]) for place in json.load(f)["results"]]
+
+    cases = []
+    for name, types in inputs:
+        cases.append({
+            "name": name,
+            "types": types,
+            "category": mtc.map_place_to_category(name, types),
+            "categories": list(mtc.map_place_to_categories(name, types)),
+        })
+    return {"cases": cases}
+
+
+def main() -> int:
+    if len(sys.argv) != 2:
+        print(__doc__, file=sys.stderr)
+        return 2
+    mtc, get_best_cards = _load_baseline(os.path.abspath(sys.argv[1]))
+    outputs = {
+        "ranking_baseline.json": ranking_cases(mtc, get_best_cards),
+        "mapping_baseline.json": mapping_cases(mtc),
+    }
+    for filename, baseline in outputs.items():
+        with open(os.path.join(TESTS_DIR, "data", filename), "w", encoding="utf-8") as f:
+            # One case per line keeps diffs of a regenerated baseline readable
+            f.write("{\n")
+            for key, value in baseline.items():
+                if key != "cases":
+                    f.write(f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+            lines = ",\n".join(json.dumps(case, ensure_ascii=False, separators=(",", ":")) for case in baseline["cases"])
+            f.write(f'"cases": [\n{lines}\n]\n}}\n')
+        print(f"{filename}: {len(baseline['cases'])} cases")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
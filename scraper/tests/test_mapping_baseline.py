@@ -0,0 +1,71 @@
+"""
+Place → category mapping must match the original implementation.
+
+The trigram matcher only scores a shortlist of candidates, so a few junk
+names that difflib's exhaustive search matched to some category now fall
+through to "Other purchases" (or a different default category). Those are
+listed in KNOWN_FUZZY_MISSES; everything else must be identical. With the
+original DifflibMatcher plugged in, every case matches.
+"""
+
+from typing import Any, Dict, List
+
+import pytest
+
+import map_to_category
+from fuzzy_matcher import DifflibMatcher
+
+# (name, types) pairs the trigram shortlist no longer recalls
+KNOWN_FUZZY_MISSES = [
+    ("Market", []),
+    ("Market", ["establishment"]),
+    ("the", []),
+    ("the", ["point_of_interest"]),
+    ("ihg Market Store", []),
+    ("Market Store Att", []),
+    ("The target Store", []),
+    ("The marriott Store", []),
+    ("The rei Store", []),
+    ("The walgreens Store", []),
+]
+
+
+def _key(case: Dict[str, Any]) -> tuple:
+    return (case["name"], tuple(case["types"]))
+
+
+def _mismatches(cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    mismatches = []
+    for case in cases:
+        category = map_to_category.map_place_to_category(case["name"], case["types"])
+        categories = map_to_category.map_place_to_categories(case["name"], case["types"])
+        if category != case["category"] or list(categories) != case["categories"]:
+            mismatches.append(case)
+    return mismatches
+
+
+@pytest.fixture
+def difflib_matcher():
+    matcher = map_to_category.get_fuzzy_matcher()
+    map_to_category.set_fuzzy_matcher(DifflibMatcher(map_to_category.CATEGORIES))
+    yield
+    map_to_category.set_fuzzy_matcher(matcher)
+
+
+def test_mapping_matches_baseline(mapping_baseline):
+    known = {(name, tuple(types)) for name, types in KNOWN_FUZZY_MISSES}
+    assert known <= {_key(case) for case in mapping_baseline["cases"]}
+    cases = [case for case in mapping_baseline["cases"] if _key(case) not in known]
+    assert len(cases) > 3000
+    assert _mismatches(cases) == []
+
+
+@pytest.mark.xfail(strict=True, reason="trigram shortlist misses what difflib matched")
+@pytest.mark.parametrize("name,types", KNOWN_FUZZY_MISSES)
+def test_known_fuzzy_misses(mapping_baseline, name, types):
+    cases = [case for case in mapping_baseline["cases"] if _key(case) == (name, tuple(types))]
+    assert _mismatches(cases) == []
+
+
+def test_difflib_matcher_matches_baseline(mapping_baseline, difflib_matcher):
+    assert _mismatches(mapping_baseline["cases"]) == []
@@ -0,0 +1,139 @@
+"""diff_matrices / apply_diff round trips."""
+
+import json
+from typing import List, Optional
+
+import numpy as np
+import pytest
+
+from map_to_category import known_categories
+from matrix_diff import MatrixDiff, apply_diff, diff_matrices
+from ranking import USER_CARDS, RankingCache, get_best_cards_for_category
+from rewards_matrix import RewardsMatrix
+
+
+def _variant(
+    matrix: RewardsMatrix,
+    card_names: Optional[List[str]] = None,
+    columns: Optional[List[str]] = None,
+    cells: Optional[dict] = None,
+) -> RewardsMatrix:
+    """A new matrix with the given card and column order and changed cells."""
+    card_names = card_names if card_names is not None else list(matrix.card_names)
+    columns = columns if columns is not None else list(matrix.columns)
+    rates = np.zeros((len(card_names), len(columns)))
+    for i, name in enumerate(card_names):
+        row = matrix.row_for(name)
+        for j, col in enumerate(columns):
+            old_j = matrix.column_index.get(col)
+            if row is not None and old_j is not None:
+                rates[i, j] = matrix.rates[row, old_j]
+    for (name, col), rate in (cells or {}).items():
+        rates[card_names.index(name), columns.index(col)] = rate
+    return RewardsMatrix(card_names, columns, rates)
+
+
+def _user_card_cell(matrix: RewardsMatrix):
+    row = matrix.row_for(USER_CARDS[0])
+    j = int(np.flatnonzero(matrix.rates[row])[0])
+    return USER_CARDS[0], matrix.columns[j], float(matrix.rates[row, j])
+
+
+def _assert_same(patched: RewardsMatrix, new: RewardsMatrix) -> None:
+    assert patched.content_hash == new.content_hash
+    assert patched.card_names == new.card_names
+    assert patched.columns == new.columns
+    assert np.array_equal(patched.rates, new.rates)
+
+
+def test_empty_diff(matrix):
+    assert diff_matrices(matrix, matrix.copy()).is_empty
+
+
+def test_cell_changes_round_trip(matrix):
+    card, col, rate = _user_card_cell(matrix)
+    other = matrix.card_names[-1]
+    new = _variant(matrix, cells={(card, col): rate + 1, (other, matrix.columns[0]): 7.0})
+    diff = diff_matrices(matrix, new)
+    assert not diff.reshaped
+    assert diff.cells[card][col] == (rate, rate + 1)
+
+    version = matrix.version
+    result = apply_diff(matrix, diff)
+    assert result.version == version + 1
+    assert result.cells_changed == 2
+    _assert_same(matrix, new)
+
+
+def test_reshaping_round_trip(matrix):
+    names = list(matrix.card_names)
+    columns = list(matrix.columns)
+    card_names = names[1:10] + ["New Card"] + names[10:]
+    new_columns = [c for c in columns if c != columns[3]] + ["New Column"]
+    new = _variant(
+        matrix,
+        card_names=card_names,
+        columns=new_columns,
+        cells={("New Card", "New Column"): 3.0, (names[20], "New Column"): 2.0},
+    )
+    diff = diff_matrices(matrix, new)
+    assert diff.cards_removed == [names[0]]
+    assert list(diff.cards_added) == ["New Card"]
+    assert diff.columns_added == ["New Column"]
+    assert diff.columns_removed == [columns[3]]
+    assert diff.reshaped
+
+    apply_diff(matrix, diff)
+    _assert_same(matrix, new)
+
+
+def test_reorder_round_trip(matrix):
+    names = list(matrix.card_names)
+    new = _variant(matrix, card_names=names[::-1], columns=list(matrix.columns)[::-1])
+    diff = diff_matrices(matrix, new)
+    assert diff.card_order is not None and diff.column_order is not None
+    apply_diff(matrix, diff)
+    _assert_same(matrix, new)
+
+
+def test_diff_survives_json(matrix):
+    card, col, rate = _user_card_cell(matrix)
+    new = _variant(matrix, card_names=list(matrix.card_names)[:-1], cells={(card, col): 0.0})
+    data = json.loads(json.dumps(diff_matrices(matrix, new).to_dict()))
+    apply_diff(matrix, MatrixDiff.from_dict(data))
+    _assert_same(matrix, new)
+
+
+def test_rejects_wrong_base(matrix):
+    card, col, rate = _user_card_cell(matrix)
+    first = _variant(matrix, cells={(card, col): rate + 1})
+    second = _variant(first, cells={(card, col): rate + 2})
+    diff = diff_matrices(first, second)
+
+    before = matrix.contents
+    with pytest.raises(ValueError):
+        apply_diff(matrix, diff)
+    assert matrix.contents is before
+
+    corrupt = diff._replace(result_hash="0" * len(diff.result_hash))
+    with pytest.raises(ValueError):
+        apply_diff(first, corrupt)
+
+
+def test_patch_invalidates_only_affected_rankings(matrix):
+    cache = RankingCache(matrix)
+    categories = known_categories()
+    for category in categories:
+        cache.get_best_cards_for_category(category, top_n=5)
+    cached = len(cache)
+
+    card, col, rate = _user_card_cell(matrix)
+    new = _variant(matrix, cells={(card, col): rate + 10})
+    result = apply_diff(matrix, diff_matrices(matrix, new))
+    assert 0 < result.invalidated < cached
+    assert len(cache) == cached - result.invalidated
+
+    for category in categories:
+        assert cache.get_best_cards_for_category(category, top_n=5) == (
+            get_best_cards_for_category(category, top_n=5, matrix=new)
+        )
@@ -0,0 +1,102 @@
+"""matrix_export full and diff-mode loads, checked through SQLite."""
+
+import sqlite3
+
+import numpy as np
+
+from matrix_export import diff_cells, format_multiplier, iter_cells, load_sqlite, main, write_upserts
+from matrix_snapshot import write_snapshot
+from rewards_matrix import RewardsMatrix
+
+
+def _next_version(matrix: RewardsMatrix) -> RewardsMatrix:
+    """Drops a card and a column, adds both, and changes and zeroes some cells."""
+    rates = np.array(matrix.rates)
+    card_names = list(matrix.card_names)
+    columns = list(matrix.columns)
+    rows, cols = np.nonzero(rates)
+    rates[rows[0], cols[0]] += 1
+    rates[rows[-1], cols[-1]] = 0
+    rates[5, 7] = 2.5
+    rates = np.delete(np.delete(rates, 2, axis=0), 4, axis=1)
+    del card_names[2], columns[4]
+    rates = np.vstack([rates, np.zeros((1, rates.shape[1]))])
+    rates = np.hstack([rates, np.zeros((rates.shape[0], 1))])
+    rates[-1, -1] = 4.0
+    rates[0, -1] = 1.5
+    return RewardsMatrix(card_names + ["New Card"], columns + ["New Column"], rates)
+
+
+def _rows(db_path: str, table: str = "card_reward_matrix") -> set:
+    db = sqlite3.connect(db_path)
+    try:
+        return {
+            (card, category, float(rate))
+            for card, category, rate in db.execute(
+                f"SELECT card_name, category_name, multiplier FROM {table}"
+            )
+        }
+    finally:
+        db.close()
+
+
+def test_full_load_matches_cells(matrix, tmp_path):
+    db_path = str(tmp_path / "m.db")
+    counts = load_sqlite(db_path, iter_cells(matrix))
+    expected = set(iter_cells(matrix))
+    assert counts.upserted == len(expected)
+    assert _rows(db_path) == expected
+
+
+def test_diff_load_round_trip(matrix, tmp_path):
+    new = _next_version(matrix)
+    incremental, full = str(tmp_path / "incremental.db"), str(tmp_path / "full.db")
+    load_sqlite(incremental, iter_cells(matrix))
+    cells, deletes = diff_cells(matrix, new)
+    counts = load_sqlite(incremental, cells, deletes)
+    load_sqlite(full, iter_cells(new))
+
+    assert _rows(incremental) == _rows(full) == set(iter_cells(new))
+    assert counts.upserted == len(cells) < len(list(iter_cells(new)))
+    assert counts.deleted > 0
+
+
+def test_prune_removes_rows_not_in_matrix(matrix, tmp_path):
+    new = _next_version(matrix)
+    db_path = str(tmp_path / "m.db")
+    load_sqlite(db_path, iter_cells(matrix))
+    load_sqlite(db_path, iter_cells(new), prune=True)
+    assert _rows(db_path) == set(iter_cells(new))
+
+
+def test_cli_diff_mode_honours_table(matrix, tmp_path):
+    old_path, new_path = str(tmp_path / "old.cgrm"), str(tmp_path / "new.cgrm")
+    new = _next_version(matrix)
+    write_snapshot(matrix, old_path, ranking_tables=False)
+    write_snapshot(new, new_path, ranking_tables=False)
+    db_path = str(tmp_path / "m.db")
+
+    assert main([old_path, "--sqlite", db_path, "--table", "public.rates"]) == 0
+    assert main([new_path, "--base", old_path, "--sqlite", db_path, "--table", "rates"]) == 0
+    assert _rows(db_path, "rates") == set(iter_cells(new))
+    db = sqlite3.connect(db_path)
+    try:
+        tables = {name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        db.close()
+    assert tables == {"rates"}
+
+
+def test_upsert_script_deletes_before_upserting(matrix, tmp_path):
+    cells, deletes = diff_cells(matrix, _next_version(matrix))
+    path = tmp_path / "changes.sql"
+    with open(path, "w", encoding="utf-8") as out:
+        counts = write_upserts(cells, out, deletes, table="public.rates")
+    sql = path.read_text(encoding="utf-8")
+    assert counts.deleted == len(deletes)
+    assert sql.index("DELETE FROM public.rates") < sql.index("INSERT INTO public.rates")
+
+
+def test_format_multiplier():
+    assert format_multiplier(3.0) == "3"
+    assert format_multiplier(1.5) == "1.5"
@@ -0,0 +1,60 @@
+"""Snapshot write/read round trips."""
+
+import os
+import stat
+
+import numpy as np
+import pytest
+
+from matrix_snapshot import build_snapshot, file_sha256, is_snapshot, read_header, write_snapshot
+from rewards_matrix import RewardsMatrix, content_hash
+
+
+@pytest.mark.parametrize("ranking_tables", [True, False])
+def test_snapshot_round_trip(matrix, tmp_path, ranking_tables):
+    path = str(tmp_path / "matrix.cgrm")
+    write_snapshot(matrix, path, ranking_tables=ranking_tables)
+    assert is_snapshot(path)
+
+    loaded = RewardsMatrix.from_file(path)
+    assert loaded.card_names == matrix.card_names
+    assert loaded.columns == matrix.columns
+    assert np.array_equal(loaded.rates, matrix.rates)
+    assert loaded.content_hash == matrix.content_hash
+    # The stored hash is the content's, not just copied through
+    assert content_hash(loaded.card_names, loaded.columns, loaded.sparse) == matrix.content_hash
+    assert not loaded.sparse.data.flags.writeable
+
+    header, _, shape = read_header(path)
+    assert shape == matrix.shape
+    assert ("ranking_tables" in header) == ranking_tables
+
+
+def test_snapshot_rewrite_is_stable(matrix, tmp_path):
+    first, second = str(tmp_path / "a.cgrm"), str(tmp_path / "b.cgrm")
+    write_snapshot(matrix, first)
+    write_snapshot(RewardsMatrix.from_file(first), second)
+    assert file_sha256(first) == file_sha256(second)
+
+
+def test_build_snapshot_records_source(matrix_csv, tmp_path):
+    out = build_snapshot(matrix_csv, str(tmp_path / "matrix.cgrm"))
+    header, _, _ = read_header(out)
+    assert header["source_sha256"] == file_sha256(matrix_csv)
+
+
+def test_rewrite_keeps_file_mode(matrix, tmp_path):
+    path = str(tmp_path / "matrix.cgrm")
+    write_snapshot(matrix, path, ranking_tables=False)
+    os.chmod(path, 0o640)
+    write_snapshot(matrix, path, ranking_tables=False)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["matrix.cgrm"]
+
+
+def test_read_header_rejects_other_files(tmp_path):
+    path = tmp_path / "matrix.csv"
+    path.write_bytes(b"Card Name,AAA\nCard,1%\n" * 4)
+    assert not is_snapshot(str(path))
+    with pytest.raises(ValueError):
+        read_header(str(path))
@@ -0,0 +1,304 @@
+"""
+Spend-weighted wallet optimizer.
+
+get_best_cards_for_category answers "which card earns the most on this
+category", ignoring that many matrix columns only pay their rate up to an
+annual spend cap ("Everywhere (up to $50k spend/yr)"). Given a user's annual
+spend per category, this module splits that spend across the wallet so total
+rewards are maximized while honoring those caps.
+
+Model:
+- A category can earn on any column that get_best_cards_for_category would
+  consider for it (matched columns, or the fallback columns when none match).
+- Uncapped columns have unlimited capacity, so each category has a best
+  uncapped rate (over all wallet cards) that any leftover spend earns.
+- Each (card, capped column) pair is a pool of cap dollars shared by every
+  category that matches the column. Spend moved into a pool gains
+  (pool rate - category's best uncapped rate) per dollar.
+
+The default solver fills pools greedily by that per-dollar gain, which is
+exact whenever pools don't compete for the same categories and a close
+approximation otherwise. solver="lp" solves the same model exactly with
+scipy's linprog when scipy is installed.
+
+Usage:
+    python wallet_optimizer.py spend.json [--wallet "Card A,Card B"] [--solver lp]
+
+where spend.json maps category names to annual dollars.
+"""
+
+import argparse
+import json
+import re
+import sys
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rewards_matrix import RewardsMatrix, load_matrix
+
+# "up to $50k spend/yr", "up to $2M spend/yr", "up to $6,000 spend/yr"
+_CAP_RE = re.compile(r"up to \$\s*([\d,]+(?:\.\d+)?)\s*([kKmM]?)", re.IGNORECASE)
+_CAP_MULTIPLIERS = {"": 1.0, "k": 1e3, "m": 1e6}
+
+
+def parse_cap(column: str) -> Optional[float]:
+    """
+    Annual spend cap encoded in a column name, in dollars.
+
+    Returns:
+        Cap amount, or None for uncapped columns
+    """
+    match = _CAP_RE.search(column)
+    if match is None:
+        return None
+    amount = float(match.group(1).replace(",", ""))
+    return amount * _CAP_MULTIPLIERS[match.group(2).lower()]
+
+
+class Allocation(NamedTuple):
+    """Spend from one category routed to one card/column (None: no card earns on it)."""
+
+    category: str
+    card: Optional[str]
+    column: Optional[str]
+    spend: float
+    rate: float
+
+    @property
+    def rewards(self) -> float:
+        return self.spend * self.rate / 100
+
+
+class WalletPlan(NamedTuple):
+    """Result of optimize_wallet."""
+
+    allocations: List[Allocation]
+    total_spend: float
+    total_rewards: float
+    # What the per-category best rates would promise if caps didn't exist
+    uncapped_estimate: float
+
+    def by_category(self) -> Dict[str, List[Allocation]]:
+        out: Dict[str, List[Allocation]] = {}
+        for allocation in self.allocations:
+            out.setdefault(allocation.category, []).append(allocation)
+        return out
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_spend": round(self.total_spend, 2),
+            "total_rewards": round(self.total_rewards, 2),
+            "uncapped_estimate": round(self.uncapped_estimate, 2),
+            "allocations": [
+                {
+                    "category": a.category,
+                    "card": a.card,
+                    "column": a.column,
+                    "spend": round(a.spend, 2),
+                    "rate": a.rate,
+                    "rewards": round(a.rewards, 2),
+                }
+                for a in self.allocations
+            ],
+        }
+
+
+@lru_cache(maxsize=8)
+def _column_caps(columns: Tuple[str, ...]) -> np.ndarray:
+    """Cap per matrix column (inf when uncapped)."""
+    caps = np.array([parse_cap(col) or np.inf for col in columns], dtype=np.float64)
+    caps.setflags(write=False)
+    return caps
+
+
+def optimize_wallet(
+    spend: Dict[str, float],
+    wallet: Optional[Sequence[str]] = None,
+    matrix: Optional[RewardsMatrix] = None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    solver: str = "greedy",
+) -> WalletPlan:
+    """
+    Splits annual spend across a wallet to maximize rewards under caps.
+
+    Args:
+        spend: Annual dollars per category (any name map_place_to_category returns)
+        wallet: Cards to use (uses USER_CARDS if None); unknown cards are ignored
+        matrix: Optional preloaded RewardsMatrix to use instead of matrix_csv_path
+        matrix_csv_path: Path to rewards matrix CSV (ignored when matrix is given)
+        solver: "greedy" (default) or "lp" (requires scipy)
+
+    Returns:
+        WalletPlan with per-category allocations in spend order
+    """
+    if solver not in ("greedy", "lp"):
+        raise ValueError(f"Unknown solver {solver!r}; use 'greedy' or 'lp'.")
+    if matrix is None:
+        matrix = load_matrix(matrix_csv_path)
+    else:
+        matrix.refresh()
+    matrix = matrix.contents
+    if wallet is None:
+        from ranking import USER_CARDS
+
+        wallet = USER_CARDS
+
+    rows: List[int] = []
+    cards: List[str] = []
+    for name in wallet:
+        row = matrix.row_for_lower(name.lower())
+        if row is not None and row not in rows:
+            rows.append(row)
+            cards.append(matrix.card_names[row])
+
+    categories = [c for c, amount in spend.items() if amount > 0]
+    amounts = np.array([float(spend[c]) for c in categories], dtype=np.float64)
+    if not categories:
+        return WalletPlan([], 0.0, 0.0, 0.0)
+    if not rows:
+        return WalletPlan([], float(amounts.sum()), 0.0, 0.0)
+
+    rates = matrix.sparse.dense_rows(rows)  # wallet cards × columns
+    caps = _column_caps(tuple(matrix.columns))
+    index = matrix.category_index
+
+    # Per category: best uncapped option, and capped pools that beat it
+    base_rate = np.zeros(len(categories))
+    base_choice: List[Tuple[int, Optional[int]]] = []
+    best_any = np.zeros(len(categories))
+    edges: List[Tuple[int, Tuple[int, int], float, float]] = []  # (cat, pool, rate, gain)
+    for c, category in enumerate(categories):
+        columns = sorted(index.columns_for_category(category)) or list(index.fallback_columns)
+        if not columns:
+            base_choice.append((0, None))
+            continue
+        cols = np.asarray(columns)
+        sub = rates[:, cols]
+        capped = np.isfinite(caps[cols])
+        best_any[c] = sub.max()
+
+        uncapped = np.where(capped[None, :], -np.inf, sub)
+        if (~capped).any():
+            flat = int(np.argmax(uncapped))
+            k, j = divmod(flat, len(cols))
+            if uncapped[k, j] > 0:
+                base_rate[c] = uncapped[k, j]
+                base_choice.append((k, int(cols[j])))
+            else:
+                base_choice.append((0, None))
+        else:
+            base_choice.append((0, None))
+
+        for j in np.flatnonzero(capped):
+            for k in np.flatnonzero(sub[:, j] > base_rate[c]):
+                rate = float(sub[k, j])
+                edges.append((c, (int(k), int(cols[j])), rate, rate - base_rate[c]))
+
+    if solver == "lp" and edges:
+        flows = _solve_lp(edges, amounts, caps)
+    else:
+        flows = _solve_greedy(edges, amounts, caps)
+
+    allocations: List[Allocation] = []
+    remaining = amounts.copy()
+    per_category: Dict[int, List[Allocation]] = {}
+    for (c, (k, col), rate, _), flow in zip(edges, flows):
+        if flow > 1e-9:
+            remaining[c] -= flow
+            per_category.setdefault(c, []).append(
+                Allocation(categories[c], cards[k], matrix.columns[col], float(flow), rate)
+            )
+    for c, category in enumerate(categories):
+        chosen = sorted(per_category.get(c, []), key=lambda a: a.rate, reverse=True)
+        allocations.extend(chosen)
+        if remaining[c] > 1e-9:
+            k, col = base_choice[c]
+            # Nothing in the wallet earns here; leave the spend unattributed
+            allocations.append(Allocation(
+                category,
+                cards[k] if col is not None else None,
+                matrix.columns[col] if col is not None else None,
+                float(remaining[c]),
+                float(base_rate[c]),
+            ))
+
+    total_rewards = sum(a.rewards for a in allocations)
+    return WalletPlan(
+        allocations,
+        float(amounts.sum()),
+        float(total_rewards),
+        float((amounts * best_any).sum() / 100),
+    )
+
+
+def _solve_greedy(edges, amounts: np.ndarray, caps: np.ndarray) -> List[float]:
+    """Fills the highest per-dollar gain first, respecting demand and pool caps."""
+    demand = amounts.copy()
+    pool_left: Dict[Tuple[int, int], float] = {}
+    flows = [0.0] * len(edges)
+    # Ties break toward earlier categories, then wallet order, then column order
+    order = sorted(range(len(edges)), key=lambda e: (-edges[e][3], edges[e][0], edges[e][1]))
+    for e in order:
+        c, pool, _, _ = edges[e]
+        if demand[c] <= 0:
+            continue
+        left = pool_left.get(pool, caps[pool[1]])
+        if left <= 0:
+            continue
+        flow = min(demand[c], left)
+        flows[e] = flow
+        demand[c] -= flow
+        pool_left[pool] = left - flow
+    return flows
+
+
+def _solve_lp(edges, amounts: np.ndarray, caps: np.ndarray) -> List[float]:
+    """Exact allocation with scipy's linprog (HiGHS)."""
+    try:
+        from scipy.optimize import linprog
+    except ImportError as exc:
+        raise RuntimeError("solver='lp' requires scipy (pip install scipy).") from exc
+
+    pools = sorted({pool for _, pool, _, _ in edges})
+    pool_index = {pool: i for i, pool in enumerate(pools)}
+    n_edges = len(edges)
+    categories = sorted({c for c, _, _, _ in edges})
+    cat_index = {c: i for i, c in enumerate(categories)}
+
+    a_ub = np.zeros((len(categories) + len(pools), n_edges))
+    for e, (c, pool, _, _) in enumerate(edges):
+        a_ub[cat_index[c], e] = 1.0
+        a_ub[len(categories) + pool_index[pool], e] = 1.0
+    b_ub = np.concatenate([
+        amounts[categories],
+        [caps[pool[1]] for pool in pools],
+    ])
+    gains = np.array([gain for _, _, _, gain in edges])
+    result = linprog(-gains, A_ub=a_ub, b_ub=b_ub, bounds=(0, None), method="highs")
+    if not result.success:
+        raise RuntimeError(f"linprog failed: {result.message}")
+    return result.x.tolist()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Split annual spend across a wallet.")
+    parser.add_argument("spend", help="JSON file mapping category to annual dollars")
+    parser.add_argument("--wallet", help="comma-separated card names (defaults to USER_CARDS)")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv")
+    parser.add_argument("--solver", choices=("greedy", "lp"), default="greedy")
+    args = parser.parse_args(argv)
+
+    with open(args.spend, encoding="utf-8") as f:
+        spend = json.load(f)
+    wallet = [c.strip() for c in args.wallet.split(",")] if args.wallet else None
+    plan = optimize_wallet(
+        spend, wallet, matrix=load_matrix(args.matrix), solver=args.solver
+    )
+    sys.stdout.write(json.dumps(plan.to_dict(), indent=2, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())